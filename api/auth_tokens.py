@@ -0,0 +1,205 @@
+"""
+Token di accesso firmati (stateless) e autorizzazione senza query.
+
+Al login viene emesso un token firmato con SECRET_KEY (itsdangerous,
+HMAC-SHA1 + timestamp) che contiene:
+  sub  id utente
+  role ruolo (admin / operator / client)
+  tid  tenant, cioè l'admin a cui appartiene l'utente (per un admin, sé stesso)
+  jti  id casuale del token, usato per la revoca (logout)
+
+TokenAuth.admin_required verifica firma, scadenza e ruolo senza toccare
+il DB. L'unica lettura possibile è la revoca: l'esito viene tenuto in una
+piccola LRU con scadenza (RevocationCache), quindi per ogni token si
+interroga revoked_tokens al più una volta ogni 'cache_ttl' secondi.
+
+Il modulo importa solo flask e itsdangerous: l'app Flask-SQLAlchemy lo
+usa tramite app/services/tokens.py (stesso formato, stessa cache delle
+revoche, stesso admin_required).
+
+Finché il frontend non invia il token, le richieste senza Authorization
+possono essere autorizzate con il vecchio controllo sull'admin_id
+(legacy_admin_check, una query): è disattivato salvo AUTH_LEGACY_ADMIN_ID=1.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+TOKEN_SALT = "access-token"
+
+
+class TokenError(Exception):
+    """Token mancante, non valido, scaduto o revocato."""
+
+
+class RevocationCache:
+    """LRU jti -> revocato (bool), con scadenza delle voci."""
+
+    def __init__(self, max_size=4096, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, jti):
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(jti)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, jti, revoked, ttl=None):
+        with self._lock:
+            self._entries[jti] = (revoked, time.monotonic() + (ttl or self.ttl))
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class TokenService:
+    """Emissione e verifica dei token. 'is_revoked(jti)' legge lo store delle revoche."""
+
+    def __init__(self, secret, ttl=12 * 3600, is_revoked=None, cache_size=4096, cache_ttl=60):
+        self.ttl = ttl
+        self.is_revoked = is_revoked
+        self.revocations = RevocationCache(cache_size, cache_ttl)
+        self._serializer = URLSafeTimedSerializer(secret, salt=TOKEN_SALT)
+
+    def issue(self, user_id, role, tenant_id):
+        return self._serializer.dumps({
+            "sub": user_id,
+            "role": role,
+            "tid": tenant_id,
+            "jti": secrets.token_hex(8)
+        })
+
+    def decode(self, token):
+        """Verifica firma e scadenza (nessun accesso al DB)."""
+        try:
+            return self._serializer.loads(token, max_age=self.ttl)
+        except SignatureExpired:
+            raise TokenError("Token scaduto")
+        except BadSignature:
+            raise TokenError("Token non valido")
+
+    def verify(self, token):
+        claims = self.decode(token)
+        if self.is_revoked is not None:
+            revoked = self.revocations.get(claims["jti"])
+            if revoked is None:
+                revoked = bool(self.is_revoked(claims["jti"]))
+                self.revocations.put(claims["jti"], revoked)
+            if revoked:
+                raise TokenError("Token revocato")
+        return claims
+
+    def mark_revoked(self, jti):
+        """Aggiorna subito la cache locale dopo una revoca (valida fino alla scadenza del token)."""
+        self.revocations.put(jti, True, ttl=self.ttl)
+
+
+def tenant_of(user):
+    """Tenant di un utente: l'admin stesso o l'admin a cui appartiene."""
+    return user["id"] if user["role"] == "admin" else user["admin_id"]
+
+
+def bearer_token():
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[7:].strip() or None
+    return None
+
+
+def requested_admin_id(view_kwargs):
+    """admin_id richiesto: dall'URL, dal JSON o dalla query string."""
+    value = view_kwargs.get("admin_id")
+    if value is None:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            value = data.get("admin_id")
+    if value is None:
+        value = request.args.get("admin_id")
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenAuth:
+    """Decoratori di autorizzazione basati su TokenService."""
+
+    def __init__(self, service, legacy_admin_check=None):
+        self.service = service
+        self.legacy_admin_check = legacy_admin_check
+
+    def current_claims(self):
+        """Claims del token della richiesta (None se assente); TokenError se non valido."""
+        token = bearer_token()
+        return self.service.verify(token) if token else None
+
+    def admin_required(self, view):
+        """
+        Consente l'accesso solo a un admin. Con il token, l'admin_id
+        eventualmente indicato nella richiesta deve coincidere con il
+        tenant del token. In g.admin_id resta l'admin autorizzato.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            wanted = requested_admin_id(kwargs)
+            try:
+                claims = self.current_claims()
+            except TokenError as e:
+                return jsonify({"error": str(e)}), 401
+
+            if claims is not None:
+                if claims["role"] != "admin" or (wanted is not None and wanted != claims["tid"]):
+                    return jsonify({"error": "Non autorizzato"}), 403
+                g.token = claims
+                g.admin_id = claims["tid"]
+            elif self.legacy_admin_check is not None:
+                if wanted is None or not self.legacy_admin_check(wanted):
+                    return jsonify({"error": "Non autorizzato"}), 403
+                g.token = None
+                g.admin_id = wanted
+            else:
+                return jsonify({"error": "Token mancante"}), 401
+            return view(*args, **kwargs)
+        return wrapper
+
+    def debug_required(self, enabled):
+        """
+        Per /metrics e /api/debug/*: 404 finché enabled() è falso
+        (DEBUG_ENDPOINTS, spento di default), poi solo con il token di un
+        admin, mai con il controllo legacy. Prometheus invia il token con
+        bearer_token / authorization nella configurazione dello scrape.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not enabled():
+                    return jsonify({"error": "Non trovato"}), 404
+                try:
+                    claims = self.current_claims()
+                except TokenError as e:
+                    return jsonify({"error": str(e)}), 401
+                if claims is None:
+                    return jsonify({"error": "Token mancante"}), 401
+                if claims["role"] != "admin":
+                    return jsonify({"error": "Non autorizzato"}), 403
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,236 @@
+"""
+Prenotazione atomica degli appuntamenti (niente doppie prenotazioni).
+
+Il controllo di sovrapposizione e l'INSERT avvengono nella stessa
+transazione, dopo aver bloccato con SELECT ... FOR UPDATE la riga
+dell'operatore in users: due richieste concorrenti per lo stesso
+operatore vengono serializzate (la seconda vede l'appuntamento della
+prima e riceve un conflitto), mentre quelle per operatori diversi non si
+attendono. La transazione dura cinque query brevi, quindi il lock viene
+tenuto per pochi millisecondi anche durante i picchi.
+
+La query di sovrapposizione (appuntamenti e prenotazioni temporanee
+attive, vedi api/holds.py) usa l'indice (operator_id, start_time) con
+un intervallo limitato: basta guardare gli appuntamenti iniziati da al
+massimo la loro durata massima prima del nuovo. I nuovi appuntamenti e
+le hold non possono durare più di 'max_duration', ma righe storiche o
+riattivate possono essere più lunghe: per gli appuntamenti il limite è
+quindi la durata massima registrata per l'operatore (appointment_spans,
+mantenuta dai trigger di migrations/012), se maggiore. Gli appuntamenti
+annullati non occupano l'operatore.
+
+Deadlock e lock wait timeout (1213 / 1205) vengono ritentati fino a
+'retries' volte con una breve attesa casuale.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+
+RETRYABLE_ERRORS = {1205, 1213}
+
+
+class BookingError(Exception):
+    """Richiesta di prenotazione non valida; 'status' è il codice HTTP da restituire."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class BookingConflict(BookingError):
+    """
+    L'orario è occupato: da un appuntamento (conflict_id = suo id) o da
+    una prenotazione temporanea di un altro cliente (conflict_id = None,
+    l'id della hold non viene rivelato).
+    """
+
+    def __init__(self, conflict_id=None, kind="appointment"):
+        message = ("L'operatore ha già un appuntamento in questo orario" if kind == "appointment"
+                   else "Orario riservato temporaneamente da un altro cliente")
+        super().__init__(message, status=409)
+        self.conflict_id = conflict_id
+        self.kind = kind
+
+
+def parse_interval(start, end, max_duration):
+    """Converte e valida [start, end): datetime o stringhe ISO."""
+    try:
+        start = start if isinstance(start, datetime) else datetime.fromisoformat(str(start))
+        end = end if isinstance(end, datetime) else datetime.fromisoformat(str(end))
+    except ValueError:
+        raise BookingError("Formato data/ora non valido")
+    if end <= start:
+        raise BookingError("L'orario di fine deve essere successivo all'inizio")
+    if end - start > max_duration:
+        raise BookingError(f"Durata massima di un appuntamento: {max_duration}")
+    return start, end
+
+
+class BookingEngine:
+    """Prenotazioni e spostamenti con controllo di sovrapposizione sotto lock dell'operatore."""
+
+    def __init__(self, max_duration=timedelta(hours=12), retries=3):
+        self.max_duration = max_duration
+        self.retries = retries
+        self.booked = 0
+        self.conflicts = 0
+        self.retried = 0
+
+    # -------------------------------------------------------------
+    #  Primitive (da usare dentro una transazione aperta)
+    # -------------------------------------------------------------
+    @staticmethod
+    def lock_operator(cursor, operator_id):
+        """Blocca la riga dell'operatore fino al commit; None se non è un operatore."""
+        cursor.execute("""
+            SELECT id, admin_id FROM users
+            WHERE id = %s AND role = 'operator'
+            FOR UPDATE
+        """, (operator_id,))
+        return cursor.fetchone()
+
+    def lookback(self, cursor, *operator_ids):
+        """
+        Durata massima di un appuntamento degli operatori indicati
+        (appointment_spans), mai meno di max_duration: fin dove guardare
+        indietro su start_time per trovare tutto ciò che li occupa.
+        """
+        cursor.execute(f"""
+            SELECT MAX(max_minutes) AS max_minutes FROM appointment_spans
+            WHERE operator_id IN ({', '.join(['%s'] * len(operator_ids))})
+        """, operator_ids)
+        row = cursor.fetchone()
+        minutes = (row["max_minutes"] if isinstance(row, dict) else row[0]) if row else 0
+        return max(self.max_duration, timedelta(minutes=minutes or 0))
+
+    def find_conflict(self, cursor, operator_id, start, end, exclude_id=None):
+        """
+        Cosa occupa già [start, end): ("appointment", id) per un
+        appuntamento non annullato, ("hold", None) per una prenotazione
+        temporanea attiva (vedi api/holds.py), altrimenti None.
+        """
+        exclude = " AND id <> %s" if exclude_id is not None else ""
+        params = [operator_id, end, start - self.lookback(cursor, operator_id), start]
+        if exclude_id is not None:
+            params.append(exclude_id)
+        params += [operator_id, end, start - self.max_duration, start]
+        cursor.execute(f"""
+            (SELECT 'appointment' AS kind, id FROM appointments
+             WHERE operator_id = %s
+               AND start_time < %s AND start_time > %s
+               AND end_time > %s
+               AND status <> 'cancelled'{exclude}
+             LIMIT 1)
+            UNION ALL
+            (SELECT 'hold' AS kind, NULL FROM slot_holds
+             WHERE operator_id = %s
+               AND start_time < %s AND start_time > %s
+               AND end_time > %s
+               AND expires_at > NOW()
+             LIMIT 1)
+            LIMIT 1
+        """, tuple(params))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return (row["kind"], row["id"]) if isinstance(row, dict) else (row[0], row[1])
+
+    # -------------------------------------------------------------
+    #  Operazioni complete (gestiscono la transazione)
+    # -------------------------------------------------------------
+    def book(self, conn, operator_id, client_id, start, end, service_type="", admin_id=None,
+             on_booked=None):
+        """
+        Crea l'appuntamento se l'operatore è libero. Restituisce
+        {'id', 'start_time', 'end_time', 'client_phone', 'admin_id'} (admin
+        dell'operatore); BookingError / BookingConflict altrimenti.
+        on_booked(cursor, risultato), se indicato, viene eseguito nella
+        stessa transazione prima del commit (es. eventi di modifica).
+        """
+        start, end = parse_interval(start, end, self.max_duration)
+
+        def attempt(cursor):
+            operator = self.lock_operator(cursor, operator_id)
+            if operator is None or (admin_id is not None and operator["admin_id"] != admin_id):
+                raise BookingError("Operatore non valido")
+            cursor.execute("SELECT id, phone FROM users WHERE id = %s AND role = 'client'", (client_id,))
+            client = cursor.fetchone()
+            if client is None:
+                raise BookingError("Cliente non valido")
+
+            conflict = self.find_conflict(cursor, operator_id, start, end)
+            if conflict is not None:
+                raise BookingConflict(conflict[1], kind=conflict[0])
+
+            cursor.execute("""
+                INSERT INTO appointments (operator_id, client_id, start_time,
+                                          end_time, service_type, created_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+            """, (operator_id, client_id, start, end, service_type or ""))
+            booked = {"id": cursor.lastrowid, "start_time": start, "end_time": end,
+                      "client_phone": client["phone"], "admin_id": operator["admin_id"]}
+            if on_booked is not None:
+                on_booked(cursor, booked)
+            return booked
+
+        result = self.transaction(conn, attempt)
+        self.booked += 1
+        return result
+
+    def check_reschedule(self, cursor, appointment, start=None, end=None, status=None):
+        """
+        Per un aggiornamento dentro una transazione aperta: se l'appuntamento
+        viene spostato o riattivato, blocca l'operatore e verifica il nuovo
+        intervallo (quello attuale dove non indicato). 'appointment' è la riga corrente (operator_id,
+        start_time, end_time, status). Restituisce (start, end).
+
+        Formato e durata massima si controllano solo se start o end
+        cambiano: un cambio di stato non deve fallire per un appuntamento
+        esistente più lungo di max_duration.
+        """
+        reactivated = appointment["status"] == "cancelled" and status not in (None, "cancelled")
+        moved = start is not None or end is not None
+        if moved:
+            start, end = parse_interval(start or appointment["start_time"],
+                                        end or appointment["end_time"], self.max_duration)
+        else:
+            start, end = appointment["start_time"], appointment["end_time"]
+        # Solo uno spostamento o una riattivazione possono creare una sovrapposizione
+        if (status or appointment["status"]) == "cancelled" or not (moved or reactivated):
+            return start, end
+        self.lock_operator(cursor, appointment["operator_id"])
+        conflict = self.find_conflict(cursor, appointment["operator_id"], start, end,
+                                      exclude_id=appointment["id"])
+        if conflict is not None:
+            self.conflicts += 1
+            raise BookingConflict(conflict[1], kind=conflict[0])
+        return start, end
+
+    def transaction(self, conn, attempt):
+        """
+        Esegue attempt(cursor) e fa commit; rollback su errore. Deadlock e
+        lock wait timeout vengono ritentati.
+        """
+        for n in range(self.retries + 1):
+            try:
+                with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                    result = attempt(cursor)
+                conn.commit()
+                return result
+            except BookingError as e:
+                conn.rollback()
+                if isinstance(e, BookingConflict):
+                    self.conflicts += 1
+                raise
+            except pymysql.err.OperationalError as e:
+                conn.rollback()
+                if e.args[0] not in RETRYABLE_ERRORS or n == self.retries:
+                    raise
+                self.retried += 1
+                time.sleep(random.uniform(0.005, 0.02) * (n + 1))
+
+    def stats(self):
+        return {"booked": self.booked, "conflicts": self.conflicts, "retried": self.retried,
+                "max_duration_minutes": int(self.max_duration.total_seconds() // 60)}
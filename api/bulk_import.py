@@ -0,0 +1,407 @@
+"""
+Import massivo di operatori, clienti e appuntamenti (CSV o NDJSON).
+
+Il flusso è in tre fasi:
+  1. parsing e validazione di tutte le righe in un solo passaggio: campi
+     obbligatori, formati, duplicati dentro il file e contro il DB
+     (username/email con una query per blocco, non una per riga);
+     per gli appuntamenti, operatore/cliente dell'admin e sovrapposizioni
+     con gli appuntamenti esistenti e con le altre righe del file;
+  2. hashing delle password nel pool di processi condiviso (scrypt è
+     pesante e tiene occupata la CPU: nei thread non scalerebbe; vedi
+     api/passwords.py);
+  3. INSERT con executemany a blocchi di chunk_size righe, una
+     transazione per blocco. Se un blocco fallisce (es. duplicato inserito
+     nel frattempo da un'altra richiesta) viene ripetuto riga per riga,
+     così l'errore finisce sulla riga giusta del report. Gli appuntamenti
+     si inseriscono per operatore sotto il suo lock
+     (BookingEngine.lock_operator), dopo aver verificato nel DB
+     appuntamenti e prenotazioni temporanee attive con find_conflict,
+     come le prenotazioni singole: l'import non può sovrapporsi a una
+     prenotazione arrivata dopo la validazione.
+
+Il risultato è un report con lo stato di ogni riga (numero di riga del
+file, 'inserted' / 'valid' / 'error' ed eventuali errori).
+"""
+import csv
+import io
+import json
+import logging
+import re
+from datetime import datetime
+
+import pymysql
+
+from booking import BookingConflict, BookingEngine
+from passwords import get_hasher
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("operators", "clients", "appointments")
+FORMATS = ("csv", "ndjson")
+LOOKUP_CHUNK = 1000
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
+APPOINTMENT_STATUSES = ('pending', 'confirmed', 'completed', 'cancelled')
+
+
+class ImportFileError(ValueError):
+    """File non leggibile nel suo insieme (formato, intestazione, troppe righe)."""
+
+
+# -------------------------------------------------------------
+#  Parsing
+# -------------------------------------------------------------
+def parse_rows(text, fmt, max_rows):
+    """Restituisce [(numero_riga, dict)] dal contenuto CSV o NDJSON."""
+    rows = []
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ImportFileError("Intestazione CSV mancante")
+        for row in reader:
+            values = {k.strip(): (v.strip() if isinstance(v, str) else v)
+                      for k, v in row.items() if k}
+            if any(values.values()):
+                rows.append((reader.line_num, values))
+            if len(rows) > max_rows:
+                break
+    else:
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                value = json.loads(line)
+            except ValueError:
+                value = None
+            rows.append((line_no, value if isinstance(value, dict) else {"__invalid__": True}))
+            if len(rows) > max_rows:
+                break
+    if len(rows) > max_rows:
+        raise ImportFileError(f"Troppe righe (massimo {max_rows})")
+    return rows
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# -------------------------------------------------------------
+#  Validazione
+# -------------------------------------------------------------
+def _existing_users(cursor, usernames, emails):
+    """Username ed email già presenti nel DB (una query per blocco)."""
+    taken_usernames, taken_emails = set(), set()
+    for chunk in _chunks(sorted(usernames), LOOKUP_CHUNK):
+        cursor.execute(f"SELECT username FROM users WHERE username IN ({', '.join(['%s'] * len(chunk))})",
+                       tuple(chunk))
+        taken_usernames.update(row['username'] for row in cursor.fetchall())
+    for chunk in _chunks(sorted(emails), LOOKUP_CHUNK):
+        cursor.execute(f"SELECT email FROM users WHERE email IN ({', '.join(['%s'] * len(chunk))})",
+                       tuple(chunk))
+        taken_emails.update(row['email'] for row in cursor.fetchall())
+    return taken_usernames, taken_emails
+
+
+def validate_users(cursor, rows):
+    """Valida righe di operatori/clienti. Restituisce [(riga, dati, errori)]."""
+    usernames = {str(r.get("username", "")).strip() for _, r in rows if r.get("username")}
+    emails = {str(r.get("email", "")).strip() for _, r in rows if r.get("email")}
+    taken_usernames, taken_emails = _existing_users(cursor, usernames, emails)
+
+    seen_usernames, seen_emails = set(), set()
+    result = []
+    for line, row in rows:
+        errors = []
+        if row.get("__invalid__"):
+            result.append((line, None, ["Riga non valida (JSON oggetto atteso)"]))
+            continue
+        username = str(row.get("username") or "").strip()
+        email = str(row.get("email") or "").strip()
+        password = row.get("password") or ""
+        for field, value in (("username", username), ("email", email), ("password", password)):
+            if not value:
+                errors.append(f"Campo obbligatorio mancante: {field}")
+        if email and not EMAIL_RE.match(email):
+            errors.append("Email non valida")
+        if username in taken_usernames:
+            errors.append("Username già esistente")
+        elif username and username in seen_usernames:
+            errors.append("Username duplicato nel file")
+        if email in taken_emails:
+            errors.append("Email già esistente")
+        elif email and email in seen_emails:
+            errors.append("Email duplicata nel file")
+        seen_usernames.add(username)
+        seen_emails.add(email)
+
+        result.append((line, {
+            "username": username,
+            "email": email,
+            "password": str(password),
+            "phone": str(row.get("phone") or ""),
+            "specialization": str(row.get("specialization") or "")
+        }, errors))
+    return result
+
+
+def _parse_when(value):
+    return datetime.fromisoformat(str(value).strip().replace(" ", "T", 1))
+
+
+def validate_appointments(cursor, rows, admin_id, max_duration=None):
+    """
+    Valida righe di appuntamenti. Operatore e cliente possono essere
+    indicati per id (operator_id / client_id) o per username
+    (operator / client) e devono appartenere all'admin. Con max_duration
+    si rifiutano gli appuntamenti più lunghi, come nelle prenotazioni
+    singole: la ricerca delle sovrapposizioni (BookingEngine.find_conflict)
+    guarda solo gli appuntamenti iniziati da al massimo max_duration.
+    """
+    cursor.execute("""
+        SELECT id, username, role FROM users
+        WHERE admin_id = %s AND role IN ('operator', 'client')
+    """, (admin_id,))
+    by_id = {"operator": set(), "client": set()}
+    by_username = {"operator": {}, "client": {}}
+    for row in cursor.fetchall():
+        by_id[row['role']].add(row['id'])
+        by_username[row['role']][row['username']] = row['id']
+
+    def resolve(row, role):
+        label = "Operatore" if role == "operator" else "Cliente"
+        if row.get(f"{role}_id") not in (None, ""):
+            try:
+                person_id = int(row[f"{role}_id"])
+            except (TypeError, ValueError):
+                return None, f"{label} non valido"
+        elif row.get(role):
+            person_id = by_username[role].get(str(row[role]).strip())
+        else:
+            return None, f"Campo obbligatorio mancante: {role}_id"
+        if person_id not in by_id[role]:
+            return None, f"{label} non valido"
+        return person_id, None
+
+    parsed = []
+    for line, row in rows:
+        if row.get("__invalid__"):
+            parsed.append((line, None, ["Riga non valida (JSON oggetto atteso)"]))
+            continue
+        errors = []
+        operator_id, error = resolve(row, "operator")
+        if error:
+            errors.append(error)
+        client_id, error = resolve(row, "client")
+        if error:
+            errors.append(error)
+        start = end = None
+        try:
+            start = _parse_when(row["start_time"])
+            end = _parse_when(row["end_time"])
+            if end <= start:
+                errors.append("end_time deve essere successivo a start_time")
+            elif max_duration is not None and end - start > max_duration:
+                errors.append(f"Durata massima di un appuntamento: {max_duration}")
+        except (KeyError, ValueError):
+            errors.append("start_time / end_time mancanti o non validi (ISO 8601)")
+        status = str(row.get("status") or "pending")
+        if status not in APPOINTMENT_STATUSES:
+            errors.append("Stato non valido")
+        parsed.append((line, {
+            "operator_id": operator_id,
+            "client_id": client_id,
+            "start_time": start,
+            "end_time": end,
+            "service_type": str(row.get("service_type") or ""),
+            "status": status
+        }, errors))
+
+    # Sovrapposizioni per operatore: esistenti (una query) + righe del file
+    candidates = [data for _, data, errors in parsed if data and not errors]
+    busy = {}
+    if candidates:
+        operator_ids = sorted({data["operator_id"] for data in candidates})
+        cursor.execute(f"""
+            SELECT operator_id, start_time, end_time FROM appointments
+            WHERE operator_id IN ({', '.join(['%s'] * len(operator_ids))})
+              AND start_time < %s AND end_time > %s
+              AND status <> 'cancelled'
+        """, (*operator_ids,
+              max(data["end_time"] for data in candidates),
+              min(data["start_time"] for data in candidates)))
+        for row in cursor.fetchall():
+            busy.setdefault(row['operator_id'], []).append((row['start_time'], row['end_time'], None))
+
+    for line, data, errors in parsed:
+        if data and not errors and data["status"] != "cancelled":
+            busy.setdefault(data["operator_id"], []).append((data["start_time"], data["end_time"], line))
+    overlapping = set()
+    for intervals in busy.values():
+        intervals.sort(key=lambda item: (item[0], item[1]))
+        latest_end, latest_line = None, None
+        for start, end, line in intervals:
+            if latest_end is not None and start < latest_end:
+                if line is not None:
+                    overlapping.add(line)
+                if latest_line is not None:
+                    overlapping.add(latest_line)
+            if latest_end is None or end > latest_end:
+                latest_end, latest_line = end, line
+    for line, data, errors in parsed:
+        if line in overlapping:
+            errors.append("L'operatore ha già un appuntamento in questo orario")
+    return parsed
+
+
+# -------------------------------------------------------------
+#  Hashing password
+# -------------------------------------------------------------
+def hash_passwords(passwords):
+    """
+    Hash delle password con l'hasher condiviso del processo (stesso pool
+    di processi dei login, vedi api/passwords.py): il lotto occupa un solo
+    posto in coda e, se il pool non è disponibile o si rompe, si ripiega
+    sul thread corrente.
+    """
+    return get_hasher().hash_many(passwords)
+
+
+# -------------------------------------------------------------
+#  Inserimento
+# -------------------------------------------------------------
+USER_INSERT = """
+    INSERT INTO users (username, password_hash, email, phone, role, admin_id, specialization)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+APPOINTMENT_INSERT = """
+    INSERT INTO appointments (operator_id, client_id, start_time, end_time,
+                              service_type, status, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, NOW())
+"""
+
+
+def _insert_chunked(conn, sql, items, chunk_size):
+    """
+    items = [(riga, parametri)]. Restituisce {riga: errore} per le righe
+    non inserite.
+    """
+    failed = {}
+    for chunk in _chunks(items, chunk_size):
+        try:
+            with conn.cursor() as cursor:
+                cursor.executemany(sql, [params for _, params in chunk])
+            conn.commit()
+            continue
+        except pymysql.err.IntegrityError:
+            conn.rollback()
+        # Il blocco contiene una riga in conflitto: si riprova riga per riga
+        for line, params in chunk:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, params)
+                conn.commit()
+            except pymysql.err.IntegrityError as e:
+                conn.rollback()
+                failed[line] = f"Vincolo violato: {e.args[-1] if e.args else e}"
+    return failed
+
+
+def _book_chunk(cursor, engine, operator_id, chunk):
+    """
+    Dentro la transazione: blocca l'operatore, scarta le righe che si
+    sovrappongono a quanto c'è nel DB e inserisce le altre. Restituisce
+    {riga: errore} per le righe scartate.
+    """
+    if engine.lock_operator(cursor, operator_id) is None:
+        return {line: "Operatore non valido" for line, _ in chunk}
+    failed, params = {}, []
+    for line, d in chunk:
+        if d["status"] != "cancelled":
+            conflict = engine.find_conflict(cursor, operator_id, d["start_time"], d["end_time"])
+            if conflict is not None:
+                engine.conflicts += 1
+                failed[line] = str(BookingConflict(conflict[1], kind=conflict[0]))
+                continue
+        params.append((operator_id, d["client_id"], d["start_time"], d["end_time"],
+                       d["service_type"], d["status"]))
+    if params:
+        cursor.executemany(APPOINTMENT_INSERT, params)
+    return failed
+
+
+def _insert_appointments(conn, engine, items, chunk_size):
+    """
+    items = [(riga, dati)]. Una transazione per blocco di righe dello
+    stesso operatore, sotto il suo lock (gli operatori in ordine di id,
+    come i lock presi dalle prenotazioni singole). Restituisce {riga: errore}.
+    """
+    by_operator = {}
+    for line, data in items:
+        by_operator.setdefault(data["operator_id"], []).append((line, data))
+
+    failed = {}
+    for operator_id in sorted(by_operator):
+        for chunk in _chunks(by_operator[operator_id], chunk_size):
+            try:
+                failed.update(engine.transaction(
+                    conn, lambda cursor: _book_chunk(cursor, engine, operator_id, chunk)))
+                continue
+            except pymysql.err.IntegrityError:
+                conn.rollback()
+            # Il blocco contiene una riga in conflitto: si riprova riga per riga
+            for item in chunk:
+                try:
+                    failed.update(engine.transaction(
+                        conn, lambda cursor: _book_chunk(cursor, engine, operator_id, [item])))
+                except pymysql.err.IntegrityError as e:
+                    conn.rollback()
+                    failed[item[0]] = f"Vincolo violato: {e.args[-1] if e.args else e}"
+    return failed
+
+
+def run_import(conn, kind, admin_id, rows, chunk_size=500, dry_run=False, booking_engine=None):
+    """
+    Valida e importa 'rows' ([(riga, dict)]). Restituisce il report.
+    booking_engine è il BookingEngine dell'API (lock dell'operatore,
+    conflitti, durata massima); se manca se ne usa uno con i valori di default.
+    """
+    engine = booking_engine or BookingEngine()
+    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        if kind == "appointments":
+            validated = validate_appointments(cursor, rows, admin_id, engine.max_duration)
+        else:
+            validated = validate_users(cursor, rows)
+    conn.commit()
+
+    valid = [(line, data) for line, data, errors in validated if not errors]
+    failed = {}
+    if valid and not dry_run:
+        if kind == "appointments":
+            failed = _insert_appointments(conn, engine, valid, chunk_size)
+        else:
+            role = "operator" if kind == "operators" else "client"
+            hashes = hash_passwords([d["password"] for _, d in valid])
+            items = [(line, (d["username"], password_hash, d["email"], d["phone"], role,
+                             admin_id, d["specialization"] if role == "operator" else None))
+                     for (line, d), password_hash in zip(valid, hashes)]
+            failed = _insert_chunked(conn, USER_INSERT, items, chunk_size)
+
+    report = []
+    for line, data, errors in validated:
+        if line in failed:
+            errors = errors + [failed[line]]
+        if errors:
+            report.append({"line": line, "status": "error", "errors": errors})
+        else:
+            report.append({"line": line, "status": "valid" if dry_run else "inserted"})
+    ok = sum(1 for row in report if row["status"] != "error")
+    return {
+        "kind": kind,
+        "dry_run": dry_run,
+        "total": len(report),
+        "inserted": 0 if dry_run else ok,
+        "valid": ok,
+        "errors": len(report) - ok,
+        "rows": report
+    }
@@ -0,0 +1,195 @@
+"""
+Query del calendario (slot + appuntamenti) per api/index.py.
+
+I nomi di operatori e clienti arrivano direttamente via JOIN sulla tabella
+users: per ogni ruolo il calendario richiede un numero costante di query
+(ruolo utente + slot + appuntamenti), indipendentemente da quante righe ci
+sono. Gli appuntamenti si possono limitare a una finestra temporale e
+paginare per (start_time, id); le query sfruttano gli indici compositi
+(operator_id, start_time) e (client_id, start_time) definiti in
+migrations/001_calendar_indexes.sql.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from slot_expansion import load_exceptions, slot_expander
+
+# tenant_version: versione di tenant_versions (migrations/009), per la cache di slot_expansion
+SLOT_COLUMNS = """
+    SELECT s.id, s.operator_id, s.day_of_week, s.start_time, s.end_time,
+           s.status, op.username AS operator_name, op.admin_id,
+           tv.version AS tenant_version
+    FROM slots s
+    LEFT JOIN users op ON op.id = s.operator_id
+    LEFT JOIN tenant_versions tv ON tv.admin_id = COALESCE(op.admin_id, op.id)
+"""
+
+APPOINTMENT_COLUMNS = """
+    SELECT a.id, a.client_id, a.operator_id, a.start_time, a.end_time,
+           a.service_type, a.status,
+           c.username AS client_name, op.username AS operator_name
+    FROM appointments a
+    LEFT JOIN users c ON c.id = a.client_id
+    LEFT JOIN users op ON op.id = a.operator_id
+"""
+
+
+def encode_cursor(row):
+    """Cursore opaco per la paginazione keyset su (start_time, id)."""
+    raw = f"{row['start_time'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token):
+    """Inverso di encode_cursor. Solleva ValueError se il token non è valido."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        start, appt_id = raw.split("|", 1)
+        return datetime.fromisoformat(start), int(appt_id)
+    except Exception as e:
+        raise ValueError(f"Cursore non valido: {token}") from e
+
+
+def fetch_calendar_rows(cursor, role, user_id, start=None, end=None,
+                        operator_ids=None, after=None, limit=None):
+    """
+    Carica slot e appuntamenti visibili all'utente in base al ruolo:
+      - admin    => tutti gli slot e tutti gli appuntamenti
+      - operator => solo i suoi
+      - client   => slot approved + i propri appuntamenti
+
+    Filtri opzionali:
+      - start / end:   appuntamenti che iniziano in [start, end)
+      - operator_ids:  solo questi operatori (ignorato per role=operator)
+      - after:         (start_time, id) dell'ultimo appuntamento già
+                       restituito (paginazione keyset)
+      - limit:         numero massimo di appuntamenti; ne viene letto uno in
+                       più per sapere se esiste una pagina successiva
+
+    Gli slot si caricano solo sulla prima pagina (after=None); nelle pagine
+    successive slots è vuoto. Al massimo due query.
+    """
+    slot_where, slot_params = [], []
+    appt_where, appt_params = [], []
+
+    if role == "operator":
+        slot_where.append("s.operator_id = %s")
+        slot_params.append(user_id)
+        appt_where.append("a.operator_id = %s")
+        appt_params.append(user_id)
+        operator_ids = None
+    elif role != "admin":  # client
+        slot_where.append("s.status = 'approved'")
+        appt_where.append("a.client_id = %s")
+        appt_params.append(user_id)
+
+    if operator_ids:
+        placeholders = ", ".join(["%s"] * len(operator_ids))
+        slot_where.append(f"s.operator_id IN ({placeholders})")
+        slot_params.extend(operator_ids)
+        appt_where.append(f"a.operator_id IN ({placeholders})")
+        appt_params.extend(operator_ids)
+
+    if start is not None:
+        appt_where.append("a.start_time >= %s")
+        appt_params.append(start)
+    if end is not None:
+        appt_where.append("a.start_time < %s")
+        appt_params.append(end)
+    if after is not None:
+        after_start, after_id = after
+        appt_where.append("(a.start_time > %s OR (a.start_time = %s AND a.id > %s))")
+        appt_params.extend([after_start, after_start, after_id])
+
+    slots = []
+    if after is None:
+        cursor.execute(SLOT_COLUMNS + _where(slot_where), tuple(slot_params))
+        slots = cursor.fetchall()
+
+    query = APPOINTMENT_COLUMNS + _where(appt_where) + " ORDER BY a.start_time, a.id"
+    if limit is not None:
+        query += " LIMIT %s"
+        appt_params.append(limit + 1)
+    cursor.execute(query, tuple(appt_params))
+    appointments = cursor.fetchall()
+    return slots, appointments
+
+
+def _where(conditions):
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def slot_event(slot, start_dt, end_dt):
+    """Evento calendario per una singola occorrenza di uno slot settimanale."""
+    return {
+        "type": "slot",
+        "id": f"slot-{slot['id']}",
+        "slot_id": slot['id'],
+        "operator_id": slot['operator_id'],
+        "operator_name": slot['operator_name'] or "???",
+        "start_time": start_dt.isoformat(),
+        "end_time": end_dt.isoformat(),
+        "status": slot['status']
+    }
+
+
+def appointment_event(appt):
+    """Trasforma una riga di appointments (con i nomi già in JOIN) in evento."""
+    return {
+        "type": "appointment",
+        "id": appt['id'],
+        "client_id": appt['client_id'],
+        "operator_id": appt['operator_id'],
+        "clientName": appt['client_name'] or "???",
+        "operatorName": appt['operator_name'] or "???",
+        "start_time": appt['start_time'].isoformat(),
+        "end_time": appt['end_time'].isoformat(),
+        "service_type": appt['service_type'],
+        "status": appt['status']
+    }
+
+
+def build_calendar_events(cursor, user_id, start=None, end=None,
+                          operator_ids=None, page_cursor=None, limit=None):
+    """
+    Restituisce (eventi, next_cursor) per user_id, oppure None se l'utente
+    non esiste. Al massimo quattro query (ruolo, slot, eccezioni,
+    appuntamenti), due dalla seconda pagina in poi.
+
+    Con una finestra [start, end) completa gli slot settimanali vengono
+    espansi in tutte le occorrenze della finestra (vedi slot_expansion);
+    senza finestra resta il comportamento storico (prossima occorrenza di
+    ogni slot).
+    """
+    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        return None
+
+    after = decode_cursor(page_cursor) if page_cursor else None
+    slots, appointments = fetch_calendar_rows(
+        cursor, user['role'], user_id, start=start, end=end,
+        operator_ids=operator_ids, after=after, limit=limit
+    )
+
+    next_cursor = None
+    if limit is not None and len(appointments) > limit:
+        appointments = appointments[:limit]
+        next_cursor = encode_cursor(appointments[-1])
+
+    # Finestra degli slot: quella richiesta oppure, come in passato, i
+    # prossimi 7 giorni (una occorrenza per slot)
+    if start is not None and end is not None:
+        slot_start, slot_end = start, end
+    else:
+        slot_start = datetime.combine(datetime.now().date(), datetime.min.time())
+        slot_end = slot_start + timedelta(days=7)
+
+    events = []
+    if slots:
+        exceptions = load_exceptions(cursor, slot_start, slot_end)
+        for slot, start_dt, end_dt in slot_expander.occurrences(
+                slots, slot_start, slot_end, exceptions):
+            events.append(slot_event(slot, start_dt, end_dt))
+    events.extend(appointment_event(appt) for appt in appointments)
+    return events, next_cursor
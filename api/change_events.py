@@ -0,0 +1,285 @@
+"""
+Eventi di modifica del calendario (push via SSE o long-poll).
+
+Le rotte che modificano appuntamenti e slot chiamano publish() con il
+cursore della loro transazione: l'evento viene scritto in change_events
+(migrations/010) e diventa visibile solo con il commit, quindi nessun
+evento per modifiche annullate e nessuna modifica senza evento. Vale
+per tutte le istanze: ognuna legge la stessa tabella.
+
+In ogni processo ChangeHub tiene un solo thread che legge i nuovi eventi
+(una query ogni poll_interval secondi, subito dopo un publish locale) e
+li mette in un buffer circolare in memoria. I sottoscrittori non usano
+il DB mentre aspettano: attendono sulla Condition del proprio canale e
+vengono svegliati solo dagli eventi che li riguardano. Un sottoscrittore
+inattivo costa una Condition condivisa per canale e il suo cursore. Il
+thread di lettura si ferma quando non ci sono più sottoscrittori.
+
+Canali: "t<admin_id>" (tutto il tenant, per l'admin) e "u<user_id>"
+(eventi dell'operatore o del cliente coinvolto).
+
+Ordine: gli id AUTO_INCREMENT vengono assegnati all'INSERT ma diventano
+visibili al commit, quindi un id più basso può comparire dopo uno più
+alto. Il lettore consegna gli eventi solo in ordine di id senza buchi; un
+buco (transazione non ancora conclusa o annullata) viene aspettato al
+massimo gap_timeout secondi. Così il cursore di un sottoscrittore (id
+dell'ultimo evento ricevuto, anche come Last-Event-ID dopo una
+riconnessione) non salta mai eventi. Se il cursore è più vecchio del
+buffer gli eventi mancanti vengono riletti dal DB; se sono troppi il
+sottoscrittore riceve "reset" e deve ricaricare il calendario.
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple("Event", "id type channels data")
+
+# Risposta di listen() quando il client deve ricaricare tutto
+RESET = "reset"
+
+APPOINTMENT_FIELDS = ("id", "operator_id", "client_id", "start_time", "end_time", "service_type", "status")
+SLOT_FIELDS = ("id", "operator_id", "client_id", "day_of_week", "start_time", "end_time", "status")
+
+
+def channels_for(admin_id, user_ids=()):
+    """Canali di un evento: il tenant e gli utenti coinvolti."""
+    channels = [f"t{admin_id}"] if admin_id is not None else []
+    channels += [f"u{user_id}" for user_id in dict.fromkeys(user_ids) if user_id is not None]
+    return " ".join(channels)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+    return str(value)
+
+
+def publish(cursor, event_type, data, admin_id=None, user_ids=()):
+    """
+    Registra l'evento nella transazione di 'cursor' (va fatto prima del
+    commit). 'data' deve contenere almeno l'id dell'oggetto modificato.
+    """
+    cursor.execute("""
+        INSERT INTO change_events (type, channels, payload, created_at)
+        VALUES (%s, %s, %s, NOW())
+    """, (event_type, channels_for(admin_id, user_ids), json.dumps(data, default=_json_default)))
+
+
+def publish_appointment(cursor, event_type, appointment, admin_id):
+    """appointment.created / updated / deleted con i campi presenti in 'appointment'."""
+    data = {k: appointment[k] for k in APPOINTMENT_FIELDS if k in appointment}
+    publish(cursor, event_type, data, admin_id,
+            (appointment.get("operator_id"), appointment.get("client_id")))
+
+
+def publish_slot(cursor, event_type, slot, admin_id):
+    """slot.requested / approved / rejected."""
+    data = {k: slot[k] for k in SLOT_FIELDS if k in slot}
+    publish(cursor, event_type, data, admin_id, (slot.get("operator_id"), slot.get("client_id")))
+
+
+class ChangeHub:
+    """Fan-out in processo degli eventi di change_events."""
+
+    BATCH = 500
+
+    def __init__(self, get_db, poll_interval=1.0, buffer_size=2000, gap_timeout=2.0,
+                 catch_up_limit=500, retention=24 * 3600, idle_stop=60):
+        self.get_db = get_db
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.gap_timeout = gap_timeout
+        self.catch_up_limit = catch_up_limit
+        self.retention = retention
+        self.idle_stop = idle_stop
+
+        self._lock = threading.Lock()
+        self._channels = {}          # canale -> [Condition, sottoscrittori in attesa]
+        self._buffer = []            # Event in ordine di id
+        self._listeners = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_id = None         # ultimo id consegnato al buffer
+        self._id_step = 1            # auto_increment_increment del server
+        self._gap_since = None
+        self._last_purge = 0.0
+        self._idle_since = None
+
+        self.delivered = 0
+        self.polls = 0
+        self.catch_ups = 0
+        self.resets = 0
+
+    # -------------------------------------------------------------
+    #  Sottoscrittori
+    # -------------------------------------------------------------
+    def listen(self, channel, after=None, timeout=25.0):
+        """
+        Attende fino a 'timeout' secondi gli eventi di 'channel' con id >
+        'after' (None = solo quelli futuri). Restituisce (eventi, cursore)
+        oppure (RESET, cursore) se gli eventi persi non sono più
+        recuperabili. Lista vuota allo scadere del timeout.
+        """
+        self._load_last_id()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if after is None:
+                after = self._last_id
+            first = self._buffer[0].id if self._buffer else self._last_id + self._id_step
+            missed = after < first - self._id_step
+        if missed:
+            return self._catch_up(channel, after)
+
+        with self._lock:
+            entry = self._channels.setdefault(channel, [threading.Condition(self._lock), 0])
+            entry[1] += 1
+            self._listeners += 1
+            self._start_reader()
+            try:
+                events = self._buffered(channel, after)
+                while not events:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    entry[0].wait(remaining)
+                    events = self._buffered(channel, after)
+                # Il cursore avanza anche sugli eventi degli altri canali
+                return events, max(after, self._last_id)
+            finally:
+                self._listeners -= 1
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._channels[channel]
+
+    def _buffered(self, channel, after):
+        """Eventi del canale nel buffer con id > after (chiamare con il lock)."""
+        lo, hi = 0, len(self._buffer)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._buffer[mid].id <= after:
+                lo = mid + 1
+            else:
+                hi = mid
+        return [e for e in self._buffer[lo:] if channel in e.channels]
+
+    def _catch_up(self, channel, after):
+        """Rilegge dal DB gli eventi persi dal buffer (es. riconnessione su un'altra istanza)."""
+        with self._lock:
+            upto = self._last_id
+        with self.get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("SELECT MIN(id) AS first FROM change_events")
+            first = cursor.fetchone()["first"]
+            cursor.execute("""
+                SELECT id, type, channels, payload FROM change_events
+                WHERE id > %s AND id <= %s
+                ORDER BY id LIMIT %s
+            """, (after, upto, self.catch_up_limit))
+            rows = cursor.fetchall()
+        self.catch_ups += 1
+        # Troppi eventi persi, oppure già cancellati dalla pulizia periodica
+        if len(rows) >= self.catch_up_limit or (first is not None and after < first - self._id_step):
+            self.resets += 1
+            return RESET, upto
+        return [e for e in map(self._event, rows) if channel in e.channels], upto
+
+    # -------------------------------------------------------------
+    #  Lettura da change_events
+    # -------------------------------------------------------------
+    def wake(self):
+        """Da chiamare dopo il commit di un publish: i sottoscrittori locali lo ricevono subito."""
+        self._wake.set()
+
+    def _load_last_id(self):
+        """Al primo uso gli eventi già presenti non vengono consegnati: si parte dall'ultimo id."""
+        if self._last_id is not None:
+            return
+        with self.get_db() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0), @@auto_increment_increment FROM change_events")
+            last_id, step = cursor.fetchone()
+        with self._lock:
+            if self._last_id is None:
+                self._last_id = last_id
+                self._id_step = step or 1
+
+    def _start_reader(self):
+        """Avvia il thread di lettura se non è attivo (chiamare con il lock)."""
+        self._idle_since = None
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-events", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._listeners == 0:
+                    self._idle_since = self._idle_since or time.monotonic()
+                    if time.monotonic() - self._idle_since > self.idle_stop:
+                        self._thread = None
+                        return
+                else:
+                    self._idle_since = None
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Errore lettura change_events: {e}")
+            self._wake.wait(self.poll_interval)
+
+    def poll(self):
+        """Legge i nuovi eventi e sveglia i canali interessati."""
+        with self.get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT id, type, channels, payload FROM change_events
+                WHERE id > %s ORDER BY id LIMIT %s
+            """, (self._last_id, self.BATCH))
+            rows = cursor.fetchall()
+            if self.retention and time.monotonic() - self._last_purge > 600:
+                self._last_purge = time.monotonic()
+                cursor.execute("DELETE FROM change_events WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT 5000",
+                               (self.retention,))
+                conn.commit()
+        self.polls += 1
+        if len(rows) == self.BATCH:
+            self._wake.set()
+
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                if row["id"] != self._last_id + self._id_step:
+                    # Id mancante: transazione non ancora conclusa (o annullata), la si aspetta un po'
+                    self._gap_since = self._gap_since or now
+                    if now - self._gap_since < self.gap_timeout:
+                        break
+                self._gap_since = None
+                event = self._event(row)
+                self._buffer.append(event)
+                self._last_id = event.id
+                self.delivered += 1
+                for channel in event.channels:
+                    entry = self._channels.get(channel)
+                    if entry is not None:
+                        entry[0].notify_all()
+            if len(self._buffer) > self.buffer_size:
+                del self._buffer[:len(self._buffer) - self.buffer_size]
+
+    @staticmethod
+    def _event(row):
+        return Event(row["id"], row["type"], frozenset(row["channels"].split()), json.loads(row["payload"]))
+
+    def stats(self):
+        with self._lock:
+            return {"listeners": self._listeners, "channels": len(self._channels),
+                    "buffered": len(self._buffer), "last_id": self._last_id,
+                    "running": self._thread is not None,
+                    "delivered": self.delivered, "polls": self.polls,
+                    "catch_ups": self.catch_ups, "resets": self.resets}
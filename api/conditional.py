@@ -0,0 +1,153 @@
+"""
+GET condizionali (ETag / Last-Modified) per il calendario e le liste admin.
+
+Ogni tenant (admin) ha un numero di versione in tenant_versions, che i
+trigger di migrations/009 incrementano a ogni scrittura su appuntamenti,
+slot, eccezioni e utenti. ConditionalGet.versioned() legge la versione
+con una query per chiave primaria e, se coincide con quella che il
+client ha già (If-None-Match / If-Modified-Since), risponde 304 senza
+eseguire la vista: niente query del calendario o delle liste e niente
+serializzazione. Altrimenti esegue la vista e aggiunge ETag,
+Last-Modified e Cache-Control: private, no-cache (il browser rivalida a
+ogni richiesta).
+
+La versione viene letta prima dei dati: se una scrittura arriva in mezzo
+la risposta ha un ETag più vecchio dei dati e alla richiesta successiva
+il client riceve di nuovo la risposta completa, mai un 304 sbagliato.
+
+Last-Modified ha la risoluzione di un secondo: viene inviato solo se
+l'ultima scrittura è in un secondo già concluso (orologio del DB), così
+una scrittura successiva cambia sempre il valore.
+"""
+import hashlib
+import logging
+from collections import namedtuple
+from datetime import date, timezone
+from functools import wraps
+
+import pymysql
+from flask import make_response, request
+
+logger = logging.getLogger(__name__)
+
+# tag: identifica i dati; updated_at / now: ultima scrittura e ora del DB (UTC), per Last-Modified
+Version = namedtuple("Version", "tag updated_at now")
+
+
+def tenant_version(cursor, admin_id, **_):
+    """Versione dei dati di un admin."""
+    cursor.execute("""
+        SELECT version, updated_at, UTC_TIMESTAMP(6) AS now
+        FROM tenant_versions WHERE admin_id = %s
+    """, (admin_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return Version(f"t{admin_id}:0", None, None)
+    return Version(f"t{admin_id}:{row['version']}:{row['updated_at'].isoformat()}",
+                   row["updated_at"], row["now"])
+
+
+def global_version(cursor, **_):
+    """Versione di tutti i tenant, per le viste che non sono limitate a un admin."""
+    cursor.execute("""
+        SELECT COALESCE(SUM(version), 0) AS version, COUNT(*) AS tenants,
+               MAX(updated_at) AS updated_at, UTC_TIMESTAMP(6) AS now
+        FROM tenant_versions
+    """)
+    row = cursor.fetchone()
+    updated_at = row["updated_at"]
+    return Version(f"all:{row['version']}:{row['tenants']}:{updated_at.isoformat() if updated_at else ''}",
+                   updated_at, row["now"])
+
+
+def calendar_version(cursor, user_id, **_):
+    """
+    Versione del calendario di user_id (None se l'utente non esiste: la
+    vista risponde 404). Un operatore vede solo i dati del suo tenant;
+    admin e clienti vedono slot e appuntamenti di tutti gli operatori
+    (vedi calendar_queries.fetch_calendar_rows), quindi dipendono da
+    tutti i tenant. Senza finestra from/to il calendario dipende anche
+    dalla data di oggi: la data entra nel tag e Last-Modified non viene
+    inviato.
+    """
+    cursor.execute("SELECT role, COALESCE(admin_id, id) AS tenant FROM users WHERE id = %s", (user_id,))
+    user = cursor.fetchone()
+    if user is None:
+        return None
+    version = (tenant_version(cursor, user["tenant"]) if user["role"] == "operator"
+               else global_version(cursor))
+    if not (request.args.get("from") and request.args.get("to")):
+        return Version(f"{version.tag}:{date.today().isoformat()}", None, None)
+    return version
+
+
+class ConditionalGet:
+    """Decoratore per le rotte GET che rispondono 304 quando la versione non è cambiata."""
+
+    def __init__(self, get_db):
+        self.get_db = get_db
+        self.checked = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def versioned(self, version_of):
+        """
+        version_of(cursor, **argomenti_della_rotta) -> Version, oppure
+        None per eseguire la vista senza validatori. Va messo sotto i
+        decoratori di autorizzazione: un 304 non deve saltare i controlli.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                try:
+                    with self.get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                        version = version_of(cursor, **kwargs)
+                except Exception as e:
+                    # Es. migrazione 009 non ancora applicata: risposta normale, senza cache
+                    self.errors += 1
+                    logger.warning(f"Versione non disponibile per {request.path}: {e}")
+                    return view(*args, **kwargs)
+                if version is None:
+                    return view(*args, **kwargs)
+
+                self.checked += 1
+                etag = hashlib.sha1(f"{request.full_path}|{version.tag}".encode()).hexdigest()[:20]
+                last_modified = self.last_modified(version)
+                if self.is_fresh(etag, last_modified):
+                    self.not_modified += 1
+                    response = make_response("", 304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                response.headers["Cache-Control"] = "private, no-cache"
+                return response
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def last_modified(version):
+        """Ultima scrittura troncata al secondo, solo se quel secondo è già concluso."""
+        if version.updated_at is None or version.now is None:
+            return None
+        updated = version.updated_at.replace(microsecond=0)
+        if updated >= version.now.replace(microsecond=0):
+            return None
+        return updated.replace(tzinfo=timezone.utc)
+
+    @staticmethod
+    def is_fresh(etag, last_modified):
+        # If-None-Match ha la precedenza; If-Modified-Since conta solo senza ETag
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        if last_modified is not None and request.if_modified_since is not None:
+            return last_modified <= request.if_modified_since
+        return False
+
+    def stats(self):
+        return {"checked": self.checked, "not_modified": self.not_modified,
+                "hit_rate": round(self.not_modified / self.checked, 4) if self.checked else None,
+                "errors": self.errors}
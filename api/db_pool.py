@@ -0,0 +1,218 @@
+"""
+Pool di connessioni pymysql per l'API serverless (api/index.py).
+
+Il pool vive a livello di modulo: su Vercel un container "caldo" riusa lo
+stesso processo Python tra una richiesta e l'altra, quindi le connessioni
+aperte restano disponibili e si evita l'handshake TCP + auth ad ogni
+richiesta. Le connessioni rimaste ferme troppo a lungo vengono chiuse
+(MySQL le chiuderebbe comunque dopo wait_timeout) e, al prelievo, quelle
+inattive da qualche secondo vengono verificate con un ping.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Nessuna connessione libera entro il tempo massimo di attesa."""
+
+
+class ConnectionPool:
+    """
+    Pool thread-safe di connessioni pymysql con:
+      - limite massimo di connessioni aperte (max_size)
+      - health check (ping) al prelievo per connessioni ferme da > ping_after secondi
+      - chiusura delle connessioni inattive da > idle_timeout secondi
+      - contatori hit / miss / wait esposti da stats()
+    'on_connect(secondi)', se indicato, viene chiamato dopo ogni nuova
+    connessione fisica con la durata dell'handshake; 'on_open(conn)' può
+    preparare la connessione prima del primo uso (es. strumentazione).
+    """
+
+    def __init__(self, connect_kwargs, max_size=5, idle_timeout=300,
+                 checkout_timeout=5, ping_after=10, on_connect=None, on_open=None):
+        self._connect_kwargs = dict(connect_kwargs)
+        self.on_connect = on_connect
+        self.on_open = on_open
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connessione, istante ultimo rilascio)
+        self._in_use = 0
+        self._pid = os.getpid()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.evictions = 0
+        self.broken = 0
+
+    # -------------------------------------------------------------
+    #  Prelievo / rilascio
+    # -------------------------------------------------------------
+    def acquire(self):
+        """Preleva una connessione dal pool (o ne apre una nuova entro il limite)."""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        with self._cond:
+            self._check_fork()
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, released_at = self._idle.pop()  # LIFO: la più "calda"
+                    self._in_use += 1
+                    break
+                if self._in_use + len(self._idle) < self.max_size:
+                    conn, released_at = None, None
+                    self._in_use += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"Nessuna connessione libera dopo {self.checkout_timeout}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        # Le operazioni di rete avvengono fuori dal lock
+        if conn is not None and time.monotonic() - released_at > self.ping_after:
+            if not self._is_alive(conn):
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self.broken += 1
+
+        if conn is not None:
+            with self._cond:
+                self.hits += 1
+            return conn
+
+        started = time.monotonic()
+        try:
+            conn = pymysql.connect(**self._connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.misses += 1
+        if self.on_connect is not None:
+            self.on_connect(time.monotonic() - started)
+        if self.on_open is not None:
+            self.on_open(conn)
+        return conn
+
+    def release(self, conn, discard=False):
+        """
+        Restituisce la connessione al pool. Eventuali transazioni aperte
+        vengono annullate, così la prossima richiesta non eredita uno
+        snapshot vecchio o lock pendenti.
+        """
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if os.getpid() != self._pid:
+                # Connessione ereditata da un altro processo: non va riusata
+                discard = True
+            else:
+                self._in_use -= 1
+            if discard or not conn.open:
+                self.broken += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager che presta una connessione e la restituisce sempre,
+        anche in caso di eccezione. Le connessioni che hanno dato errori di
+        rete/protocollo vengono scartate invece di tornare nel pool.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    # -------------------------------------------------------------
+    #  Manutenzione
+    # -------------------------------------------------------------
+    def close_all(self):
+        """Chiude tutte le connessioni inattive."""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close_quietly(conn)
+
+    def stats(self):
+        """Contatori del pool (per il debug / monitoraggio)."""
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "evictions": self.evictions,
+                "broken": self.broken,
+            }
+
+    def _evict_idle(self):
+        # Da chiamare con il lock acquisito. Le più vecchie sono in testa.
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self.evictions += 1
+            self._close_quietly(conn)
+
+    def _check_fork(self):
+        # Dopo un fork i socket appartengono al processo padre: si riparte da zero
+        pid = os.getpid()
+        if pid != self._pid:
+            logger.info("Pool DB: rilevato nuovo processo, reset delle connessioni")
+            self._idle.clear()
+            self._in_use = 0
+            self._pid = pid
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,238 @@
+"""
+Cache read-through delle anagrafiche (operatori e clienti) per tenant.
+
+Le liste di operatori e clienti di un admin cambiano di rado ma vengono
+lette a ogni apertura della dashboard. DirectoryCache.get_or_load() le
+restituisce dalla cache e, se mancano o sono scadute, le carica con la
+funzione indicata (una sola volta per chiave anche con richieste
+concorrenti). Chi scrive su users chiama invalidate(admin_id, kind).
+
+Chiavi: directory:<kind>:<admin_id>:<view>:<generazione>. 'view'
+distingue i formati delle due app (api/index.py e blueprint), che possono
+condividere lo stesso backend. La generazione è un contatore per
+(kind, admin_id) salvato nel backend: invalidate() lo incrementa, quindi
+una scrittura fatta da una parte è visibile subito anche all'altra, e un
+caricamento iniziato prima dell'invalidazione salva il risultato sotto la
+generazione vecchia, che nessuno legge più.
+
+Backend (DIRECTORY_CACHE_BACKEND):
+  memory  LRU in memoria con TTL (default). Su Vercel ogni istanza ha la
+          sua: dopo una scrittura le altre istanze vedono il dato nuovo
+          al più dopo DIRECTORY_CACHE_TTL secondi.
+  redis   condiviso (REDIS_URL), valori in JSON con scadenza.
+  none    nessuna cache (sempre dal DB).
+
+Quando sono in servizio entrambe le app serve un backend condiviso: con
+DIRECTORY_CACHE_SHARED=1 un backend memory fa fallire l'avvio invece di
+servire per TTL secondi dati che l'altra app ha già cambiato.
+
+Questo modulo non importa altri moduli di api/, così può essere usato
+anche dall'app (from api.directory_cache import ...).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+KINDS = ("operators", "clients")
+VIEWS = ("api", "app")
+
+
+class MemoryBackend:
+    """LRU con scadenza delle voci."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def bump(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            return self._generations[key]
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Backend condiviso su Redis (richiede il pacchetto redis)."""
+
+    def __init__(self, url):
+        import redis  # Import locale: serve solo con DIRECTORY_CACHE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, json.dumps(value, default=str), ex=max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self._redis.delete(*keys)
+
+    def generation(self, key):
+        return int(self._redis.get(key) or 0)
+
+    def bump(self, key):
+        return self._redis.incr(key)
+
+    def size(self):
+        return None
+
+
+class NullBackend:
+    """Nessuna cache."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def generation(self, key):
+        return 0
+
+    def bump(self, key):
+        return 0
+
+    def size(self):
+        return 0
+
+
+def make_backend(name="memory", redis_url=None, max_entries=2048, shared=False):
+    """
+    shared=True (DIRECTORY_CACHE_SHARED): entrambe le app sono in servizio
+    e devono vedere le invalidazioni dell'altra, quindi serve redis (o
+    nessuna cache).
+    """
+    if shared and name not in ("redis", "none"):
+        raise RuntimeError("Con DIRECTORY_CACHE_SHARED la cache anagrafiche richiede "
+                           "DIRECTORY_CACHE_BACKEND=redis (o none)")
+    if name == "redis":
+        return RedisBackend(redis_url or "redis://localhost:6379/0")
+    if name == "none":
+        return NullBackend()
+    return MemoryBackend(max_entries)
+
+
+class DirectoryCache:
+    """Cache per (tipo, admin) con caricamento a richiesta e metriche di hit rate."""
+
+    def __init__(self, backend=None, view="api", ttl=60):
+        self.backend = backend or MemoryBackend()
+        self.view = view
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, view="api"):
+        backend = make_backend(os.getenv("DIRECTORY_CACHE_BACKEND", "memory"), os.getenv("REDIS_URL"),
+                               shared=os.getenv("DIRECTORY_CACHE_SHARED", "0") == "1")
+        return cls(backend, view=view, ttl=int(os.getenv("DIRECTORY_CACHE_TTL", "60")))
+
+    @staticmethod
+    def key(kind, admin_id, view, generation=0):
+        return f"directory:{kind}:{admin_id}:{view}:{generation}"
+
+    @staticmethod
+    def generation_key(kind, admin_id):
+        return f"directory-gen:{kind}:{admin_id}"
+
+    def get_or_load(self, admin_id, kind, loader):
+        """
+        Valore in cache per (kind, admin_id); altrimenti loader(), salvato
+        per 'ttl' secondi sotto la generazione letta prima del caricamento.
+        """
+        generation = self.backend.generation(self.generation_key(kind, admin_id))
+        key = self.key(kind, admin_id, self.view, generation)
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(hit=True)
+            return value
+
+        # Una sola richiesta carica la chiave, le altre attendono e la trovano in cache
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            value = self.backend.get(key)
+            if value is not None:
+                self._count(hit=True)
+                return value
+            self._count(hit=False)
+            try:
+                value = loader()
+                self.backend.set(key, value, self.ttl)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return value
+
+    def invalidate(self, admin_id, *kinds):
+        """Da chiamare dopo ogni scrittura sugli utenti dell'admin (tutti i tipi se 'kinds' è vuoto)."""
+        if admin_id is None:
+            return
+        for kind in (kinds or KINDS):
+            generation = self.backend.bump(self.generation_key(kind, admin_id))
+            # Le voci della generazione precedente non sono più lette: si libera solo spazio
+            self.backend.delete(*(self.key(kind, admin_id, view, generation - 1) for view in VIEWS))
+        with self._lock:
+            self.invalidations += 1
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "ttl": self.ttl,
+                "size": self.backend.size(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+                "invalidations": self.invalidations,
+            }
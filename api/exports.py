@@ -0,0 +1,175 @@
+"""
+Export in streaming di appuntamenti e slot (NDJSON o CSV, opzionalmente gzip).
+
+La query viene eseguita con un cursore lato server (SSDictCursor): le
+righe arrivano da MySQL a blocchi di FETCH_SIZE e vengono serializzate e
+(se richiesto) compresse man mano, quindi la memoria usata non dipende
+dal numero di righe esportate.
+
+La connessione resta occupata finché lo stream non finisce. Se il client
+si disconnette a metà, la connessione viene scartata invece di tornare
+nel pool (ha ancora risultati non letti).
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+
+import pymysql
+
+FETCH_SIZE = 1000
+FORMATS = ("ndjson", "csv")
+
+EXPORTS = {
+    "appointments": {
+        "columns": ["id", "operator_id", "operator_name", "client_id", "client_name",
+                    "start_time", "end_time", "status", "service_type", "created_at"],
+        "select": """
+            SELECT a.id, a.operator_id, op.username AS operator_name,
+                   a.client_id, cl.username AS client_name,
+                   a.start_time, a.end_time, a.status, a.service_type, a.created_at
+            FROM appointments a
+            JOIN users op ON op.id = a.operator_id
+            LEFT JOIN users cl ON cl.id = a.client_id
+        """,
+        "order": "a.id",
+    },
+    "slots": {
+        "columns": ["id", "operator_id", "operator_name", "client_id", "day_of_week",
+                    "start_time", "end_time", "status"],
+        "select": """
+            SELECT s.id, s.operator_id, op.username AS operator_name, s.client_id,
+                   s.day_of_week, s.start_time, s.end_time, s.status
+            FROM slots s
+            JOIN users op ON op.id = s.operator_id
+        """,
+        "order": "s.id",
+    },
+}
+
+
+def build_export_query(kind, admin_id=None, operator_ids=None, status=None,
+                       client_id=None, start=None, end=None, day_of_week=None):
+    """SQL e parametri dell'export 'kind' con i filtri indicati."""
+    spec = EXPORTS[kind]
+    alias = "a" if kind == "appointments" else "s"
+    where = []
+    params = []
+    if admin_id:
+        where.append("op.admin_id = %s")
+        params.append(admin_id)
+    if operator_ids:
+        where.append(f"{alias}.operator_id IN ({', '.join(['%s'] * len(operator_ids))})")
+        params.extend(operator_ids)
+    if status:
+        where.append(f"{alias}.status = %s")
+        params.append(status)
+    if client_id:
+        where.append(f"{alias}.client_id = %s")
+        params.append(client_id)
+    if kind == "appointments":
+        if start:
+            where.append("a.start_time >= %s")
+            params.append(start)
+        if end:
+            where.append("a.start_time < %s")
+            params.append(end)
+    elif day_of_week is not None:
+        where.append("s.day_of_week = %s")
+        params.append(day_of_week)
+
+    sql = spec["select"]
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {spec['order']}"
+    return sql, tuple(params)
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        # Colonne TIME
+        minutes, seconds = divmod(int(value.total_seconds()), 60)
+        return f"{minutes // 60:02d}:{minutes % 60:02d}:{seconds:02d}"
+    return value
+
+
+def encode_ndjson(batches):
+    for rows in batches:
+        yield "".join(json.dumps({k: _plain(v) for k, v in row.items()}) + "\n"
+                      for row in rows)
+
+
+def encode_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([_plain(row[column]) for column in columns] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_stream(chunks, level=6):
+    """Comprime al volo (formato gzip) uno stream di stringhe."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ExportStream:
+    """
+    Esegue la query su una connessione del pool (subito, così gli errori
+    SQL arrivano prima di iniziare la risposta) e ne produce le righe a
+    blocchi. La connessione torna al pool solo a stream completato.
+    """
+
+    def __init__(self, pool, sql, params, fetch_size=FETCH_SIZE):
+        self.pool = pool
+        self.fetch_size = fetch_size
+        self.rows_sent = 0
+        self._released = False
+        self._conn = pool.acquire()
+        try:
+            self._cursor = self._conn.cursor(pymysql.cursors.SSDictCursor)
+            self._cursor.execute(sql, params)
+        except Exception:
+            self.close()
+            raise
+
+    def batches(self):
+        finished = False
+        try:
+            while True:
+                rows = self._cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                self.rows_sent += len(rows)
+                yield rows
+            self._cursor.close()
+            finished = True
+        finally:
+            self.close(discard=not finished)
+
+    def close(self, discard=True):
+        """Rilascia la connessione (una volta sola), anche se lo stream non è mai partito."""
+        if not self._released:
+            self._released = True
+            self.pool.release(self._conn, discard=discard)
+
+
+def export_chunks(stream, kind, fmt, compress=False):
+    """Pezzi della risposta (str, o bytes se compress) nel formato richiesto."""
+    if fmt == "csv":
+        chunks = encode_csv(stream.batches(), EXPORTS[kind]["columns"])
+    else:
+        chunks = encode_ndjson(stream.batches())
+    return gzip_stream(chunks) if compress else chunks
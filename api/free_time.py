@@ -0,0 +1,172 @@
+"""
+Ricerca dei primi N orari liberi ("openings") tra più operatori.
+
+Disponibilità = occorrenze degli slot approvati (espanse da slot_expansion,
+eccezioni comprese) meno gli appuntamenti non annullati e le prenotazioni
+temporanee attive (api/holds.py). Per ogni operatore gli intervalli
+vengono ordinati e fusi, poi i liberi si ottengono con una sottrazione
+lineare tra due liste ordinate; i risultati dei vari operatori
+sono fusi con un heap, quindi ci si ferma appena trovati N orari.
+Quattro query in tutto, indipendentemente dal numero di operatori.
+
+La scansione all'indietro sull'indice (operator_id, start_time) è
+limitata dalla stessa durata usata dalle prenotazioni
+(BookingEngine.lookback: BOOKING_MAX_DURATION_HOURS o l'appuntamento più
+lungo registrato per gli operatori, se maggiore).
+"""
+import heapq
+from datetime import timedelta
+
+from booking import BookingEngine
+from slot_expansion import load_exceptions, slot_expander
+
+
+def merge_intervals(intervals):
+    """Fonde intervalli [start, end) sovrapposti o adiacenti. Restituisce lista ordinata."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def subtract_intervals(free, busy):
+    """free - busy, con entrambe le liste ordinate e già fuse."""
+    result = []
+    j = 0
+    for start, end in free:
+        cursor = start
+        while j < len(busy) and busy[j][1] <= cursor:
+            j += 1
+        k = j
+        while k < len(busy) and busy[k][0] < end:
+            if busy[k][0] > cursor:
+                result.append((cursor, busy[k][0]))
+            cursor = max(cursor, busy[k][1])
+            if cursor >= end:
+                break
+            k += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def iter_openings(free, duration, step):
+    """Orari di inizio (start, end) di lunghezza 'duration' dentro gli intervalli liberi."""
+    for start, end in free:
+        cursor = start
+        while cursor + duration <= end:
+            yield cursor, cursor + duration
+            cursor += step
+
+
+def _tagged(operator_id, openings):
+    for opening_start, opening_end in openings:
+        yield opening_start, opening_end, operator_id
+
+
+def fetch_operators(cursor, operator_ids=None, specialization=None, admin_id=None):
+    """Operatori da considerare, con i rispettivi slot approvati (una query)."""
+    where = ["op.role = 'operator'", "s.status = 'approved'"]
+    params = []
+    if operator_ids:
+        where.append(f"op.id IN ({', '.join(['%s'] * len(operator_ids))})")
+        params.extend(operator_ids)
+    if specialization:
+        where.append("op.specialization = %s")
+        params.append(specialization)
+    if admin_id:
+        where.append("op.admin_id = %s")
+        params.append(admin_id)
+
+    cursor.execute(f"""
+        SELECT s.id, s.operator_id, s.day_of_week, s.start_time, s.end_time,
+               s.status, op.username AS operator_name, op.admin_id,
+               tv.version AS tenant_version
+        FROM slots s
+        JOIN users op ON op.id = s.operator_id
+        LEFT JOIN tenant_versions tv ON tv.admin_id = COALESCE(op.admin_id, op.id)
+        WHERE {' AND '.join(where)}
+    """, tuple(params))
+    return cursor.fetchall()
+
+
+def fetch_busy(cursor, operator_ids, start, end, booking_engine):
+    """
+    Appuntamenti non annullati e prenotazioni temporanee attive (api/holds.py)
+    che intersecano [start, end), per operatore.
+    """
+    busy = {operator_id: [] for operator_id in operator_ids}
+    if not operator_ids:
+        return busy
+    placeholders = ', '.join(['%s'] * len(operator_ids))
+    window = (start - booking_engine.lookback(cursor, *operator_ids), end, start)
+    cursor.execute(f"""
+        SELECT operator_id, start_time, end_time
+        FROM appointments
+        WHERE operator_id IN ({placeholders})
+          AND start_time >= %s AND start_time < %s
+          AND end_time > %s
+          AND status <> 'cancelled'
+        UNION ALL
+        SELECT operator_id, start_time, end_time
+        FROM slot_holds
+        WHERE operator_id IN ({placeholders})
+          AND start_time >= %s AND start_time < %s
+          AND end_time > %s
+          AND expires_at > NOW()
+    """, (*operator_ids, *window, *operator_ids, *window))
+    for row in cursor.fetchall():
+        busy[row['operator_id']].append((row['start_time'], row['end_time']))
+    return busy
+
+
+def find_openings(cursor, start, end, duration, limit=10, step=None,
+                  operator_ids=None, specialization=None, admin_id=None, booking_engine=None):
+    """
+    Primi 'limit' orari liberi di durata 'duration' (timedelta) in
+    [start, end), ordinati per inizio. 'step' è la distanza tra due orari
+    proposti nello stesso intervallo libero (default: la durata stessa).
+    booking_engine è il BookingEngine dell'API (durata massima); se manca
+    se ne usa uno con i valori di default.
+    """
+    step = step or duration
+    slots = fetch_operators(cursor, operator_ids, specialization, admin_id)
+    if not slots:
+        return []
+
+    # Si parte un giorno prima per includere lo slot già iniziato a 'start'
+    expand_from = start - timedelta(days=1)
+    exceptions = load_exceptions(cursor, expand_from, end)
+    names = {}
+    free_by_operator = {}
+    for slot, slot_start, slot_end in slot_expander.occurrences(
+            slots, expand_from, end, exceptions):
+        slot_start, slot_end = max(slot_start, start), min(slot_end, end)
+        if slot_start >= slot_end:
+            continue
+        names[slot['operator_id']] = slot['operator_name']
+        free_by_operator.setdefault(slot['operator_id'], []).append((slot_start, slot_end))
+
+    busy = fetch_busy(cursor, sorted(free_by_operator), start, end, booking_engine or BookingEngine())
+
+    streams = []
+    for operator_id, free in free_by_operator.items():
+        available = subtract_intervals(merge_intervals(free),
+                                       merge_intervals(busy[operator_id]))
+        streams.append(_tagged(operator_id, iter_openings(available, duration, step)))
+
+    openings = []
+    for opening_start, opening_end, operator_id in heapq.merge(*streams):
+        openings.append({
+            "operator_id": operator_id,
+            "operator_name": names[operator_id],
+            "start_time": opening_start.isoformat(),
+            "end_time": opening_end.isoformat()
+        })
+        if len(openings) >= limit:
+            break
+    return openings
@@ -0,0 +1,140 @@
+"""
+Prenotazioni temporanee ("hold") di un orario libero.
+
+Il cliente sceglie un orario tra quelli di /api/availability/openings e
+lo blocca per qualche secondo (lease su slot_holds, migrations/008): nel
+frattempo l'orario non compare più tra gli orari liberi e non può essere
+prenotato né bloccato da altri. La conferma trasforma la hold in un
+appuntamento senza ripetere la ricerca di disponibilità né il controllo
+di sovrapposizione: l'esclusività l'ha già garantita la hold.
+
+Le hold scadono da sole: tutte le letture considerano solo quelle con
+expires_at > NOW() (orologio del DB, uguale per tutte le istanze) e le
+righe scadute di un operatore vengono cancellate alla hold successiva.
+
+Ordine dei lock uguale a api/booking.py (prima la riga dell'operatore),
+così hold, conferme e prenotazioni dirette non vanno in deadlock.
+"""
+import secrets
+
+from booking import BookingConflict, BookingError, parse_interval
+
+
+class HoldService:
+    """Creazione, conferma e rilascio delle hold, sopra un BookingEngine."""
+
+    def __init__(self, engine, default_ttl=120, max_ttl=900, max_per_client=3):
+        self.engine = engine
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.max_per_client = max_per_client
+        self.created = 0
+        self.confirmed = 0
+        self.expired = 0
+
+    def create(self, conn, operator_id, client_id, start, end, ttl=None):
+        """Blocca [start, end) per 'ttl' secondi. Restituisce la hold creata."""
+        start, end = parse_interval(start, end, self.engine.max_duration)
+        ttl = max(1, min(int(ttl or self.default_ttl), self.max_ttl))
+
+        def attempt(cursor):
+            if self.engine.lock_operator(cursor, operator_id) is None:
+                raise BookingError("Operatore non valido")
+            cursor.execute("""
+                SELECT u.id, COUNT(h.id) AS active
+                FROM users u
+                LEFT JOIN slot_holds h ON h.client_id = u.id AND h.expires_at > NOW()
+                WHERE u.id = %s AND u.role = 'client'
+                GROUP BY u.id
+            """, (client_id,))
+            client = cursor.fetchone()
+            if client is None:
+                raise BookingError("Cliente non valido")
+            if client["active"] >= self.max_per_client:
+                raise BookingError("Troppe prenotazioni temporanee attive", status=429)
+
+            cursor.execute("DELETE FROM slot_holds WHERE operator_id = %s AND expires_at <= NOW()",
+                           (operator_id,))
+            self.expired += cursor.rowcount
+
+            conflict = self.engine.find_conflict(cursor, operator_id, start, end)
+            if conflict is not None:
+                raise BookingConflict(conflict[1], kind=conflict[0])
+
+            hold_id = secrets.token_hex(16)
+            cursor.execute("""
+                INSERT INTO slot_holds (id, operator_id, client_id, start_time, end_time,
+                                        expires_at, created_at)
+                VALUES (%s, %s, %s, %s, %s, NOW() + INTERVAL %s SECOND, NOW())
+            """, (hold_id, operator_id, client_id, start, end, ttl))
+            return {"hold_id": hold_id, "operator_id": operator_id, "start_time": start,
+                    "end_time": end, "expires_in": ttl}
+
+        hold = self.engine.transaction(conn, attempt)
+        self.created += 1
+        return hold
+
+    def confirm(self, conn, hold_id, client_id=None, service_type="", on_booked=None):
+        """
+        Trasforma la hold in un appuntamento (stesso formato di
+        BookingEngine.book, con in più operator_id e client_id).
+        BookingError 410 se è scaduta o non esiste; on_booked come in
+        BookingEngine.book.
+        """
+        def attempt(cursor):
+            cursor.execute("SELECT operator_id FROM slot_holds WHERE id = %s", (hold_id,))
+            row = cursor.fetchone()
+            if row is None:
+                raise BookingError("Prenotazione temporanea scaduta o inesistente", status=410)
+            operator = self.engine.lock_operator(cursor, row["operator_id"])
+
+            cursor.execute("""
+                SELECT h.operator_id, h.client_id, h.start_time, h.end_time, u.phone
+                FROM slot_holds h JOIN users u ON u.id = h.client_id
+                WHERE h.id = %s AND h.expires_at > NOW()
+                FOR UPDATE
+            """, (hold_id,))
+            hold = cursor.fetchone()
+            if hold is None:
+                raise BookingError("Prenotazione temporanea scaduta o inesistente", status=410)
+            if client_id is not None and hold["client_id"] != client_id:
+                raise BookingError("Prenotazione temporanea di un altro cliente", status=403)
+
+            cursor.execute("""
+                INSERT INTO appointments (operator_id, client_id, start_time,
+                                          end_time, service_type, created_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+            """, (hold["operator_id"], hold["client_id"], hold["start_time"],
+                  hold["end_time"], service_type or ""))
+            appointment_id = cursor.lastrowid
+            cursor.execute("DELETE FROM slot_holds WHERE id = %s", (hold_id,))
+            booked = {"id": appointment_id, "operator_id": hold["operator_id"],
+                      "client_id": hold["client_id"], "start_time": hold["start_time"],
+                      "end_time": hold["end_time"], "client_phone": hold["phone"],
+                      "admin_id": operator["admin_id"] if operator else None}
+            if on_booked is not None:
+                on_booked(cursor, booked)
+            return booked
+
+        appointment = self.engine.transaction(conn, attempt)
+        self.confirmed += 1
+        return appointment
+
+    @staticmethod
+    def release(conn, hold_id, client_id=None):
+        """Libera subito l'orario. Restituisce False se la hold non c'era (o non è del cliente)."""
+        sql = "DELETE FROM slot_holds WHERE id = %s"
+        params = [hold_id]
+        if client_id is not None:
+            sql += " AND client_id = %s"
+            params.append(client_id)
+        with conn.cursor() as cursor:
+            cursor.execute(sql, tuple(params))
+            released = cursor.rowcount > 0
+        conn.commit()
+        return released
+
+    def stats(self):
+        return {"created": self.created, "confirmed": self.confirmed,
+                "expired_purged": self.expired, "default_ttl": self.default_ttl,
+                "max_per_client": self.max_per_client}
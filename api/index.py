@@ -1,58 +1,164 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import pymysql
+import json
+import os
+import sys
 import time
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
-import logging
+
+# Rende importabili i moduli di supporto in api/ e la factory (app/, config.py)
+# sia su Vercel sia in locale
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Per primo: misura il cold start a partire da qui (vedi api/startup_profile.py)
+from startup_profile import startup  # noqa: E402
+
+from flask import Response, g, request, jsonify, stream_with_context  # noqa: E402
+import pymysql  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+import logging  # noqa: E402
+from app import create_app  # noqa: E402
+from config import ServerlessConfig  # noqa: E402
+startup.mark("framework_imported")
+
+from db_pool import ConnectionPool  # noqa: E402
+from calendar_queries import build_calendar_events, decode_cursor  # noqa: E402
+from slot_expansion import slot_expander  # noqa: E402
+from free_time import find_openings  # noqa: E402
+from reminders import ReminderScheduler, parse_lead_times  # noqa: E402
+from auth_tokens import TokenAuth, TokenError, TokenService, bearer_token, tenant_of  # noqa: E402
+from rate_limit import LoginThrottle, client_ip  # noqa: E402
+from passwords import HasherBusy, get_hasher  # noqa: E402
+from request_metrics import RequestMetrics, instrument_connection  # noqa: E402
+from booking import BookingConflict, BookingEngine, BookingError  # noqa: E402
+from holds import HoldService  # noqa: E402
+from directory_cache import DirectoryCache  # noqa: E402
+from conditional import ConditionalGet, calendar_version, global_version, tenant_version  # noqa: E402
+from change_events import RESET, ChangeHub, publish_appointment, publish_slot  # noqa: E402
+startup.mark("modules_imported")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# Stessa factory dell'app: CORS (solo /api/*, origini in CORS_ORIGINS) e niente Flask-SQLAlchemy
+app = create_app(ServerlessConfig)
 
-# =============================
-#  C O R S   C O N F I G
-# =============================
-# Aggiungi qui i domini che usi davvero (senza slash finale).
-allowed_origins = [
-    "http://localhost:3000",
-    "https://clientappo.vercel.app",
-    # Eventuali altri alias Vercel, se li usi (esempio):
-    # "https://clientappo-xxx.vercel.app",
-    # "https://appointment-syst.vercel.app",
-]
-
-# Abilita CORS solo sulle route /api/*
-CORS(
-    app,
-    resources={r"/api/*": {"origins": allowed_origins}},
-    supports_credentials=True
-)
+# Tempo, query, tempo DB e serializzazione per rotta (/metrics, /api/debug/requests)
+request_metrics = RequestMetrics(query_warning=int(os.getenv("REQUEST_QUERY_WARNING", "30")))
+request_metrics.init_app(app)
 
 # =============================
 #   C O N F I G   D B
 # =============================
+# DB_* sovrascrivono i valori di produzione (es. MySQL locale per i benchmark)
 DB_CONFIG = {
-    "host": "34.17.85.107",
-    "user": "root",
-    "password": "lollo201416",
-    "db": "appointment_db",
+    "host": os.getenv("DB_HOST", "34.17.85.107"),
+    "port": int(os.getenv("DB_PORT", "3306")),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", "lollo201416"),
+    "db": os.getenv("DB_NAME", "appointment_db"),
     "connect_timeout": 3,
     "read_timeout": 3,
     "write_timeout": 3
 }
 
+# Pool a livello di modulo: sopravvive tra le richieste nei container "caldi"
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    max_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    idle_timeout=int(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")),
+    on_connect=startup.record_connect,
+    on_open=instrument_connection,
+)
+
 def get_db():
-    """Crea e restituisce una connessione pymysql al DB."""
-    try:
-        logger.info("Tentativo di connessione al database...")
-        conn = pymysql.connect(**DB_CONFIG)
-        logger.info("Connessione al database riuscita")
-        return conn
-    except Exception as e:
-        logger.error(f"Errore connessione database: {e}")
-        raise
+    """
+    Presta una connessione pymysql dal pool. Va usata come context manager
+    (with get_db() as conn: ...): la connessione torna sempre al pool.
+    """
+    return db_pool.connection()
+
+# =============================
+#  T O K E N   D I   A C C E S S O
+# =============================
+def _is_token_revoked(jti):
+    with get_db() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM revoked_tokens WHERE jti = %s", (jti,))
+        return cursor.fetchone() is not None
+
+def _is_admin(admin_id):
+    """Vecchio controllo sull'admin_id della richiesta (una query)."""
+    with get_db() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM users WHERE id = %s AND role = 'admin'", (admin_id,))
+        return cursor.fetchone() is not None
+
+token_service = TokenService(
+    os.getenv("SECRET_KEY", "dev-key-12345"),
+    ttl=int(os.getenv("ACCESS_TOKEN_TTL", str(12 * 3600))),
+    is_revoked=_is_token_revoked,
+)
+# Limite ai tentativi di login, per IP e per username (vedi api/rate_limit.py)
+login_throttle = LoginThrottle.from_env()
+
+def _busy_response():
+    """503 con Retry-After quando il pool di hashing password ha la coda piena."""
+    response = jsonify({"error": "Servizio momentaneamente sovraccarico, riprova tra poco"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+# Il vecchio controllo sull'admin_id senza token va attivato esplicitamente (AUTH_LEGACY_ADMIN_ID=1),
+# solo finché il frontend non invia il token
+token_auth = TokenAuth(
+    token_service,
+    legacy_admin_check=_is_admin if os.getenv("AUTH_LEGACY_ADMIN_ID", "0") == "1" else None,
+)
+
+# /metrics e /api/debug/*: disattivati salvo DEBUG_ENDPOINTS=1, e comunque solo con il token di un admin
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "0") == "1"
+debug_endpoint = token_auth.debug_required(lambda: DEBUG_ENDPOINTS)
+
+# Paginazione del calendario (numero di appuntamenti per pagina)
+CALENDAR_DEFAULT_LIMIT = 500
+CALENDAR_MAX_LIMIT = 2000
+
+# Ampiezza massima della finestra per la ricerca di orari liberi
+OPENINGS_MAX_WINDOW = timedelta(days=62)
+
+# Import massivo: righe per file e per transazione
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "10000"))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+
+# Prenotazioni atomiche: durata massima di un appuntamento (limita la query di sovrapposizione)
+booking_engine = BookingEngine(max_duration=timedelta(hours=int(os.getenv("BOOKING_MAX_DURATION_HOURS", "12"))))
+# Prenotazioni temporanee: durata in secondi (default / massima) e hold attive per cliente
+hold_service = HoldService(
+    booking_engine,
+    default_ttl=int(os.getenv("HOLD_TTL", "120")),
+    max_ttl=int(os.getenv("HOLD_MAX_TTL", "900")),
+    max_per_client=int(os.getenv("HOLD_MAX_PER_CLIENT", "3")),
+)
+
+# Cache delle liste operatori/clienti per admin (vedi api/directory_cache.py)
+directory_cache = DirectoryCache.from_env(view="api")
+
+# GET condizionali (ETag / 304) su calendario e liste admin (vedi api/conditional.py)
+conditional_get = ConditionalGet(get_db)
+
+# Eventi di modifica per SSE / long-poll (vedi api/change_events.py)
+change_hub = ChangeHub(
+    get_db,
+    poll_interval=float(os.getenv("CHANGE_EVENTS_POLL_INTERVAL", "1")),
+    retention=int(os.getenv("CHANGE_EVENTS_RETENTION", str(24 * 3600))),
+)
+# Durata massima di uno stream SSE (poi il browser si riconnette con Last-Event-ID),
+# intervallo dei keep-alive e attesa massima del long-poll, in secondi
+EVENTS_STREAM_SECONDS = int(os.getenv("CHANGE_EVENTS_STREAM_SECONDS", "55"))
+EVENTS_HEARTBEAT = 15
+EVENTS_POLL_MAX = 25
+
+# Promemoria: anticipi in minuti (default 24 ore e 2 ore prima dell'appuntamento)
+reminder_scheduler = ReminderScheduler(
+    lead_times=parse_lead_times(os.getenv("REMINDER_LEAD_TIMES", "1440,120")),
+    batch_size=int(os.getenv("REMINDER_BATCH_SIZE", "200")),
+)
 
 # =============================
 #  R O U T E   D I   T E S T
@@ -65,6 +171,30 @@ def index_root():
 def index_api():
     return jsonify({"message": "Benvenuto nell'API!"})
 
+@app.route("/api/debug/startup")
+@debug_endpoint
+def startup_stats():
+    """Profilo del cold start di questo processo (fasi, prima connessione, prima richiesta)."""
+    return jsonify(startup.report()), 200
+
+@app.route("/metrics")
+@debug_endpoint
+def metrics():
+    """Istogrammi per rotta in formato Prometheus."""
+    return Response(request_metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/debug/requests")
+@debug_endpoint
+def request_metrics_summary():
+    """Rotte ordinate per query medie per richiesta (per trovare gli N+1)."""
+    return jsonify(request_metrics.summary()), 200
+
+@app.route("/api/debug/db-pool")
+@debug_endpoint
+def db_pool_stats():
+    """Contatori del pool di connessioni (hit / miss / wait)."""
+    return jsonify(db_pool.stats()), 200
+
 # =============================
 #  A U T H   R O U T E S
 # =============================
@@ -88,8 +218,7 @@ def register():
             return jsonify({"error": "Campi obbligatori mancanti"}), 400
 
         # Connetti DB
-        conn = get_db()
-        try:
+        with get_db() as conn:
             with conn.cursor() as cursor:
                 # Verifica duplicati
                 cursor.execute("""
@@ -101,8 +230,8 @@ def register():
                 if cursor.fetchone():
                     return jsonify({"error": "Username o email già esistenti"}), 400
 
-                # Crea utente
-                hashed = generate_password_hash(data["password"], method="scrypt")
+                # Crea utente (scrypt nel pool di processi condiviso, vedi api/passwords.py)
+                hashed = get_hasher().hash(data["password"])
                 cursor.execute("""
                     INSERT INTO users (username, password_hash, email, phone, role, admin_id)
                     VALUES (%s, %s, %s, %s, %s, %s)
@@ -116,6 +245,7 @@ def register():
                 ))
                 conn.commit()
                 new_user_id = cursor.lastrowid
+            directory_cache.invalidate(data.get("admin_id"))
 
             logger.info(f"Registrazione completata in {time.time() - start_time:.2f} secondi")
             return jsonify({
@@ -128,9 +258,8 @@ def register():
                 }
             }), 201
 
-        finally:
-            conn.close()
-
+    except HasherBusy:
+        return _busy_response()
     except Exception as e:
         logger.error(f"Errore registrazione: {str(e)}")
         return jsonify({"error": "Errore durante la registrazione"}), 500
@@ -149,8 +278,14 @@ def login():
         if not data or "username" not in data or "password" not in data:
             return jsonify({"error": "Credenziali mancanti"}), 400
 
-        conn = get_db()
-        try:
+        # Prima di qualsiasi query o hash
+        retry_after = login_throttle.check(data["username"], client_ip(request))
+        if retry_after:
+            response = jsonify({"error": "Troppi tentativi di login, riprova più tardi"})
+            response.headers["Retry-After"] = str(retry_after)
+            return response, 429
+
+        with get_db() as conn:
             with conn.cursor(pymysql.cursors.DictCursor) as cursor:
                 cursor.execute("""
                     SELECT id, username, password_hash, email, role, admin_id, phone
@@ -160,11 +295,21 @@ def login():
                 """, (data["username"],))
                 user = cursor.fetchone()
 
-            if not user or not check_password_hash(user["password_hash"], data["password"]):
+            valid, new_hash = (get_hasher().verify_and_update(user["password_hash"], data["password"])
+                               if user else (False, None))
+            if not valid:
                 return jsonify({"error": "Credenziali non valide"}), 401
+            login_throttle.reset_user(data["username"])
+            if new_hash:
+                # Rehash pigro: parametri di hashing cambiati (PASSWORD_HASH_METHOD)
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user["id"]))
+                conn.commit()
 
             logger.info(f"Login completato in {time.time() - start_time:.2f} secondi")
             return jsonify({
+                "token": token_service.issue(user["id"], user["role"], tenant_of(user)),
+                "expires_in": token_service.ttl,
                 "user": {
                     "id": user["id"],
                     "username": user["username"],
@@ -175,132 +320,124 @@ def login():
                 }
             }), 200
 
-        finally:
-            conn.close()
-
+    except HasherBusy:
+        return _busy_response()
     except Exception as e:
         logger.error(f"Errore login: {str(e)}")
         return jsonify({"error": "Errore durante il login"}), 500
 
+@app.route("/api/auth/logout", methods=["POST"])
+def logout():
+    """Revoca il token della richiesta (Authorization: Bearer ...)."""
+    token = bearer_token()
+    if not token:
+        return jsonify({"error": "Token mancante"}), 401
+    try:
+        claims = token_service.decode(token)
+        with get_db() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT IGNORE INTO revoked_tokens (jti, user_id, expires_at)
+                VALUES (%s, %s, %s)
+            """, (claims["jti"], claims["sub"], datetime.now() + timedelta(seconds=token_service.ttl)))
+            conn.commit()
+        token_service.mark_revoked(claims["jti"])
+        return jsonify({"message": "Logout effettuato"}), 200
+
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 401
+    except Exception as e:
+        logger.error(f"Errore logout: {str(e)}")
+        return jsonify({"error": "Errore durante il logout"}), 500
+
+@app.route("/api/debug/login-throttle")
+@debug_endpoint
+def login_throttle_stats():
+    """Tentativi di login consentiti / rifiutati."""
+    return jsonify(login_throttle.stats()), 200
+
+@app.route("/api/debug/password-hasher")
+@debug_endpoint
+def password_hasher_metrics():
+    """Contatori e latenze del pool di hashing password."""
+    return jsonify(get_hasher().metrics()), 200
+
+@app.route("/api/debug/tokens")
+@debug_endpoint
+def token_cache_stats():
+    """Contatori della cache delle revoche."""
+    return jsonify(token_service.revocations.stats()), 200
+
 # =============================
 #  C A L E N D A R   ( T U T T I )
 # =============================
 @app.route("/api/calendar/<int:user_id>", methods=["GET"])
+@conditional_get.versioned(calendar_version)
 def get_calendar_data(user_id):
-    """Recupera tutti gli eventi (slot + appuntamenti) in base al ruolo dell'utente."""
+    """
+    Recupera gli eventi (slot + appuntamenti) in base al ruolo dell'utente.
+    Query string opzionale:
+      - from / to:    finestra ISO (es. 2025-01-13T00:00:00), appuntamenti
+                      che iniziano in [from, to)
+      - operator_id:  filtro per operatore (ripetibile)
+      - limit:        appuntamenti per pagina (max CALENDAR_MAX_LIMIT)
+      - cursor:       valore di next_cursor della pagina precedente
+    """
     logger.info(f"Richiesta calendario per user_id: {user_id}")
     try:
-        conn = get_db()
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            # Ruolo utente
-            cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            if not user:
-                return jsonify({"error": "Utente non trovato"}), 404
-
-            # Se admin => tutti gli slot e tutti gli appuntamenti
-            # Se operator => solo i suoi
-            # Se client => slot approved + i propri appuntamenti
-            if user['role'] == "admin":
-                cursor.execute("SELECT * FROM slots")
-                slots = cursor.fetchall()
-                cursor.execute("SELECT * FROM appointments")
-                appointments = cursor.fetchall()
-            elif user['role'] == "operator":
-                cursor.execute("SELECT * FROM slots WHERE operator_id = %s", (user_id,))
-                slots = cursor.fetchall()
-                cursor.execute("SELECT * FROM appointments WHERE operator_id = %s", (user_id,))
-                appointments = cursor.fetchall()
-            else:  # client
-                cursor.execute("SELECT * FROM slots WHERE status = 'approved'")
-                slots = cursor.fetchall()
-                cursor.execute("SELECT * FROM appointments WHERE client_id = %s", (user_id,))
-                appointments = cursor.fetchall()
-
-            events = []
-            now = datetime.now()
-
-            # Trasforma slot in eventi
-            for slot in slots:
-                cursor.execute("SELECT username FROM users WHERE id = %s", (slot['operator_id'],))
-                operator = cursor.fetchone()
-
-                # Calcola data concreta (partendo dal day_of_week rispetto ad oggi)
-                diff = slot['day_of_week'] - now.weekday()
-                if diff < 0:
-                    diff += 7
-                base_date = now.date() + timedelta(days=diff)
-                start_dt = datetime.combine(base_date, slot['start_time'])
-                end_dt = datetime.combine(base_date, slot['end_time'])
-
-                events.append({
-                    "type": "slot",
-                    "id": f"slot-{slot['id']}",
-                    "slot_id": slot['id'],
-                    "operator_id": slot['operator_id'],
-                    "operator_name": operator['username'] if operator else "???",
-                    "start_time": start_dt.isoformat(),
-                    "end_time": end_dt.isoformat(),
-                    "status": slot['status']
-                })
-
-            # Trasforma appuntamenti in eventi
-            for appt in appointments:
-                # Recupera utente client e operatore
-                cursor.execute("""
-                    SELECT id, username FROM users
-                    WHERE id IN (%s, %s)
-                """, (appt['client_id'], appt['operator_id']))
-                users_data = cursor.fetchall()
-
-                def find_username(uid):
-                    for u in users_data:
-                        if u['id'] == uid:
-                            return u['username']
-                    return "???"
-
-                clientName = find_username(appt['client_id'])
-                operatorName = find_username(appt['operator_id'])
-
-                events.append({
-                    "type": "appointment",
-                    "id": appt['id'],
-                    "client_id": appt['client_id'],
-                    "operator_id": appt['operator_id'],
-                    "clientName": clientName,
-                    "operatorName": operatorName,
-                    "start_time": appt['start_time'].isoformat(),
-                    "end_time": appt['end_time'].isoformat(),
-                    "service_type": appt['service_type'],
-                    "status": appt['status']
-                })
-
-        return jsonify({"events": events}), 200
+        start = _parse_datetime_arg("from")
+        end = _parse_datetime_arg("to")
+        operator_ids = [int(v) for v in request.args.getlist("operator_id")]
+        limit = request.args.get("limit", type=int)
+        if limit is not None:
+            limit = max(1, min(limit, CALENDAR_MAX_LIMIT))
+        elif start is not None or end is not None:
+            limit = CALENDAR_DEFAULT_LIMIT
+        page_cursor = request.args.get("cursor")
+        if page_cursor:
+            decode_cursor(page_cursor)
+    except ValueError as e:
+        return jsonify({"error": f"Parametri non validi: {e}"}), 400
+
+    try:
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            result = build_calendar_events(
+                cursor, user_id, start=start, end=end,
+                operator_ids=operator_ids, page_cursor=page_cursor, limit=limit
+            )
+        if result is None:
+            return jsonify({"error": "Utente non trovato"}), 404
+
+        events, next_cursor = result
+        return jsonify({"events": events, "next_cursor": next_cursor}), 200
 
     except Exception as e:
         logger.error(f"Errore calendario: {str(e)}")
         return jsonify({"error": "Errore durante il recupero del calendario"}), 500
 
+def _parse_datetime_arg(name):
+    """Legge un parametro datetime ISO dalla query string (None se assente)."""
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
 # =============================
 #  A D M I N   R O U T E S
 # =============================
 @app.route("/api/admin/operators/<int:admin_id>", methods=["GET"])
+@token_auth.admin_required
+@conditional_get.versioned(tenant_version)
 def get_operators(admin_id):
     """Lista operatori per admin_id."""
-    try:
-        conn = get_db()
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            # Verifica che admin_id corrisponda a un admin
-            cursor.execute("SELECT id FROM users WHERE id = %s AND role = 'admin'", (admin_id,))
-            if not cursor.fetchone():
-                return jsonify({"error": "Non autorizzato"}), 403
-
+    def load():
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
             cursor.execute("""
                 SELECT id, username, email, phone, specialization
                 FROM users
                 WHERE admin_id = %s AND role = 'operator'
             """, (admin_id,))
-            operators = cursor.fetchall()
+            return cursor.fetchall()
+
+    try:
+        operators = directory_cache.get_or_load(admin_id, "operators", load)
 
         return jsonify({"operators": operators}), 200
 
@@ -309,21 +446,21 @@ def get_operators(admin_id):
         return jsonify({"error": "Errore durante il recupero degli operatori"}), 500
 
 @app.route("/api/admin/clients/<int:admin_id>", methods=["GET"])
+@token_auth.admin_required
+@conditional_get.versioned(tenant_version)
 def get_clients(admin_id):
     """Lista clienti per admin_id."""
-    try:
-        conn = get_db()
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute("SELECT id FROM users WHERE id = %s AND role = 'admin'", (admin_id,))
-            if not cursor.fetchone():
-                return jsonify({"error": "Non autorizzato"}), 403
-
+    def load():
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
             cursor.execute("""
                 SELECT id, username, email, phone
                 FROM users
                 WHERE admin_id = %s AND role = 'client'
             """, (admin_id,))
-            clients = cursor.fetchall()
+            return cursor.fetchall()
+
+    try:
+        clients = directory_cache.get_or_load(admin_id, "clients", load)
 
         return jsonify({"clients": clients}), 200
 
@@ -332,6 +469,7 @@ def get_clients(admin_id):
         return jsonify({"error": "Errore durante il recupero dei clienti"}), 500
 
 @app.route("/api/admin/operators/add", methods=["POST"])
+@token_auth.admin_required
 def add_operator():
     """Aggiunge un nuovo operatore (role=operator) per un dato admin_id."""
     try:
@@ -339,14 +477,7 @@ def add_operator():
         if not data:
             return jsonify({"error": "Dati mancanti"}), 400
 
-        conn = get_db()
-        with conn.cursor() as cursor:
-            # Verifica admin
-            cursor.execute("SELECT id FROM users WHERE id = %s AND role = 'admin'",
-                           (data.get('admin_id'),))
-            if not cursor.fetchone():
-                return jsonify({"error": "Non autorizzato"}), 403
-
+        with get_db() as conn, conn.cursor() as cursor:
             # Verifica duplicati
             cursor.execute("""
                 SELECT username FROM users
@@ -356,7 +487,7 @@ def add_operator():
                 return jsonify({"error": "Username o email già esistenti"}), 400
 
             # Crea operatore
-            hashed = generate_password_hash(data['password'], method="scrypt")
+            hashed = get_hasher().hash(data['password'])
             cursor.execute("""
                 INSERT INTO users (username, password_hash, email, phone, role, admin_id, specialization)
                 VALUES (%s, %s, %s, %s, 'operator', %s, %s)
@@ -365,147 +496,288 @@ def add_operator():
                 hashed,
                 data['email'],
                 data.get('phone', ''),
-                data['admin_id'],
+                g.admin_id,
                 data.get('specialization', '')
             ))
             conn.commit()
+        directory_cache.invalidate(g.admin_id, "operators")
 
         return jsonify({"message": "Operatore creato con successo"}), 200
 
+    except HasherBusy:
+        return _busy_response()
     except Exception as e:
         logger.error(f"Errore creazione operatore: {str(e)}")
         return jsonify({"error": "Errore durante la creazione dell'operatore"}), 500
 
 @app.route("/api/admin/appointments", methods=["POST"])
 def add_appointment():
-    """Crea un nuovo appuntamento (admin)."""
+    """
+    Crea un nuovo appuntamento (admin). Controllo di sovrapposizione e
+    inserimento sono atomici (api/booking.py): in caso di conflitto 409.
+    """
     try:
         data = request.get_json() or {}
         if not data:
             return jsonify({"error": "Dati mancanti"}), 400
-
-        conn = get_db()
-        with conn.cursor() as cursor:
-            # Controllo su operator_id e client_id
-            cursor.execute("""
-                SELECT id, phone FROM users
-                WHERE id IN (%s, %s)
-            """, (data['operator_id'], data['client_id']))
-            found = cursor.fetchall()
-            if len(found) != 2:
-                return jsonify({"error": "Operatore o cliente non valido"}), 400
-
-            cursor.execute("""
-                INSERT INTO appointments (operator_id, client_id, start_time,
-                                          end_time, service_type, created_at)
-                VALUES (%s, %s, %s, %s, %s, NOW())
-            """, (
-                data['operator_id'],
-                data['client_id'],
-                data['start_time'],
-                data['end_time'],
-                data.get('service_type', '')
-            ))
-            conn.commit()
-
-            # Simula notifica WhatsApp
-            client_phone = None
-            for row in found:
-                if row[0] == data['client_id']:
-                    client_phone = row[1]
-            if client_phone:
-                logger.info(f"[FAKE] Invio WhatsApp a {client_phone}: Nuovo appuntamento creato")
-
-        return jsonify({"message": "Appuntamento creato con successo"}), 200
-
+        missing = [k for k in ("operator_id", "client_id", "start_time", "end_time") if k not in data]
+        if missing:
+            return jsonify({"error": f"Campi mancanti: {', '.join(missing)}"}), 400
+
+        with get_db() as conn:
+            booked = booking_engine.book(
+                conn, int(data["operator_id"]), int(data["client_id"]),
+                data["start_time"], data["end_time"], data.get("service_type", ""),
+                admin_id=int(data["admin_id"]) if data.get("admin_id") is not None else None,
+                on_booked=_announce_booking(operator_id=int(data["operator_id"]),
+                                            client_id=int(data["client_id"]),
+                                            service_type=data.get("service_type", ""))
+            )
+            if booked["client_phone"]:
+                reminder_scheduler.schedule(conn, booked["id"], booked["start_time"], booked["client_phone"])
+        change_hub.wake()
+
+        # Simula notifica WhatsApp
+        if booked["client_phone"]:
+            logger.info(f"[FAKE] Invio WhatsApp a {booked['client_phone']}: Nuovo appuntamento creato")
+
+        return jsonify({"message": "Appuntamento creato con successo",
+                        "appointment": {"id": booked["id"]}}), 200
+
+    except BookingConflict as e:
+        return jsonify({"error": str(e), "conflict_id": e.conflict_id}), 409
+    except BookingError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         logger.error(f"Errore creazione appuntamento: {str(e)}")
         return jsonify({"error": "Errore durante la creazione dell'appuntamento"}), 500
 
+def _announce_booking(**fields):
+    """on_booked di book / confirm: evento appointment.created nella stessa transazione."""
+    def announce(cursor, booked):
+        publish_appointment(cursor, "appointment.created",
+                            {"status": "pending", **fields, **booked}, booked["admin_id"])
+    return announce
+
 @app.route("/api/admin/appointments/<int:appointment_id>", methods=["PUT", "DELETE"])
 def manage_appointment_by_id(appointment_id):
-    """Aggiorna o elimina un singolo appuntamento (admin)."""
+    """
+    Aggiorna o elimina un singolo appuntamento (admin). Se cambiano gli
+    orari (o un appuntamento annullato viene riattivato) la sovrapposizione
+    viene verificata sotto lock dell'operatore, come in add_appointment.
+    """
     try:
-        conn = get_db()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM appointments WHERE id = %s", (appointment_id,))
-            if not cursor.fetchone():
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT a.id, a.operator_id, a.client_id, a.start_time, a.end_time,
+                       a.service_type, a.status, op.admin_id
+                FROM appointments a
+                LEFT JOIN users op ON op.id = a.operator_id
+                WHERE a.id = %s
+            """, (appointment_id,))
+            appointment = cursor.fetchone()
+            if not appointment:
                 return jsonify({"error": "Appuntamento non trovato"}), 404
 
             if request.method == "DELETE":
                 # Elimina
                 cursor.execute("DELETE FROM appointments WHERE id = %s", (appointment_id,))
+                publish_appointment(cursor, "appointment.deleted", appointment, appointment["admin_id"])
                 conn.commit()
+                change_hub.wake()
                 return jsonify({"message": "Appuntamento eliminato"}), 200
 
             # Se PUT => aggiorna
             data = request.get_json() or {}
-            updates = []
-            params = []
-
-            if 'start_time' in data:
-                updates.append("start_time = %s")
-                params.append(data['start_time'])
-            if 'end_time' in data:
-                updates.append("end_time = %s")
-                params.append(data['end_time'])
+            changes = {}
+
+            if 'start_time' in data or 'end_time' in data or 'status' in data:
+                start, end = booking_engine.check_reschedule(
+                    cursor, appointment, data.get('start_time'), data.get('end_time'), data.get('status'))
+                if 'start_time' in data:
+                    changes['start_time'] = start
+                if 'end_time' in data:
+                    changes['end_time'] = end
             if 'service_type' in data:
-                updates.append("service_type = %s")
-                params.append(data['service_type'])
+                changes['service_type'] = data['service_type']
             if 'status' in data:
-                updates.append("status = %s")
-                params.append(data['status'])
+                changes['status'] = data['status']
 
-            if updates:
-                query = f"UPDATE appointments SET {', '.join(updates)} WHERE id = %s"
-                params.append(appointment_id)
-                cursor.execute(query, tuple(params))
+            if changes:
+                query = f"UPDATE appointments SET {', '.join(f'{column} = %s' for column in changes)} WHERE id = %s"
+                cursor.execute(query, (*changes.values(), appointment_id))
+                publish_appointment(cursor, "appointment.updated", {**appointment, **changes},
+                                    appointment["admin_id"])
                 conn.commit()
+                change_hub.wake()
 
         return jsonify({"message": "Appuntamento aggiornato"}), 200
 
+    except BookingConflict as e:
+        return jsonify({"error": str(e), "conflict_id": e.conflict_id}), 409
+    except BookingError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         logger.error(f"Errore gestione appuntamento: {str(e)}")
         return jsonify({"error": "Errore durante la gestione dell'appuntamento"}), 500
 
 @app.route("/api/admin/send-reminders", methods=["POST"])
 def send_reminders():
-    """Simula l'invio di reminder WhatsApp per appuntamenti di domani."""
+    """
+    Esegue un giro dello scheduler dei promemoria (pensato per un cron):
+    accoda in notification_outbox i promemoria scaduti non ancora inviati.
+    """
     try:
-        tomorrow = datetime.now() + timedelta(days=1)
-        start_tomorrow = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_tomorrow = tomorrow.replace(hour=23, minute=59, second=59, microsecond=999999)
+        with get_db() as conn:
+            fired = reminder_scheduler.tick(conn)
 
-        conn = get_db()
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute("""
-                SELECT a.start_time, u.phone
-                FROM appointments a
-                JOIN users u ON a.client_id = u.id
-                WHERE a.start_time BETWEEN %s AND %s
-                  AND u.phone IS NOT NULL
-            """, (start_tomorrow, end_tomorrow))
-            appointments = cursor.fetchall()
-
-            for appt in appointments:
-                orario = appt['start_time'].strftime('%H:%M')
-                logger.info(f"[FAKE] Reminder a {appt['phone']}: Appuntamento domani alle {orario}")
-
-        return jsonify({"message": "Notifiche inviate"}), 200
+        return jsonify({"message": "Notifiche inviate", "sent": fired,
+                        "scheduler": reminder_scheduler.stats()}), 200
 
     except Exception as e:
         logger.error(f"Errore invio reminder: {str(e)}")
         return jsonify({"error": "Errore durante l'invio dei reminder"}), 500
 
+@app.route("/api/debug/booking")
+@debug_endpoint
+def booking_stats():
+    """Prenotazioni riuscite, conflitti, transazioni ritentate e hold."""
+    return jsonify({**booking_engine.stats(), "holds": hold_service.stats()}), 200
+
+@app.route("/api/debug/directory-cache")
+@debug_endpoint
+def directory_cache_stats():
+    """Hit rate della cache di operatori e clienti."""
+    return jsonify(directory_cache.stats()), 200
+
+@app.route("/api/debug/conditional")
+@debug_endpoint
+def conditional_stats():
+    """Richieste GET condizionali e risposte 304."""
+    return jsonify(conditional_get.stats()), 200
+
+@app.route("/api/debug/reminders")
+@debug_endpoint
+def reminders_stats():
+    """Ultima finestra elaborata e promemoria inviati da questa istanza."""
+    return jsonify(reminder_scheduler.stats()), 200
+
+# =============================
+#  I M P O R T
+# =============================
+@app.route("/api/admin/import/<kind>", methods=["POST"])
+@token_auth.admin_required
+def import_data(kind):
+    """
+    Import massivo (kind = operators | clients | appointments) per un admin.
+    Corpo: file CSV (con intestazione) o NDJSON, una riga per record.
+    Query string:
+      - admin_id:  obbligatorio senza token (con il token è quello del token)
+      - format:    csv | ndjson (default: dal Content-Type, altrimenti csv)
+      - dry_run:   1 per validare senza inserire
+    Risponde con un report per riga (vedi api/bulk_import.py).
+    """
+    # Import locale: csv e il pool di hashing servono solo qui, non a ogni cold start
+    import bulk_import
+
+    if kind not in bulk_import.KINDS:
+        return jsonify({"error": "Import non disponibile"}), 404
+    admin_id = g.admin_id
+    fmt = request.args.get("format") or ("ndjson" if "ndjson" in (request.content_type or "") else "csv")
+    if fmt not in bulk_import.FORMATS:
+        return jsonify({"error": "Formato non valido (csv o ndjson)"}), 400
+
+    try:
+        rows = bulk_import.parse_rows(request.get_data(as_text=True), fmt, IMPORT_MAX_ROWS)
+    except bulk_import.ImportFileError as e:
+        return jsonify({"error": str(e)}), 400
+    if not rows:
+        return jsonify({"error": "Nessuna riga da importare"}), 400
+
+    try:
+        with get_db() as conn:
+            report = bulk_import.run_import(
+                conn, kind, admin_id, rows,
+                chunk_size=IMPORT_CHUNK_SIZE,
+                dry_run=request.args.get("dry_run") in ("1", "true"),
+                booking_engine=booking_engine
+            )
+        if kind in ("operators", "clients") and not report.get("dry_run"):
+            directory_cache.invalidate(admin_id, kind)
+        return jsonify(report), 200
+
+    except HasherBusy:
+        return _busy_response()
+    except Exception as e:
+        logger.error(f"Errore import {kind}: {str(e)}")
+        return jsonify({"error": "Errore durante l'import"}), 500
+
+# =============================
+#  E X P O R T
+# =============================
+@app.route("/api/admin/export/<kind>", methods=["GET"])
+@token_auth.admin_required
+def export_data(kind):
+    """
+    Export in streaming di appuntamenti o slot (kind = appointments | slots)
+    dell'admin autenticato: il tenant è quello del token (un admin_id
+    diverso nella query string riceve 403).
+    Query string opzionale:
+      - format:       ndjson (default) | csv
+      - operator_id (ripetibile), status, client_id
+      - from / to:    finestra ISO su start_time (solo appuntamenti)
+      - day_of_week:  solo slot
+      - gzip:         1 per comprimere la risposta (Content-Encoding: gzip)
+    """
+    from exports import EXPORTS, FORMATS, ExportStream, build_export_query, export_chunks
+
+    if kind not in EXPORTS:
+        return jsonify({"error": "Export non disponibile"}), 404
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in FORMATS:
+        return jsonify({"error": "Formato non valido (ndjson o csv)"}), 400
+    try:
+        sql, params = build_export_query(
+            kind,
+            admin_id=g.admin_id,
+            operator_ids=[int(v) for v in request.args.getlist("operator_id")],
+            status=request.args.get("status"),
+            client_id=request.args.get("client_id", type=int),
+            start=_parse_datetime_arg("from"),
+            end=_parse_datetime_arg("to"),
+            day_of_week=request.args.get("day_of_week", type=int),
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Parametri non validi: {e}"}), 400
+
+    compress = request.args.get("gzip") in ("1", "true")
+    try:
+        stream = ExportStream(db_pool, sql, params)
+    except Exception as e:
+        logger.error(f"Errore export {kind}: {str(e)}")
+        return jsonify({"error": "Errore durante l'export"}), 500
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{kind}.{fmt}"',
+        "X-Accel-Buffering": "no"
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    response = Response(stream_with_context(export_chunks(stream, kind, fmt, compress)),
+                        mimetype=mimetype, headers=headers)
+    response.call_on_close(stream.close)
+    return response
+
 # =============================
 #  A D M I N   S L O T S
 # =============================
 @app.route("/api/admin/slots/pending", methods=["GET"])
+@conditional_get.versioned(global_version)
 def get_pending_slots():
     """Restituisce la lista degli slot con status = 'pending'."""
     try:
-        conn = get_db()
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
             cursor.execute("""
                 SELECT id, operator_id, client_id, day_of_week,
                        start_time, end_time, status
@@ -532,25 +804,157 @@ def manage_slot(slot_id, action):
         return jsonify({"error": "Azione non valida"}), 400
 
     try:
-        conn = get_db()
-        with conn.cursor() as cursor:
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
             new_status = 'approved' if action == 'approve' else 'rejected'
             cursor.execute("""
                 UPDATE slots
                 SET status = %s
                 WHERE id = %s AND status = 'pending'
             """, (new_status, slot_id))
-            conn.commit()
-
             if cursor.rowcount == 0:
                 return jsonify({"error": "Slot non trovato o non più pending"}), 404
 
+            cursor.execute("""
+                SELECT s.id, s.operator_id, s.client_id, s.day_of_week,
+                       s.start_time, s.end_time, s.status, op.admin_id
+                FROM slots s
+                LEFT JOIN users op ON op.id = s.operator_id
+                WHERE s.id = %s
+            """, (slot_id,))
+            slot = cursor.fetchone()
+            publish_slot(cursor, f"slot.{new_status}", slot, slot["admin_id"])
+            conn.commit()
+        slot_expander.invalidate(slot["operator_id"])
+        change_hub.wake()
+
         return jsonify({"message": f"Slot {action}d con successo"}), 200
 
     except Exception as e:
         logger.error(f"Errore gestione slot: {str(e)}")
         return jsonify({"error": f"Errore durante {action} dello slot"}), 500
 
+@app.route("/api/admin/slot-exceptions", methods=["POST"])
+@token_auth.admin_required
+def add_slot_exception():
+    """
+    Registra un'eccezione alle ricorrenze degli slot dell'admin:
+      - slot_id      => annulla una singola occorrenza
+      - operator_id  => giorno di chiusura di un operatore
+      - nessuno      => festività per tutto lo studio
+    JSON: {"admin_id": 1, "exception_date": "2025-12-25", "slot_id": 3, "reason": "..."}
+    """
+    try:
+        data = request.get_json() or {}
+        if not data or "exception_date" not in data:
+            return jsonify({"error": "Dati mancanti"}), 400
+        exception_date = datetime.fromisoformat(data["exception_date"]).date()
+
+        with get_db() as conn, conn.cursor() as cursor:
+            # Slot / operatore devono appartenere all'admin
+            if data.get('slot_id'):
+                cursor.execute("""
+                    SELECT s.id FROM slots s
+                    JOIN users op ON op.id = s.operator_id
+                    WHERE s.id = %s AND op.admin_id = %s
+                """, (data['slot_id'], g.admin_id))
+                if not cursor.fetchone():
+                    return jsonify({"error": "Slot non valido"}), 400
+            elif data.get('operator_id'):
+                cursor.execute("""
+                    SELECT id FROM users
+                    WHERE id = %s AND admin_id = %s AND role = 'operator'
+                """, (data['operator_id'], g.admin_id))
+                if not cursor.fetchone():
+                    return jsonify({"error": "Operatore non valido"}), 400
+
+            cursor.execute("""
+                INSERT INTO slot_exceptions (admin_id, operator_id, slot_id,
+                                             exception_date, reason)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (
+                g.admin_id,
+                None if data.get('slot_id') else data.get('operator_id'),
+                data.get('slot_id'),
+                exception_date,
+                data.get('reason', '')
+            ))
+            conn.commit()
+            exception_id = cursor.lastrowid
+
+        return jsonify({"message": "Eccezione registrata", "id": exception_id}), 201
+
+    except ValueError:
+        return jsonify({"error": "Data non valida"}), 400
+    except Exception as e:
+        logger.error(f"Errore creazione eccezione slot: {str(e)}")
+        return jsonify({"error": "Errore durante la creazione dell'eccezione"}), 500
+
+@app.route("/api/admin/slot-exceptions/<int:exception_id>", methods=["DELETE"])
+@token_auth.admin_required
+def delete_slot_exception(exception_id):
+    """Elimina un'eccezione. JSON: {"admin_id": 1}"""
+    try:
+        with get_db() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM slot_exceptions
+                WHERE id = %s AND admin_id = %s
+            """, (exception_id, g.admin_id))
+            conn.commit()
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Eccezione non trovata"}), 404
+
+        return jsonify({"message": "Eccezione eliminata"}), 200
+
+    except Exception as e:
+        logger.error(f"Errore eliminazione eccezione slot: {str(e)}")
+        return jsonify({"error": "Errore durante l'eliminazione dell'eccezione"}), 500
+
+# =============================
+#  D I S P O N I B I L I T A'
+# =============================
+@app.route("/api/availability/openings", methods=["GET"])
+def get_openings():
+    """
+    Primi N orari liberi (slot approvati meno appuntamenti).
+    Query string:
+      - duration:        durata del servizio in minuti (obbligatorio)
+      - from / to:       finestra ISO (default: da adesso per 7 giorni)
+      - operator_id:     filtro per operatore (ripetibile)
+      - specialization:  filtro per specializzazione dell'operatore
+      - admin_id:        solo gli operatori di questo admin
+      - limit:           numero di orari (default 10, max 100)
+      - step:            minuti tra due orari proposti (default = duration)
+    """
+    try:
+        duration = request.args.get("duration", type=int)
+        if not duration or duration <= 0:
+            return jsonify({"error": "Parametro duration mancante o non valido"}), 400
+        start = _parse_datetime_arg("from") or datetime.now().replace(second=0, microsecond=0)
+        end = _parse_datetime_arg("to") or start + timedelta(days=7)
+        if end <= start or end - start > OPENINGS_MAX_WINDOW:
+            return jsonify({"error": "Finestra temporale non valida"}), 400
+        operator_ids = [int(v) for v in request.args.getlist("operator_id")]
+        limit = max(1, min(request.args.get("limit", 10, type=int), 100))
+        step = request.args.get("step", type=int)
+    except ValueError as e:
+        return jsonify({"error": f"Parametri non validi: {e}"}), 400
+
+    try:
+        with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            openings = find_openings(
+                cursor, start, end, timedelta(minutes=duration), limit=limit,
+                step=timedelta(minutes=step) if step and step > 0 else None,
+                operator_ids=operator_ids,
+                specialization=request.args.get("specialization"),
+                admin_id=request.args.get("admin_id", type=int),
+                booking_engine=booking_engine
+            )
+        return jsonify({"openings": openings}), 200
+
+    except Exception as e:
+        logger.error(f"Errore ricerca disponibilità: {str(e)}")
+        return jsonify({"error": "Errore durante la ricerca della disponibilità"}), 500
+
 # =============================
 #  C L I E N T   S L O T S
 # =============================
@@ -562,14 +966,14 @@ def request_slot():
         if not data:
             return jsonify({"error": "Dati mancanti"}), 400
 
-        conn = get_db()
-        with conn.cursor() as cursor:
+        with get_db() as conn, conn.cursor() as cursor:
             # Verifica esistenza client e operator
             cursor.execute("""
-                SELECT id FROM users
+                SELECT id, admin_id FROM users
                 WHERE id IN (%s, %s)
             """, (data['client_id'], data['operator_id']))
-            if len(cursor.fetchall()) != 2:
+            users = dict(cursor.fetchall())
+            if len(users) != 2:
                 return jsonify({"error": "Client o operator non valido"}), 400
 
             # Crea slot in stato pending
@@ -584,7 +988,18 @@ def request_slot():
                 data['start_time'],
                 data['end_time']
             ))
+            publish_slot(cursor, "slot.requested", {
+                "id": cursor.lastrowid,
+                "operator_id": int(data['operator_id']),
+                "client_id": int(data['client_id']),
+                "day_of_week": int(data['day_of_week']),
+                "start_time": data['start_time'],
+                "end_time": data['end_time'],
+                "status": "pending"
+            }, users[int(data['operator_id'])])
             conn.commit()
+        slot_expander.invalidate(int(data['operator_id']))
+        change_hub.wake()
 
         return jsonify({"message": "Richiesta slot inviata"}), 201
 
@@ -592,9 +1007,189 @@ def request_slot():
         logger.error(f"Errore richiesta slot: {str(e)}")
         return jsonify({"error": "Errore durante la richiesta dello slot"}), 500
 
+# =============================
+#  P R E N O T A Z I O N I   T E M P O R A N E E
+# =============================
+@app.route("/api/client/holds", methods=["POST"])
+def create_hold():
+    """
+    Blocca per qualche secondo un orario (di solito uno degli openings),
+    poi da confermare con /api/client/holds/<hold_id>/confirm.
+    JSON: client_id, operator_id, start_time, end_time, ttl (secondi, opzionale)
+    """
+    try:
+        data = request.get_json() or {}
+        missing = [k for k in ("client_id", "operator_id", "start_time", "end_time") if k not in data]
+        if missing:
+            return jsonify({"error": f"Campi mancanti: {', '.join(missing)}"}), 400
+
+        with get_db() as conn:
+            hold = hold_service.create(conn, int(data["operator_id"]), int(data["client_id"]),
+                                       data["start_time"], data["end_time"], data.get("ttl"))
+        return jsonify({**hold, "start_time": hold["start_time"].isoformat(),
+                        "end_time": hold["end_time"].isoformat()}), 201
+
+    except BookingError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        logger.error(f"Errore creazione hold: {str(e)}")
+        return jsonify({"error": "Errore durante la prenotazione temporanea"}), 500
+
+@app.route("/api/client/holds/<hold_id>/confirm", methods=["POST"])
+def confirm_hold(hold_id):
+    """Trasforma la hold in un appuntamento (nessuna nuova ricerca di disponibilità)."""
+    try:
+        data = request.get_json(silent=True) or {}
+        client_id = int(data["client_id"]) if data.get("client_id") is not None else None
+        with get_db() as conn:
+            booked = hold_service.confirm(conn, hold_id, client_id, data.get("service_type", ""),
+                                          on_booked=_announce_booking(service_type=data.get("service_type", "")))
+            if booked["client_phone"]:
+                reminder_scheduler.schedule(conn, booked["id"], booked["start_time"], booked["client_phone"])
+        change_hub.wake()
+        return jsonify({"message": "Appuntamento creato con successo",
+                        "appointment": {"id": booked["id"]}}), 200
+
+    except BookingError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        logger.error(f"Errore conferma hold: {str(e)}")
+        return jsonify({"error": "Errore durante la conferma della prenotazione"}), 500
+
+@app.route("/api/client/holds/<hold_id>", methods=["DELETE"])
+def release_hold(hold_id):
+    """Rilascia subito l'orario bloccato."""
+    try:
+        data = request.get_json(silent=True) or {}
+        client_id = int(data["client_id"]) if data.get("client_id") is not None else None
+        with get_db() as conn:
+            if not hold_service.release(conn, hold_id, client_id):
+                return jsonify({"error": "Prenotazione temporanea non trovata"}), 404
+        return jsonify({"message": "Prenotazione temporanea rilasciata"}), 200
+
+    except Exception as e:
+        logger.error(f"Errore rilascio hold: {str(e)}")
+        return jsonify({"error": "Errore durante il rilascio della prenotazione"}), 500
+
+# =============================
+#  E V E N T I   D I   M O D I F I C A
+# =============================
+def _event_channel(user_id):
+    """
+    Canale degli eventi di user_id: tutto il tenant per un admin, solo i
+    propri appuntamenti e slot per operatori e clienti. Serve il token:
+    l'utente deve essere quello del token o un utente del suo tenant
+    (admin). Restituisce (canale, None) oppure (None, risposta di errore).
+    """
+    try:
+        claims = token_auth.current_claims()
+    except TokenError as e:
+        return None, (jsonify({"error": str(e)}), 401)
+    if claims is None:
+        return None, (jsonify({"error": "Token mancante"}), 401)
+    with get_db() as conn, conn.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute("SELECT id, role, admin_id FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+    if user is None:
+        return None, (jsonify({"error": "Utente non trovato"}), 404)
+    if claims["sub"] != user_id and not (
+            claims["role"] == "admin" and claims["tid"] == tenant_of(user)):
+        return None, (jsonify({"error": "Non autorizzato"}), 403)
+    return (f"t{user_id}" if user["role"] == "admin" else f"u{user_id}"), None
+
+def _event_cursor():
+    """Ultimo evento ricevuto: header Last-Event-ID (riconnessione SSE) o parametro after."""
+    value = request.headers.get("Last-Event-ID") or request.args.get("after")
+    return int(value) if value and value.isdigit() else None
+
+@app.route("/api/events/<int:user_id>", methods=["GET"])
+def stream_events(user_id):
+    """
+    Stream SSE delle modifiche (appointment.created / updated / deleted,
+    slot.requested / approved / rejected), con id = cursore. Dopo
+    EVENTS_STREAM_SECONDS lo stream si chiude e EventSource si riconnette
+    da solo con Last-Event-ID, senza perdere eventi. "reset" chiede al
+    client di ricaricare il calendario. Mentre attende non usa il DB.
+    """
+    try:
+        channel, error = _event_channel(user_id)
+        if error:
+            return error
+        # Prima lettura qui, così un errore (es. migrazione 010 mancante) diventa un 500
+        events, after = change_hub.listen(channel, _event_cursor(), timeout=0)
+    except Exception as e:
+        logger.error(f"Errore stream eventi: {str(e)}")
+        return jsonify({"error": "Eventi non disponibili"}), 500
+
+    def generate(events, after):
+        deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+        yield "retry: 2000\n\n"
+        while True:
+            if events == RESET:
+                yield f"id: {after}\nevent: reset\ndata: {{}}\n\n"
+            elif events:
+                yield "".join(f"id: {e.id}\nevent: {e.type}\ndata: {json.dumps(e.data)}\n\n" for e in events)
+            else:
+                # Keep-alive; l'id aggiorna comunque Last-Event-ID del browser
+                yield f": ping\nid: {after}\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events, after = change_hub.listen(channel, after, timeout=min(EVENTS_HEARTBEAT, remaining))
+
+    return Response(generate(events, after), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/events/<int:user_id>/poll", methods=["GET"])
+def poll_events(user_id):
+    """
+    Long-poll: attende fino a 'timeout' secondi (max EVENTS_POLL_MAX) gli
+    eventi successivi ad 'after'. Risponde {events, cursor, reset}: la
+    richiesta successiva usa after=cursor.
+    """
+    try:
+        channel, error = _event_channel(user_id)
+        if error:
+            return error
+        timeout = max(0, min(request.args.get("timeout", EVENTS_POLL_MAX, type=int), EVENTS_POLL_MAX))
+        events, cursor = change_hub.listen(channel, _event_cursor(), timeout=timeout)
+        if events == RESET:
+            return jsonify({"events": [], "cursor": cursor, "reset": True}), 200
+        return jsonify({"events": [{"id": e.id, "type": e.type, "data": e.data} for e in events],
+                        "cursor": cursor, "reset": False}), 200
+
+    except Exception as e:
+        logger.error(f"Errore long-poll eventi: {str(e)}")
+        return jsonify({"error": "Eventi non disponibili"}), 500
+
+@app.route("/api/debug/events")
+@debug_endpoint
+def events_stats():
+    """Sottoscrittori in attesa ed eventi consegnati da questa istanza."""
+    return jsonify(change_hub.stats()), 200
+
+# =============================
+#  P R O F I L O   A V V I O
+# =============================
+@app.before_request
+def _profile_request_start():
+    g.request_started = time.perf_counter()
+    g.cold_request = startup.request_started()
+
+@app.after_request
+def _profile_request_end(response):
+    if g.get("cold_request"):
+        startup.request_finished(request.path, time.perf_counter() - g.request_started)
+        response.headers["X-Cold-Start"] = "1"
+    return response
+
+startup.mark("app_ready")
+
 # =============================
 #  MAIN
 # =============================
 if __name__ == "__main__":
+    # In locale i promemoria partono da soli, senza bisogno del cron
+    reminder_scheduler.start_background(get_db, interval=60)
     # Avvia server in locale (debug) sulla porta 5000
     app.run(debug=True, port=5000)
@@ -0,0 +1,248 @@
+"""
+Hashing delle password fuori dal thread della richiesta, condiviso tra
+l'API serverless (api/index.py, import massivo in api/bulk_import.py) e
+l'app (app/services/passwords.py).
+
+scrypt è volutamente lento e usa molta memoria: calcolato nel thread
+della richiesta, una raffica di login occupa tutti i worker del server.
+PasswordHasher lo esegue in un pool di processi con:
+
+- un tetto alla concorrenza (max_workers processi);
+- una coda limitata (max_queue richieste in attesa): oltre, hash() e
+  verify() sollevano HasherBusy e la rotta risponde 503 invece di
+  accumulare richieste;
+- il rehash "pigro": al login, se l'hash salvato usa parametri diversi
+  da quelli attuali (PASSWORD_HASH_METHOD), verify_and_update() restituisce
+  anche il nuovo hash da salvare;
+- hash_many() per i lotti (import massivo): un solo posto in coda per
+  tutto il lotto, distribuito sui processi del pool;
+- metriche di latenza (coda + calcolo) per hash e verifica.
+
+Se i processi non sono disponibili si ripiega sul thread corrente; se il
+pool si rompe (un processo figlio terminato, BrokenProcessPool) viene
+ricreato alla richiesta successiva e quella in corso si calcola in linea.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    """Troppe richieste di hashing in coda."""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PasswordHasher:
+    """Pool di processi per generate/check_password_hash, con coda limitata."""
+
+    def __init__(self, max_workers=2, max_queue=32, method='scrypt', timeout=10.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.method = method
+        self.timeout = timeout
+
+        self._executor = None
+        self._inline = False
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._target_prefix = None
+
+        self._latency = {'hash': deque(maxlen=1000), 'verify': deque(maxlen=1000)}
+        self._counts = {'hash': 0, 'verify': 0, 'rehash': 0, 'rejected': 0, 'timeouts': 0,
+                        'broken_pool': 0}
+        self._in_flight = 0
+
+    # -------------------------------------------------------------
+    #  API
+    # -------------------------------------------------------------
+    def hash(self, password):
+        return self._run('hash', _hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """
+        Hash di un lotto di password (nello stesso ordine). Occupa un solo
+        posto in coda (HasherBusy se non ce ne sono) e non ha timeout: è
+        pensato per i job amministrativi, non per le rotte di login.
+        """
+        passwords = list(passwords)
+        if not passwords:
+            return []
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise HasherBusy('Troppe richieste di hashing in coda')
+        with self._lock:
+            self._in_flight += 1
+        try:
+            executor = self._get_executor()
+            if executor is not None:
+                chunksize = max(1, len(passwords) // (self.max_workers * 4))
+                try:
+                    return list(executor.map(_hash, passwords, [self.method] * len(passwords),
+                                             chunksize=chunksize))
+                except (BrokenExecutor, OSError) as e:
+                    self._reset_executor(executor, e)
+            return [_hash(password, self.method) for password in passwords]
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._counts['hash'] += len(passwords)
+            self._slots.release()
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run('verify', _verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True se l'hash è stato calcolato con metodo/parametri diversi da quelli attuali."""
+        return password_hash.split('$', 1)[0] != self._target()
+
+    def verify_and_update(self, password_hash, password):
+        """
+        Verifica la password e, se corretta ma con un hash da aggiornare,
+        restituisce anche il nuovo hash: (ok, nuovo_hash | None).
+        """
+        if not self.verify(password_hash, password):
+            return False, None
+        if not self.needs_rehash(password_hash):
+            return True, None
+        try:
+            new_hash = self.hash(password)
+        except HasherBusy:
+            # Il rehash si può rimandare al prossimo login
+            return True, None
+        with self._lock:
+            self._counts['rehash'] += 1
+        return True, new_hash
+
+    def metrics(self):
+        with self._lock:
+            result = dict(self._counts)
+            result.update({
+                'in_flight': self._in_flight,
+                'queued': max(0, self._in_flight - self.max_workers),
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'method': self.method,
+                'inline': self._inline
+            })
+            for kind, samples in self._latency.items():
+                values = list(samples)
+                result[f'{kind}_latency_ms'] = {
+                    'p50': _percentile(values, 0.5),
+                    'p95': _percentile(values, 0.95),
+                    'max': max(values) if values else None
+                }
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # -------------------------------------------------------------
+    #  Interni
+    # -------------------------------------------------------------
+    def _target(self):
+        if self._target_prefix is None:
+            # Il prefisso "metodo:parametri" dipende dalla versione di werkzeug
+            self._target_prefix = generate_password_hash('', method=self.method).split('$', 1)[0]
+        return self._target_prefix
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and not self._inline:
+                # Import locale: multiprocessing serve al primo hashing, non a ogni cold start
+                from concurrent.futures import ProcessPoolExecutor
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                except (OSError, NotImplementedError) as e:
+                    logger.warning(f"Pool di processi non disponibile, hashing in linea: {e}")
+                    self._inline = True
+            return self._executor
+
+    def _reset_executor(self, executor, error):
+        """Scarta un pool rotto: il prossimo uso ne crea uno nuovo."""
+        logger.warning(f"Pool di processi per l'hashing non utilizzabile, ricreato: {error}")
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            self._counts['broken_pool'] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, kind, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise HasherBusy('Troppe richieste di hashing in coda')
+        started = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return fn(*args)
+            try:
+                return executor.submit(fn, *args).result(timeout=self.timeout)
+            except FutureTimeout:
+                with self._lock:
+                    self._counts['timeouts'] += 1
+                raise HasherBusy("Timeout dell'hashing password")
+            except (BrokenExecutor, OSError) as e:
+                self._reset_executor(executor, e)
+                return fn(*args)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._in_flight -= 1
+                self._counts[kind] += 1
+                self._latency[kind].append(round(elapsed, 2))
+            self._slots.release()
+
+
+_hasher = None
+
+
+def get_hasher():
+    """Hasher del processo (creato dalle variabili d'ambiente se manca set_hasher)."""
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher(
+            max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+            max_queue=int(os.getenv("PASSWORD_HASH_QUEUE", "32")),
+            method=os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+        )
+    return _hasher
+
+
+def set_hasher(hasher):
+    """Sostituisce l'hasher del processo (app/services/passwords.py:init_passwords)."""
+    global _hasher
+    previous, _hasher = _hasher, hasher
+    if previous is not None and previous is not hasher:
+        previous.shutdown()
+    return hasher
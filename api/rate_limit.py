@@ -0,0 +1,259 @@
+"""
+Limitazione dei tentativi di login (finestra scorrevole).
+
+LoginThrottle conta i tentativi per IP e per username su finestre
+scorrevoli e rifiuta il tentativo (HTTP 429 con Retry-After) prima di
+qualsiasi query o calcolo dell'hash: un attaccante non può più tenere
+occupata la CPU con scrypt. I tentativi rifiutati non vengono contati,
+quindi chi si ferma torna a poter accedere dopo la finestra; un login
+riuscito azzera il contatore dello username.
+
+Backend (LOGIN_RATE_BACKEND):
+  memory        contatori nel processo (default). Su Vercel ogni istanza
+                calda ha i suoi: il limite reale è per istanza.
+  redis         condiviso tra processi/istanze (REDIS_URL), con sorted set.
+  local-shared  stand-in locale del backend condiviso: stesse operazioni
+                e stessa logica di RedisBackend, senza Redis. Serve per
+                sviluppo e prove.
+
+L'IP viene da client_ip(): X-Forwarded-For conta solo dietro proxy
+fidati (TRUSTED_PROXY_COUNT, es. 1 su Vercel), altrimenti remote_addr.
+
+Questo modulo non importa altri moduli di api/, così può essere usato
+anche dalle rotte dell'app (from api.rate_limit import ...).
+"""
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+
+
+class MemoryBackend:
+    """Finestra scorrevole con una deque di timestamp per chiave."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, key, limit, window, now=None):
+        """Come hit() ma senza registrare il tentativo."""
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._hits.get(key)
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if hits and len(hits) >= limit:
+                return max(1, int(hits[0] + window - now + 0.999))
+            return 0
+
+    def hit(self, key, limit, window, now=None):
+        """
+        Registra un tentativo se c'è spazio nella finestra. Restituisce 0
+        se consentito, altrimenti i secondi da attendere.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque()
+            self._hits.move_to_end(key)
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return max(1, int(hits[0] + window - now + 0.999))
+            hits.append(now)
+            # Limite alla memoria: si scartano le chiavi usate meno di recente
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class SharedBackend(ABC):
+    """
+    Finestra scorrevole su uno store condiviso con semantica da sorted set
+    (membro = tentativo, punteggio = timestamp). Le sottoclassi forniscono
+    le tre operazioni primitive (tra lettura e scrittura non c'è
+    atomicità: con accessi concorrenti il limite può essere superato di poco).
+    """
+
+    prefix = "login-rate:"
+
+    def peek(self, key, limit, window, now=None):
+        """Come hit() ma senza registrare il tentativo."""
+        now = time.time() if now is None else now
+        count, first = self._trim_and_count(self.prefix + key, now - window)
+        return max(1, int(first + window - now + 0.999)) if count >= limit else 0
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        key = self.prefix + key
+        count, first = self._trim_and_count(key, now - window)
+        if count >= limit:
+            return max(1, int(first + window - now + 0.999))
+        self._add(key, f"{now}:{uuid.uuid4().hex[:8]}", now, window)
+        return 0
+
+    def reset(self, key):
+        self._delete(self.prefix + key)
+
+    # Primitive
+    @abstractmethod
+    def _trim_and_count(self, key, min_score):
+        """Rimuove i membri con punteggio <= min_score; restituisce (numero, punteggio minimo)."""
+
+    @abstractmethod
+    def _add(self, key, member, score, ttl):
+        """Aggiunge il membro con il suo punteggio; la chiave scade dopo ttl secondi."""
+
+    @abstractmethod
+    def _delete(self, key):
+        """Cancella la chiave."""
+
+
+class RedisBackend(SharedBackend):
+    """Backend condiviso su Redis (richiede il pacchetto redis)."""
+
+    def __init__(self, url):
+        import redis  # Import locale: serve solo con LOGIN_RATE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+
+    def _trim_and_count(self, key, min_score):
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(key, "-inf", min_score)
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        _, count, first = pipe.execute()
+        return count, (first[0][1] if first else 0)
+
+    def _add(self, key, member, score, ttl):
+        pipe = self._redis.pipeline()
+        pipe.zadd(key, {member: score})
+        pipe.expire(key, int(ttl) + 1)
+        pipe.execute()
+
+    def _delete(self, key):
+        self._redis.delete(key)
+
+
+class LocalSharedBackend(SharedBackend):
+    """Stand-in in memoria del backend condiviso (stessa logica di RedisBackend)."""
+
+    def __init__(self):
+        self._sets = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _trim_and_count(self, key, min_score):
+        with self._lock:
+            if self._expires.get(key, float("inf")) < time.time():
+                self._sets.pop(key, None)
+            members = self._sets.get(key, {})
+            for member in [m for m, score in members.items() if score <= min_score]:
+                del members[member]
+            return len(members), (min(members.values()) if members else 0)
+
+    def _add(self, key, member, score, ttl):
+        with self._lock:
+            self._sets.setdefault(key, {})[member] = score
+            self._expires[key] = time.time() + ttl + 1
+
+    def _delete(self, key):
+        with self._lock:
+            self._sets.pop(key, None)
+            self._expires.pop(key, None)
+
+
+def backend_from_env():
+    name = os.getenv("LOGIN_RATE_BACKEND", "memory")
+    if name == "redis":
+        return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    if name == "local-shared":
+        return LocalSharedBackend()
+    return MemoryBackend()
+
+
+class LoginThrottle:
+    """Limiti per IP e per username sui tentativi di login."""
+
+    def __init__(self, backend=None, ip_limit=30, ip_window=60, user_limit=10, user_window=300):
+        self.backend = backend or MemoryBackend()
+        self.ip_limit = ip_limit
+        self.ip_window = ip_window
+        self.user_limit = user_limit
+        self.user_window = user_window
+        self.allowed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            backend_from_env(),
+            ip_limit=int(os.getenv("LOGIN_RATE_IP_LIMIT", "30")),
+            ip_window=int(os.getenv("LOGIN_RATE_IP_WINDOW", "60")),
+            user_limit=int(os.getenv("LOGIN_RATE_USER_LIMIT", "10")),
+            user_window=int(os.getenv("LOGIN_RATE_USER_WINDOW", "300")),
+        )
+
+    def check(self, username, ip):
+        """
+        Registra il tentativo. Restituisce 0 se consentito, altrimenti i
+        secondi da indicare in Retry-After. Entrambi i limiti (IP e
+        username) vengono controllati prima di registrare: un tentativo
+        rifiutato non consuma nessuno dei due.
+        """
+        buckets = [(f"ip:{ip}", self.ip_limit, self.ip_window)]
+        if username:
+            buckets.append((f"user:{str(username).lower()}", self.user_limit, self.user_window))
+        retry_after = max(self.backend.peek(*bucket) for bucket in buckets)
+        for bucket in buckets:
+            if retry_after:
+                break
+            retry_after = self.backend.hit(*bucket)
+        with self._lock:
+            if retry_after:
+                self.rejected += 1
+            else:
+                self.allowed += 1
+        return retry_after
+
+    def reset_user(self, username):
+        """Da chiamare dopo un login riuscito."""
+        if username:
+            self.backend.reset(f"user:{str(username).lower()}")
+
+    def stats(self):
+        with self._lock:
+            allowed, rejected = self.allowed, self.rejected
+        return {
+            "backend": type(self.backend).__name__,
+            "allowed": allowed,
+            "rejected": rejected,
+            "ip_limit": f"{self.ip_limit}/{self.ip_window}s",
+            "user_limit": f"{self.user_limit}/{self.user_window}s"
+        }
+
+
+def client_ip(request, trusted_proxies=None):
+    """
+    IP del client per i limiti. X-Forwarded-For lo scrive chi sta davanti
+    all'app, quindi si usa solo con TRUSTED_PROXY_COUNT > 0 (numero di
+    proxy fidati, es. 1 su Vercel): si prende l'indirizzo aggiunto dal più
+    esterno, come ProxyFix di werkzeug. Senza proxy fidati l'header è
+    controllato dal client (ruotandolo si aggirerebbe il limite per IP) e
+    si usa remote_addr.
+    """
+    if trusted_proxies is None:
+        trusted_proxies = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+    if trusted_proxies > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.remote_addr or "unknown"
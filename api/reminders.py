@@ -0,0 +1,237 @@
+"""
+Pipeline dei promemoria WhatsApp per gli appuntamenti.
+
+Un promemoria per ogni (appuntamento, anticipo), con anticipi
+configurabili (es. 24 ore e 2 ore prima). Lo scheduler non tiene stato
+in memoria: ogni giro (tick) legge dalla tabella reminder_runs l'orario
+del giro precedente, con SELECT ... FOR UPDATE, così i giri di istanze
+diverse vengono serializzati. Poi cerca i promemoria con orario di invio
+in [ultimo giro, adesso) leggendo in quel momento gli appuntamenti
+(orario, stato e telefono attuali, indice ix_appointments_start). Li
+accoda e sposta in avanti l'ultimo giro, tutto nella stessa transazione:
+  - un'istanza nuova (cold start su Vercel) riprende da dove si era
+    fermata l'ultima, qualunque sia l'intervallo del cron;
+  - se il giro fallisce (DB, outbox) il rollback lascia l'ultimo giro
+    com'era e il giro successivo riprova la stessa finestra;
+  - un appuntamento spostato o annullato dopo la creazione viene letto
+    com'è al momento dell'invio.
+
+Ogni promemoria inviato viene registrato nella tabella notifications con
+tipo "reminder_<minuti>m" (vincolo univoco su appuntamento + tipo): quelli
+già registrati vengono saltati e un doppio invio tra processi diversi è
+impossibile. Il messaggio vero passa per notification_outbox, come le
+altre notifiche WhatsApp.
+
+tick() è pensato per essere chiamato da un cron
+(POST /api/admin/send-reminders) o dal thread di start_background().
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEAD_TIMES = (timedelta(hours=24), timedelta(hours=2))
+RUN_NAME = "reminders"
+
+
+def parse_lead_times(value):
+    """Anticipi in minuti separati da virgola (es. "1440,120") -> timedelta."""
+    return tuple(timedelta(minutes=int(part)) for part in value.split(",") if part.strip())
+
+
+def reminder_type(lead):
+    return f"reminder_{int(lead.total_seconds() // 60)}m"
+
+
+def reminder_message(start_time):
+    return (f"Promemoria: hai un appuntamento il {start_time.strftime('%d/%m/%Y')} "
+            f"alle {start_time.strftime('%H:%M')}")
+
+
+class ReminderScheduler:
+    """Promemoria dovuti tra l'ultimo giro (salvato nel DB) e adesso."""
+
+    def __init__(self, lead_times=DEFAULT_LEAD_TIMES, first_run=timedelta(minutes=15), batch_size=200):
+        self.lead_times = tuple(sorted(lead_times, reverse=True))
+        # Finestra del primo giro in assoluto (nessuna riga in reminder_runs)
+        self.first_run = first_run
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.fired = 0
+        self.skipped = 0
+        self.last_window = None
+
+    # -------------------------------------------------------------
+    #  Lettura
+    # -------------------------------------------------------------
+    def due(self, cursor, window_start, now):
+        """
+        Promemoria con orario di invio in [window_start, now) per
+        appuntamenti futuri e non annullati, ordinati per orario di invio:
+        [(fire_at, appointment_id, lead, phone, start_time)]. Quelli già
+        registrati in notifications vengono saltati. Due query, entrambe su
+        intervalli indicizzati.
+        """
+        ranges = []
+        params = []
+        for lead in self.lead_times:
+            ranges.append("(a.start_time >= %s AND a.start_time < %s)")
+            params.extend([window_start + lead, now + lead])
+
+        cursor.execute(f"""
+            SELECT a.id, a.start_time, u.phone
+            FROM appointments a
+            JOIN users u ON u.id = a.client_id
+            WHERE ({' OR '.join(ranges)})
+              AND a.start_time > %s
+              AND a.status <> 'cancelled'
+              AND u.phone IS NOT NULL AND u.phone <> ''
+        """, (*params, now))
+        appointments = cursor.fetchall()
+        if not appointments:
+            return []
+
+        ids = [row['id'] for row in appointments]
+        cursor.execute(f"""
+            SELECT appointment_id, type FROM notifications
+            WHERE appointment_id IN ({', '.join(['%s'] * len(ids))})
+              AND type LIKE 'reminder\\_%%'
+        """, tuple(ids))
+        already_sent = {(row['appointment_id'], row['type']) for row in cursor.fetchall()}
+
+        items = []
+        skipped = 0
+        for row in appointments:
+            for lead in self.lead_times:
+                fire_at = row['start_time'] - lead
+                if not window_start <= fire_at < now:
+                    continue
+                if (row['id'], reminder_type(lead)) in already_sent:
+                    skipped += 1
+                    continue
+                items.append((fire_at, row['id'], lead, row['phone'], row['start_time']))
+        with self._lock:
+            self.skipped += skipped
+        items.sort(key=lambda item: (item[0], item[1]))
+        return items
+
+    # -------------------------------------------------------------
+    #  Invio
+    # -------------------------------------------------------------
+    def fire(self, cursor, items):
+        """
+        Registra i promemoria in notifications e accoda i messaggi
+        nell'outbox, nella transazione del chiamante (nessun commit).
+        INSERT IGNORE sui vincoli univoci rende l'operazione idempotente.
+        """
+        if not items:
+            return 0
+        # L'outbox ragiona in UTC (vedi app/services/outbox.py)
+        now = datetime.utcnow()
+        for start in range(0, len(items), self.batch_size):
+            notification_rows = []
+            outbox_rows = []
+            for _, appointment_id, lead, phone, start_time in items[start:start + self.batch_size]:
+                message = reminder_message(start_time)
+                kind = reminder_type(lead)
+                notification_rows.append((appointment_id, kind, message, now))
+                outbox_rows.append((phone, message, now, now, f"{kind}:{appointment_id}"))
+            cursor.executemany("""
+                INSERT IGNORE INTO notifications (appointment_id, type, message, status, created_at)
+                VALUES (%s, %s, %s, 'queued', %s)
+            """, notification_rows)
+            cursor.executemany("""
+                INSERT IGNORE INTO notification_outbox
+                    (channel, to_number, message, status, attempts, next_attempt_at, created_at, dedup_key)
+                VALUES ('whatsapp', %s, %s, 'queued', 0, %s, %s, %s)
+            """, outbox_rows)
+        return len(items)
+
+    def tick(self, conn, now=None):
+        """
+        Un giro completo: invia i promemoria dovuti dall'ultimo giro e
+        salva 'now' come nuovo ultimo giro, in un'unica transazione.
+        """
+        now = now or datetime.now()
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute("SELECT last_run FROM reminder_runs WHERE name = %s FOR UPDATE",
+                               (RUN_NAME,))
+                row = cursor.fetchone()
+                window_start = row['last_run'] if row else now - self.first_run
+                # Oltre l'anticipo più lungo non c'è nulla da inviare (solo appuntamenti futuri)
+                window_start = max(window_start, now - self.lead_times[0])
+                items = self.due(cursor, window_start, now) if window_start < now else []
+                fired = self.fire(cursor, items)
+                cursor.execute("""
+                    INSERT INTO reminder_runs (name, last_run) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE last_run = GREATEST(last_run, VALUES(last_run))
+                """, (RUN_NAME, now))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        with self._lock:
+            self.fired += fired
+            self.last_window = (window_start, now)
+        return fired
+
+    def schedule(self, conn, appointment_id, start_time, phone, now=None):
+        """
+        Appuntamento appena creato: se anche l'anticipo più breve è già
+        passato (nessun giro futuro lo troverebbe), il suo promemoria
+        viene inviato subito. Negli altri casi ci pensa tick(). Un errore
+        non fa fallire la prenotazione: viene solo registrato nel log.
+        """
+        now = now or datetime.now()
+        lead = self.lead_times[-1]
+        if not phone or start_time <= now or start_time - lead > now:
+            return 0
+        try:
+            with conn.cursor() as cursor:
+                fired = self.fire(cursor, [(now, appointment_id, lead, phone, start_time)])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Errore promemoria immediato per l'appuntamento {appointment_id}: {e}")
+            return 0
+        with self._lock:
+            self.fired += fired
+        return fired
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lead_times_minutes": [int(lead.total_seconds() // 60) for lead in self.lead_times],
+                "last_window": ([moment.isoformat() for moment in self.last_window]
+                                if self.last_window else None),
+                "fired": self.fired,
+                "skipped": self.skipped
+            }
+
+    # -------------------------------------------------------------
+    #  Esecuzione continua (server locale / processo dedicato)
+    # -------------------------------------------------------------
+    def start_background(self, get_db, interval=60):
+        """Esegue tick() ogni 'interval' secondi in un thread daemon."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    with get_db() as conn:
+                        self.tick(conn)
+                except Exception as e:
+                    logger.error(f"Errore scheduler promemoria: {e}")
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=run, name="reminders", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,237 @@
+"""
+Metriche per richiesta: tempo totale, query al DB, tempo DB e tempo di
+serializzazione JSON, per ogni rotta.
+
+RequestMetrics.init_app(app) registra gli hook della richiesta e un
+provider JSON che misura la serializzazione; le query vengono contate da:
+  - instrument_connection(conn)   connessioni pymysql (ogni cursore passa
+                                  da conn.query, anche DictCursor e SSCursor)
+  - instrument_sqlalchemy()       eventi before/after_cursor_execute di
+                                  tutti gli Engine SQLAlchemy
+
+Le rotte sono etichettate con la regola (es. /api/calendar/<int:user_id>),
+non con il path, così il numero di serie resta limitato. render() produce
+il formato testo di Prometheus (istogrammi _bucket/_sum/_count) per
+/metrics; summary() un riepilogo per rotta utile a trovare gli endpoint
+N+1 (query medie e massime per richiesta). Le richieste con più di
+'query_warning' query vengono anche segnalate nel log.
+
+Questo modulo non importa altri moduli di api/, così può essere usato
+anche dall'app (from api.request_metrics import ...).
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Contatori della richiesta in corso: [query, secondi DB, secondi di serializzazione]
+_current = ContextVar("request_metrics", default=None)
+
+
+class Histogram:
+    """Istogramma cumulativo per combinazione di etichette (formato Prometheus)."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # valori delle etichette -> [conteggi per bucket, somma, numero]
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = _labels(self.labels, label_values)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{_number(bound)}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {_number(total)}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Provider JSON di Flask che somma il tempo di dumps() alla richiesta in corso."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            state = _current.get()
+            if state is not None:
+                state[2] += time.perf_counter() - started
+
+
+def record_query(seconds):
+    """Conta una query (e il suo tempo) nella richiesta in corso, se c'è."""
+    state = _current.get()
+    if state is not None:
+        state[0] += 1
+        state[1] += seconds
+
+
+def instrument_connection(conn):
+    """Misura ogni query di una connessione pymysql (da usare come ConnectionPool(on_open=...))."""
+    query = conn.query
+
+    def timed_query(sql, unbuffered=False):
+        started = time.perf_counter()
+        try:
+            return query(sql, unbuffered=unbuffered)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    conn.query = timed_query
+    return conn
+
+
+_sqlalchemy_instrumented = False
+
+
+def instrument_sqlalchemy():
+    """Collega record_query agli eventi di tutti gli Engine SQLAlchemy (una sola volta)."""
+    global _sqlalchemy_instrumented
+    if _sqlalchemy_instrumented:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        record_query(time.perf_counter() - started)
+
+    _sqlalchemy_instrumented = True
+
+
+class RequestMetrics:
+    """Registro delle metriche del processo, con gli hook Flask che lo alimentano."""
+
+    def __init__(self, query_warning=30, skip_paths=("/metrics",)):
+        self.query_warning = query_warning
+        self.skip_paths = set(skip_paths)
+        self._lock = threading.Lock()
+        self.requests = {}  # (rotta, metodo, status) -> numero
+        self.duration = Histogram("http_request_duration_seconds",
+                                  "Tempo totale della richiesta", ("route", "method"), SECONDS_BUCKETS)
+        self.queries = Histogram("http_request_db_queries",
+                                 "Query al DB per richiesta", ("route", "method"), QUERY_BUCKETS)
+        self.db_time = Histogram("http_request_db_seconds",
+                                 "Tempo passato nelle query per richiesta", ("route", "method"), SECONDS_BUCKETS)
+        self.serialization = Histogram("http_request_serialization_seconds",
+                                       "Tempo di serializzazione JSON per richiesta", ("route", "method"),
+                                       SECONDS_BUCKETS)
+
+    def init_app(self, app):
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    # -------------------------------------------------------------
+    #  Hook della richiesta
+    # -------------------------------------------------------------
+    def _start(self):
+        if request.path in self.skip_paths:
+            return
+        g.metrics_started = time.perf_counter()
+        g.metrics_token = _current.set([0, 0.0, 0.0])
+
+    def _finish(self, response):
+        token = g.pop("metrics_token", None)
+        if token is None:
+            return response
+        queries, db_seconds, serialize_seconds = _current.get()
+        _current.reset(token)
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        self.observe(route, request.method, response.status_code,
+                     time.perf_counter() - g.metrics_started, queries, db_seconds, serialize_seconds)
+        return response
+
+    def _teardown(self, exc):
+        # Eccezione non gestita: after_request non è stato chiamato
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            _current.reset(token)
+
+    def observe(self, route, method, status, seconds, queries, db_seconds, serialize_seconds):
+        labels = (route, method)
+        with self._lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.duration.observe(labels, seconds)
+            self.queries.observe(labels, queries)
+            self.db_time.observe(labels, db_seconds)
+            self.serialization.observe(labels, serialize_seconds)
+        if queries > self.query_warning:
+            logger.warning(f"{method} {route}: {queries} query in una richiesta "
+                           f"({db_seconds * 1000:.1f} ms di DB)")
+
+    # -------------------------------------------------------------
+    #  Esposizione
+    # -------------------------------------------------------------
+    def render(self):
+        """Testo per /metrics (Content-Type: text/plain; version=0.0.4)."""
+        with self._lock:
+            lines = ["# HELP http_requests_total Richieste servite",
+                     "# TYPE http_requests_total counter"]
+            for values, count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{{{_labels(('route', 'method', 'status'), values)}}} {count}")
+            for histogram in (self.duration, self.queries, self.db_time, self.serialization):
+                lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Per rotta: richieste, ms medi, query medie e massime (ordinate per query medie)."""
+        with self._lock:
+            rows = []
+            for labels, (counts, total, count) in self.queries._series.items():
+                duration_total = self.duration._series[labels][1]
+                db_total = self.db_time._series[labels][1]
+                # Massimo approssimato: il primo bucket che contiene tutte le richieste
+                max_queries = next((bound for bound, c in zip(QUERY_BUCKETS, counts) if c == count), None)
+                rows.append({
+                    "route": labels[0],
+                    "method": labels[1],
+                    "requests": count,
+                    "avg_ms": round(duration_total / count * 1000, 2),
+                    "avg_db_ms": round(db_total / count * 1000, 2),
+                    "avg_queries": round(total / count, 2),
+                    "max_queries_le": max_queries,
+                })
+        return sorted(rows, key=lambda row: row["avg_queries"], reverse=True)
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,202 @@
+"""
+Espansione degli slot settimanali (day_of_week + start_time/end_time) in
+occorrenze concrete su un intervallo qualsiasi.
+
+Le occorrenze "grezze" vengono memorizzate per (operator_id, settimana):
+ogni voce contiene, per ogni slot dell'operatore già visto, l'occorrenza
+di quella settimana. Ogni voce porta con sé la versione del tenant
+(tenant_versions, migrations/009) letta insieme agli slot: i trigger la
+incrementano a ogni scrittura sugli slot, anche da un'altra istanza o
+dall'app, e una voce con una versione diversa viene ricalcolata. Le voci
+scadono comunque dopo 'ttl' secondi; invalidate(operator_id) le cancella
+subito dopo una scrittura fatta da questo processo.
+
+Le eccezioni (festività, giorni di chiusura di un operatore, singole
+occorrenze annullate) si applicano dopo la cache, a ogni richiesta: così
+aggiungere una festività non richiede di invalidare nulla.
+"""
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+
+def as_time(value):
+    """pymysql restituisce le colonne TIME come timedelta: le riporta a time."""
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds()) % 86400
+        return time(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+    return value
+
+
+def week_start(day):
+    """Lunedì della settimana che contiene 'day' (date o datetime)."""
+    if isinstance(day, datetime):
+        day = day.date()
+    return day - timedelta(days=day.weekday())
+
+
+class SlotExceptions:
+    """
+    Eccezioni alle ricorrenze, caricate dalla tabella slot_exceptions:
+      - slot_id valorizzato          => singola occorrenza annullata
+      - solo operator_id valorizzato => giorno di chiusura dell'operatore
+      - solo admin_id valorizzato    => festività dello studio
+      - nessuno dei tre              => festività per tutti
+    """
+
+    def __init__(self, rows=()):
+        self._slot_days = set()
+        self._operator_days = set()
+        self._admin_days = set()
+        self._global_days = set()
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        day = row['exception_date']
+        if isinstance(day, datetime):
+            day = day.date()
+        if row.get('slot_id'):
+            self._slot_days.add((row['slot_id'], day))
+        elif row.get('operator_id'):
+            self._operator_days.add((row['operator_id'], day))
+        elif row.get('admin_id'):
+            self._admin_days.add((row['admin_id'], day))
+        else:
+            self._global_days.add(day)
+
+    def excludes(self, slot, day):
+        """True se l'occorrenza dello slot nel giorno 'day' non va mostrata."""
+        return (
+            day in self._global_days
+            or (slot['id'], day) in self._slot_days
+            or (slot['operator_id'], day) in self._operator_days
+            or (slot.get('admin_id'), day) in self._admin_days
+        )
+
+    def __bool__(self):
+        return bool(self._slot_days or self._operator_days
+                    or self._admin_days or self._global_days)
+
+
+def load_exceptions(cursor, start, end):
+    """Legge da slot_exceptions le eccezioni con data in [start, end)."""
+    cursor.execute("""
+        SELECT slot_id, operator_id, admin_id, exception_date
+        FROM slot_exceptions
+        WHERE exception_date >= %s AND exception_date < %s
+    """, (start.date() if isinstance(start, datetime) else start,
+          _end_date(end)))
+    return SlotExceptions(cursor.fetchall())
+
+
+def _end_date(end):
+    # Un end a metà giornata deve includere le eccezioni di quel giorno
+    if isinstance(end, datetime):
+        return end.date() + timedelta(days=1) if end.time() != time(0) else end.date()
+    return end
+
+
+class SlotExpander:
+    """Cache LRU con scadenza delle occorrenze per (operator_id, lunedì della settimana)."""
+
+    def __init__(self, max_entries=4096, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = OrderedDict()   # chiave -> (versione, scadenza, {slot_id: occorrenza})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def occurrences(self, slots, start, end, exceptions=None):
+        """
+        Restituisce [(slot, start_dt, end_dt), ...] ordinata per inizio, con
+        tutte le occorrenze degli slot che iniziano in [start, end). Gli
+        slot possono indicare la versione del tenant ('tenant_version').
+        """
+        by_operator = {}
+        for slot in slots:
+            by_operator.setdefault(slot['operator_id'], []).append(slot)
+
+        result = []
+        for operator_id, op_slots in by_operator.items():
+            version = op_slots[0].get('tenant_version')
+            monday = week_start(start)
+            while datetime.combine(monday, time(0)) < end:
+                week = self._week(operator_id, monday, op_slots, version)
+                for slot in op_slots:
+                    occ = week.get(slot['id'])
+                    if occ is None:
+                        continue
+                    start_dt, end_dt = occ
+                    if start_dt < start or start_dt >= end:
+                        continue
+                    if exceptions and exceptions.excludes(slot, start_dt.date()):
+                        continue
+                    result.append((slot, start_dt, end_dt))
+                monday += timedelta(days=7)
+
+        result.sort(key=lambda item: (item[1], item[0]['id']))
+        return result
+
+    def invalidate(self, operator_id):
+        """Da chiamare quando gli slot dell'operatore cambiano."""
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == operator_id]:
+                del self._cache[key]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    def _week(self, operator_id, monday, op_slots, version=None):
+        key = (operator_id, monday)
+        now = _time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                week = entry[2]
+                self._cache.move_to_end(key)
+                missing = [s for s in op_slots if s['id'] not in week]
+                if not missing:
+                    self.hits += 1
+                    return week
+            else:
+                week = {}
+                missing = op_slots
+            self.misses += 1
+
+        computed = {slot['id']: _occurrence_in_week(slot, monday) for slot in missing}
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] != version or entry[1] <= now:
+                entry = (version, now + self.ttl, week)
+                self._cache[key] = entry
+            entry[2].update(computed)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return entry[2]
+
+
+def _occurrence_in_week(slot, monday):
+    day_of_week = slot['day_of_week']
+    if day_of_week is None or not 0 <= int(day_of_week) <= 6:
+        return None
+    day = monday + timedelta(days=int(day_of_week))
+    start_dt = datetime.combine(day, as_time(slot['start_time']))
+    end_dt = datetime.combine(day, as_time(slot['end_time']))
+    if end_dt <= start_dt:
+        # Slot che scavalca la mezzanotte
+        end_dt += timedelta(days=1)
+    return start_dt, end_dt
+
+
+# Istanza condivisa dal processo (sopravvive nei container "caldi")
+slot_expander = SlotExpander()
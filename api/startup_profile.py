@@ -0,0 +1,190 @@
+"""
+Profilo del cold start dell'API serverless (api/index.py).
+
+Il modulo va importato per primo in index.py: l'istante del suo import è
+l'origine dei tempi. Registra:
+  - le fasi dell'avvio, come differenza tra punti di controllo (mark):
+    import del framework, import dei moduli di api/, costruzione dell'app
+  - il tempo della prima connessione al DB (handshake TCP + auth)
+  - la prima richiesta servita dal processo (cold) e quanto è durata
+  - se STARTUP_PROFILE_IMPORTS=1, il tempo di import di ogni modulo
+    (cumulativo e proprio), con un finder in testa a sys.meta_path
+
+Il report è esposto da /api/debug/startup (con DEBUG_ENDPOINTS=1 e il
+token di un admin) e scritto una volta nel log, come riga JSON, alla fine
+della prima richiesta. Su Linux viene letto da /proc anche il tempo
+trascorso tra l'avvio del processo e questo modulo (avvio dell'interprete
+e del runtime della piattaforma).
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age():
+    """Secondi trascorsi dall'avvio del processo (solo Linux, altrimenti None)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Il nome del comando può contenere spazi: si parte dopo l'ultima ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _TimedLoader:
+    """Loader che misura exec_module e delega tutto il resto al loader originale."""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter_module()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit_module(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer:
+    """Meta path finder: trova lo spec con gli altri finder e ne avvolge il loader."""
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler)
+                return spec
+        return None
+
+
+class StartupProfiler:
+    """Tempi dell'avvio del processo corrente (vedi docstring del modulo)."""
+
+    def __init__(self, track_imports=False, top=30):
+        self.started = time.perf_counter()
+        self.process_age = _process_age()
+        self.pid = os.getpid()
+        self.top = top
+        self.marks = []
+        self.first_db_connect = None
+        self.first_request = None
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._logged = False
+
+        # Tempi di import per modulo: (cumulativo, proprio) in secondi
+        self.modules = {}
+        self._stack = []
+        self._finder = None
+        if track_imports:
+            self._finder = _ImportTimer(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    # -------------------------------------------------------------
+    #  Fasi dell'avvio
+    # -------------------------------------------------------------
+    def mark(self, name):
+        """Punto di controllo: la fase 'name' termina adesso."""
+        self.marks.append((name, self.elapsed()))
+        if name == "app_ready":
+            self.stop_tracking_imports()
+
+    def record_connect(self, seconds):
+        """Da collegare a ConnectionPool(on_connect=...): tiene solo la prima connessione."""
+        with self._lock:
+            if self.first_db_connect is None:
+                self.first_db_connect = (seconds, self.elapsed())
+
+    def request_started(self):
+        """Restituisce True per la prima richiesta del processo (cold)."""
+        with self._lock:
+            self.requests += 1
+            return self.requests == 1
+
+    def request_finished(self, path, seconds):
+        with self._lock:
+            if self.first_request is not None:
+                return
+            self.first_request = {"path": path, "duration_ms": _ms(seconds),
+                                  "at_ms": _ms(self.elapsed())}
+            log = not self._logged
+            self._logged = True
+        if log:
+            logger.info("startup_profile " + json.dumps(self.report(top=10), separators=(",", ":")))
+
+    # -------------------------------------------------------------
+    #  Import per modulo
+    # -------------------------------------------------------------
+    def _enter_module(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _exit_module(self, name):
+        started, children = self._stack.pop()
+        total = time.perf_counter() - started
+        self.modules[name] = (total, total - children)
+        if self._stack:
+            self._stack[-1][1] += total
+
+    def stop_tracking_imports(self):
+        """Dopo l'avvio gli import (lazy) non fanno più parte del cold start."""
+        if self._finder is not None and self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    # -------------------------------------------------------------
+    #  Report
+    # -------------------------------------------------------------
+    def report(self, top=None):
+        phases = []
+        previous = 0.0
+        for name, at in self.marks:
+            phases.append({"name": name, "duration_ms": _ms(at - previous), "at_ms": _ms(at)})
+            previous = at
+        report = {
+            "pid": self.pid,
+            "before_profiler_ms": _ms(self.process_age) if self.process_age is not None else None,
+            "phases": phases,
+            "first_db_connect": None,
+            "first_request": self.first_request,
+            "requests": self.requests,
+        }
+        if self.first_db_connect is not None:
+            seconds, at = self.first_db_connect
+            report["first_db_connect"] = {"duration_ms": _ms(seconds), "at_ms": _ms(at - seconds)}
+        if self._finder is not None:
+            heaviest = sorted(self.modules.items(), key=lambda item: item[1][0], reverse=True)
+            report["modules"] = [
+                {"module": name, "cumulative_ms": _ms(total), "self_ms": _ms(own)}
+                for name, (total, own) in heaviest[:top or self.top]
+            ]
+        return report
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+startup = StartupProfiler(track_imports=os.getenv("STARTUP_PROFILE_IMPORTS", "0") == "1")
@@ -1,26 +1,110 @@
+# app/__init__.py
+"""
+Factory unica dell'applicazione Flask-SQLAlchemy.
+
+Tutti i blueprint sono elencati in BLUEPRINTS come percorsi da
+importare: il modulo di una rotta viene caricato solo se il blueprint è
+abilitato (APP_BLUEPRINTS, default tutti). Se manca il pacchetto da cui
+dipende un blueprint abilitato l'avvio fallisce con un errore esplicito
+(va installato da requirements.txt oppure tolto da APP_BLUEPRINTS). I servizi in background (outbox, broadcast)
+partono solo se OUTBOX_WORKER_ENABLED è attivo; i provider esterni
+(Twilio) vengono importati solo al primo invio.
+
+Anche l'API serverless (api/index.py) viene creata da qui, con
+config.ServerlessConfig: SQLALCHEMY_ENABLED=False salta Flask-SQLAlchemy,
+i blueprint e i servizi che ne dipendono (niente import dell'ORM a ogni
+cold start); le sue rotte su pymysql vengono registrate da api/index.py
+e condividono con l'app i moduli di api/ (token, prenotazioni, cache).
+"""
+import importlib
+import importlib.util
+
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
-from config import Config
 
-db = SQLAlchemy()
+# nome -> (modulo, attributo, url_prefix, pacchetto richiesto oltre a quelli dell'app)
+BLUEPRINTS = {
+    'auth': ('app.routes.auth', 'auth_bp', None, None),
+    'users': ('app.routes.users', 'users_bp', None, None),
+    'admin': ('app.routes.admin', 'admin_bp', '/api/admin', None),
+    'dashboard': ('app.routes.dashboard', 'dashboard', None, 'flask_login'),
+}
+
+
+def register_blueprints(app, names=None):
+    """Importa e registra i blueprint richiesti. Restituisce i nomi registrati."""
+    registered = []
+    for name in names or BLUEPRINTS:
+        module_name, attribute, url_prefix, requires = BLUEPRINTS[name]
+        if requires and importlib.util.find_spec(requires) is None:
+            raise RuntimeError(f"Blueprint '{name}' abilitato ma manca il pacchetto {requires} "
+                               f"(vedi requirements.txt, oppure escluderlo con APP_BLUEPRINTS)")
+        blueprint = getattr(importlib.import_module(module_name), attribute)
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
+        registered.append(name)
+    return registered
+
+
+def create_app(config_object=None, blueprints=None):
+    """
+    Crea l'applicazione. 'config_object' (default config.Config) e
+    'blueprints' (lista di nomi di BLUEPRINTS) servono a script e benchmark
+    per ottenere un'app ridotta.
+    """
+    if config_object is None:
+        from config import Config
+        config_object = Config
 
-def create_app():
     app = Flask(__name__)
-    app.config.from_object(Config)
-    
-    # Configura CORS per accettare richieste da localhost:3000
+    app.config.from_object(config_object)
+
+    from flask_cors import CORS
     CORS(app, resources={
         r"/api/*": {
-            "origins": ["http://localhost:3000"],
-            "methods": ["GET", "POST", "PUT", "DELETE"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "origins": app.config.get('CORS_ORIGINS', ["http://localhost:3000"]),
+            "methods": app.config.get('CORS_METHODS', ["GET", "POST", "PUT", "DELETE"]),
+            "allow_headers": app.config.get('CORS_ALLOW_HEADERS', ["Content-Type", "Authorization"]),
+            "supports_credentials": app.config.get('CORS_SUPPORTS_CREDENTIALS', False)
         }
     })
-    
+
+    if not app.config.get('SQLALCHEMY_ENABLED', True):
+        # API serverless: il resto lo configura api/index.py
+        app.extensions['blueprints'] = []
+        return app
+
+    from app.extensions import db
     db.init_app(app)
-    
-    from app.routes import auth
-    app.register_blueprint(auth.bp)
-    
-    return app
\ No newline at end of file
+
+    # Tempo, query al DB e serializzazione per rotta (/metrics)
+    from app.services.metrics import init_metrics
+    init_metrics(app)
+
+    # Token di accesso (firma e revoche condivise con api/auth_tokens.py);
+    # current_user di flask_login viene dallo stesso token
+    from app.services.tokens import init_login, init_tokens
+    init_tokens(app)
+    init_login(app)
+
+    # Cache delle liste operatori/clienti per admin
+    from app.services.directory import init_directory_cache
+    init_directory_cache(app)
+
+    if blueprints is None and app.config.get('APP_BLUEPRINTS'):
+        blueprints = [name.strip() for name in app.config['APP_BLUEPRINTS'].split(',') if name.strip()]
+    app.extensions['blueprints'] = register_blueprints(app, blueprints)
+
+    # Worker dell'outbox WhatsApp (invii in background) e broadcast a blocchi
+    from app.services.outbox import init_outbox
+    from app.services.broadcast import init_broadcasts
+    init_outbox(app)
+    init_broadcasts(app)
+
+    # Pool di processi per l'hashing delle password (creato al primo uso)
+    from app.services.passwords import init_passwords
+    init_passwords(app)
+
+    # Prenotazioni: stesso BookingEngine dell'API serverless
+    from app.services.booking import init_booking
+    init_booking(app)
+
+    return app
@@ -1,6 +1,11 @@
 # app/models/__init__.py
 from app.models.user import User
-from app.models.appointment import Appointment
+from app.models.appointment import Appointment, Notification
 from app.models.slot import Slot
+from app.models.stats import AppointmentStat
+from app.models.outbox import OutboxMessage
+from app.models.broadcast import BroadcastJob
+from app.models.token import RevokedToken
+from app.models.hold import SlotHold
 
-__all__ = ['User', 'Appointment', 'Slot']
\ No newline at end of file
+__all__ = ['User', 'Appointment', 'Notification', 'Slot', 'AppointmentStat', 'OutboxMessage', 'BroadcastJob', 'RevokedToken', 'SlotHold']
\ No newline at end of file
@@ -3,12 +3,38 @@ from app.models.base import db, datetime
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.Index('ix_appointments_operator_start', 'operator_id', 'start_time'),
+        db.Index('ix_appointments_client_start', 'client_id', 'start_time'),
+        db.Index('ix_appointments_start', 'start_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     operator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
+    service_type = db.Column(db.String(100))
     status = db.Column(db.String(20), nullable=False, default='pending')
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Notification(db.Model):
+    """
+    Notifica inviata per un appuntamento. Per i promemoria il tipo è
+    "reminder_<minuti>m": il vincolo univoco (appuntamento, tipo) garantisce
+    un solo promemoria per anticipo (vedi api/reminders.py).
+    """
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'type', name='uq_notifications_appointment_type'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id', ondelete='CASCADE'),
+                               nullable=False)
+    type = db.Column(db.String(32), nullable=False)
+    message = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / sent / failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
@@ -0,0 +1,23 @@
+# app/models/broadcast.py
+from app.models.base import db, datetime
+
+class BroadcastJob(db.Model):
+    """
+    Invio massivo di un messaggio WhatsApp a tutti i clienti di un admin.
+    last_recipient_id è il checkpoint: i destinatari vengono letti a blocchi
+    in ordine di id e il checkpoint avanza nella stessa transazione in cui
+    i messaggi entrano nell'outbox.
+    """
+    __tablename__ = 'broadcast_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    admin_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending / running / completed / failed
+    total_recipients = db.Column(db.Integer, nullable=False, default=0)
+    enqueued_count = db.Column(db.Integer, nullable=False, default=0)
+    last_recipient_id = db.Column(db.Integer, nullable=False, default=0)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
@@ -0,0 +1,18 @@
+# app/models/hold.py
+from app.models.base import db, datetime
+
+class SlotHold(db.Model):
+    """Prenotazione temporanea di un orario (vedi api/holds.py e migrations/008)."""
+    __tablename__ = 'slot_holds'
+    __table_args__ = (
+        db.Index('ix_slot_holds_operator_start', 'operator_id', 'start_time'),
+        db.Index('ix_slot_holds_client_expires', 'client_id', 'expires_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    operator_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
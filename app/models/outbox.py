@@ -0,0 +1,31 @@
+# app/models/outbox.py
+from app.models.base import db, datetime
+
+class OutboxMessage(db.Model):
+    """
+    Messaggio WhatsApp in uscita. Le rotte si limitano a inserire una riga
+    (status='queued'); l'invio vero avviene nel worker di
+    app/services/outbox.py, con retry e backoff.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        db.Index('ix_outbox_status_next', 'status', 'next_attempt_at'),
+        db.Index('ix_outbox_broadcast_status', 'broadcast_id', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False, default='whatsapp')
+    to_number = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / sending / sent / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    provider_id = db.Column(db.String(64))
+    # Messaggi generati da un broadcast: dedup_key impedisce doppi invii
+    # quando un job viene ripreso dopo un crash
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast_jobs.id'))
+    dedup_key = db.Column(db.String(64), unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
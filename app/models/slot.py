@@ -3,10 +3,28 @@ from app.models.base import db, datetime
 
 class Slot(db.Model):
     __tablename__ = 'slots'
+    __table_args__ = (
+        db.Index('ix_slots_operator_day', 'operator_id', 'day_of_week', 'start_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     operator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
-    end_time = db.Column(db.DateTime, nullable=False)
-    is_available = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    day_of_week = db.Column(db.Integer, nullable=False)  # 0-6 per Lun-Dom
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(20))  # pending / approved / rejected
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'operator_id': self.operator_id,
+            'client_id': self.client_id,
+            'day_of_week': self.day_of_week,
+            'start_time': self.start_time.strftime('%H:%M') if self.start_time else None,
+            'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
+            'status': self.status,
+            'is_active': self.is_active
+        }
@@ -0,0 +1,13 @@
+# app/models/stats.py
+from app.models.base import db
+
+class AppointmentStat(db.Model):
+    """
+    Conteggi materializzati degli appuntamenti per (operatore, stato),
+    aggiornati dai trigger di migrations/011 e letti da app/services/stats.py.
+    """
+    __tablename__ = 'appointment_stats'
+
+    operator_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
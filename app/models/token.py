@@ -0,0 +1,11 @@
+# app/models/token.py
+from app.models.base import db, datetime
+
+class RevokedToken(db.Model):
+    """Token di accesso revocato (vedi app/services/tokens.py)."""
+    __tablename__ = 'revoked_tokens'
+
+    jti = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
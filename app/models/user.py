@@ -1,9 +1,10 @@
 # app/models/user.py
+from flask_login import UserMixin
 from app.models.base import db, datetime
 from app.models.appointment import Appointment
 from app.models.slot import Slot
 
-class User(db.Model):
+class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -34,4 +35,17 @@ class User(db.Model):
                                           
     slots = db.relationship('Slot', 
                            backref='operator',
-                           lazy='dynamic')
\ No newline at end of file
+                           foreign_keys='Slot.operator_id',
+                           lazy='dynamic')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'phone': self.phone,
+            'role': self.role,
+            'admin_id': self.admin_id,
+            'specialization': self.specialization,
+            'is_active': self.is_active
+        }
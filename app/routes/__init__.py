@@ -1,3 +1,2 @@
-from app.routes.users import users_bp
-
-app.register_blueprint(users_bp)
+# app/routes/__init__.py
+# I blueprint vengono registrati da create_app (app/__init__.py).
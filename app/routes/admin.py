@@ -1,46 +1,30 @@
 # app/routes/admin.py
 
-import os
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, g, request, jsonify
 from app.extensions import db
 from app.models.user import User
 from app.models.appointment import Appointment
 from app.models.slot import Slot
+from app.services.availability import availability_index, slot_overlaps_in_db
+from app.services.booking import BookingConflict, lock_operator, reserve
+from app.services.directory import cached_directory, invalidate_directory
+from app.services.stats import STATUSES, appointment_stats
+from app.services.outbox import enqueue_whatsapp
+from app.services.passwords import HasherBusy, get_hasher
+from app.services.tokens import admin_required
+from app.services.broadcast import broadcast_progress, create_broadcast
+from app.services.serializers import (admin_appointment_dict, appointment_query,
+                                      stream_json, wants_stream)
+from app.models.broadcast import BroadcastJob
 from datetime import datetime
-from werkzeug.security import generate_password_hash
 from flask_cors import cross_origin
 
-# Per invio WhatsApp
-from twilio.rest import Client  # Assicurati di aver installato 'twilio' con pip
-
 admin_bp = Blueprint('admin', __name__)
 
 # ----------------------------------------------------------------------------
 #                              Utility / Helpers
 # ----------------------------------------------------------------------------
 
-def send_whatsapp_notification(to_number: str, message: str):
-    """
-    Esempio di funzione per inviare messaggi WhatsApp via Twilio.
-    'to_number' deve essere in formato internazionale con prefisso +, 
-    e devi abilitare il sandbox WhatsApp o avere un numero WhatsApp Twilio.
-    """
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID', 'YOUR_TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN', 'YOUR_TWILIO_AUTH_TOKEN')
-    from_whatsapp_number = 'whatsapp:+14155238886'  # Numero di Twilio WhatsApp sandbox o ufficiale
-    to_whatsapp_number = f'whatsapp:{to_number}'
-
-    client = Client(account_sid, auth_token)
-    try:
-        message_obj = client.messages.create(
-            body=message,
-            from_=from_whatsapp_number,
-            to=to_whatsapp_number
-        )
-        print(f"WhatsApp message sent. SID: {message_obj.sid}")
-    except Exception as e:
-        print("Errore nell'invio del messaggio WhatsApp:", e)
-
 def admin_only(admin_id, user: User):
     """
     Esempio di check veloce per verificare che 'user' sia un admin e
@@ -55,10 +39,13 @@ def admin_only(admin_id, user: User):
 # ----------------------------------------------------------------------------
 @admin_bp.route('/notify/whatsapp', methods=['POST'])
 @cross_origin()
+@admin_required
 def notify_whatsapp():
     """
-    Esempio di rotta per inviare un messaggio WhatsApp a TUTTI i clienti
-    associati a un certo admin, o un messaggio di test.
+    Avvia l'invio di un messaggio WhatsApp a TUTTI i clienti associati a
+    un certo admin. La richiesta crea solo un job di broadcast: i
+    destinatari vengono accodati a blocchi in background e l'avanzamento
+    si legge da GET /notify/whatsapp/<job_id>.
     Parametri JSON:
     {
       "admin_id": 1,
@@ -66,23 +53,29 @@ def notify_whatsapp():
     }
     """
     data = request.get_json()
-    admin_id = data.get('admin_id')
+    admin_id = g.admin_id
     message = data.get('message', 'Ciao da Twilio e Flask!')
 
-    # Verifica che l'admin esista
-    admin_user = User.query.filter_by(id=admin_id, role='admin').first()
-    if not admin_user:
-        return jsonify({'error': 'Admin non trovato'}), 404
+    job = create_broadcast(admin_id, message)
 
-    # Prendiamo tutti i clienti associati
-    clients = User.query.filter_by(admin_id=admin_id, role='client').all()
-    
-    # Invia a ogni cliente (se ha un numero di telefono valido)
-    for client in clients:
-        if client.phone:
-            send_whatsapp_notification(client.phone, message)
-    
-    return jsonify({'message': 'WhatsApp inviato a tutti i clienti!'}), 200
+    return jsonify({
+        'message': 'Invio WhatsApp a tutti i clienti avviato',
+        'broadcast': broadcast_progress(job)
+    }), 202
+
+@admin_bp.route('/notify/whatsapp/<int:job_id>', methods=['GET'])
+@cross_origin()
+@admin_required
+def broadcast_status(job_id):
+    """
+    Avanzamento di un broadcast WhatsApp.
+    Query string: ?admin_id=1
+    """
+    admin_id = g.admin_id
+    job = BroadcastJob.query.get_or_404(job_id)
+    if job.admin_id != admin_id:
+        return jsonify({'error': 'Non autorizzato'}), 403
+    return jsonify({'broadcast': broadcast_progress(job)})
 
 # ----------------------------------------------------------------------------
 #                          APPOINTMENTS - CRUD
@@ -90,35 +83,29 @@ def notify_whatsapp():
 
 @admin_bp.route('/appointments/<int:admin_id>', methods=['GET'])
 @cross_origin()
+@admin_required
 def get_appointments(admin_id):
     """
     Ritorna tutti gli appuntamenti relativi agli operatori di uno specifico admin.
+    Con ?stream=1 la risposta viene generata a blocchi.
     """
     try:
-        operator_ids = [op.id for op in User.query.filter_by(admin_id=admin_id, role='operator').all()]
-        appointments = Appointment.query.filter(Appointment.operator_id.in_(operator_ids)).all()
-
-        formatted_appointments = []
-        for apt in appointments:
-            operator = User.query.get(apt.operator_id)
-            client = User.query.get(apt.client_id)
-            formatted_appointments.append({
-                'id': apt.id,
-                'start_time': apt.start_time.isoformat(),
-                'end_time': apt.end_time.isoformat(),
-                'operatorId': operator.id if operator else None,
-                'operatorName': operator.username if operator else "N/A",
-                'clientName': client.username if client else "N/A",
-                'status': apt.status,
-                'service_type': apt.service_type
-            })
-        
-        return jsonify({'appointments': formatted_appointments})
+        # Una sola query: nomi di operatore e cliente in JOIN
+        query, operator, _ = appointment_query()
+        query = query.filter(
+            operator.admin_id == admin_id,
+            operator.role == 'operator'
+        ).order_by(Appointment.start_time, Appointment.id)
+
+        if wants_stream():
+            return stream_json('appointments', query, admin_appointment_dict)
+        return jsonify({'appointments': [admin_appointment_dict(row) for row in query.all()]})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/appointments', methods=['POST'])
 @cross_origin()
+@admin_required
 def add_appointment():
     """
     Aggiunge un nuovo appuntamento.
@@ -133,12 +120,7 @@ def add_appointment():
     }
     """
     data = request.get_json()
-    admin_id = data.get('admin_id')
-    
-    # Controlliamo che l'admin esista
-    admin_user = User.query.filter_by(id=admin_id, role='admin').first()
-    if not admin_user:
-        return jsonify({'error': 'Admin non valido'}), 403
+    admin_id = g.admin_id
 
     # Controlliamo operator e client
     operator = User.query.get(data['operator_id'])
@@ -152,6 +134,12 @@ def add_appointment():
         start_time = datetime.fromisoformat(data['start_time'])
         end_time = datetime.fromisoformat(data['end_time'])
 
+        # Controllo rapido sull'indice in memoria, poi quello definitivo sul DB
+        # sotto lock dell'operatore (fino al commit)
+        if availability_index.appointment_overlaps(operator.id, start_time, end_time) is not None:
+            return jsonify({'error': "L'operatore ha già un appuntamento in questo orario"}), 409
+        reserve(operator.id, start_time, end_time)
+
         new_appointment = Appointment(
             operator_id=operator.id,
             client_id=client.id,
@@ -162,12 +150,14 @@ def add_appointment():
         )
 
         db.session.add(new_appointment)
-        db.session.commit()
 
-        # Eventuale invio di notifica WhatsApp al client
+        # Eventuale notifica WhatsApp al client (accodata nella stessa transazione)
         if client.phone:
             msg = f"Ciao {client.username}, il tuo appuntamento per '{data.get('service_type', '')}' è stato creato il {start_time}."
-            send_whatsapp_notification(client.phone, msg)
+            enqueue_whatsapp(client.phone, msg)
+
+        db.session.commit()
+        availability_index.add_appointment(new_appointment)
 
         return jsonify({
             'message': 'Appuntamento creato con successo',
@@ -175,12 +165,19 @@ def add_appointment():
                 'id': new_appointment.id
             }
         })
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'conflict_id': e.conflict_id}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/appointments/<int:appointment_id>', methods=['PUT'])
 @cross_origin()
+@admin_required
 def update_appointment(appointment_id):
     """
     Aggiorna un appuntamento esistente: orario, stato, etc.
@@ -191,11 +188,7 @@ def update_appointment(appointment_id):
     }
     """
     data = request.get_json()
-    admin_id = data.get('admin_id')
-
-    admin_user = User.query.filter_by(id=admin_id, role='admin').first()
-    if not admin_user:
-        return jsonify({'error': 'Admin non valido'}), 403
+    admin_id = g.admin_id
 
     appointment = Appointment.query.get_or_404(appointment_id)
     operator = User.query.get(appointment.operator_id)
@@ -204,6 +197,7 @@ def update_appointment(appointment_id):
         return jsonify({'error': 'Non autorizzato'}), 403
 
     try:
+        was_cancelled = appointment.status == 'cancelled'
         # Aggiorna lo stato se presente
         new_status = data.get('status')
         if new_status:
@@ -217,21 +211,39 @@ def update_appointment(appointment_id):
         if 'service_type' in data:
             appointment.service_type = data['service_type']
 
-        db.session.commit()
+        moved = 'start_time' in data or 'end_time' in data
+        if appointment.status != 'cancelled' and (moved or was_cancelled):
+            if availability_index.appointment_overlaps(
+                    appointment.operator_id, appointment.start_time, appointment.end_time,
+                    exclude=appointment.id) is not None:
+                db.session.rollback()
+                return jsonify({'error': "L'operatore ha già un appuntamento in questo orario"}), 409
+            reserve(appointment.operator_id, appointment.start_time, appointment.end_time,
+                    exclude=appointment.id, check_duration=moved)
 
         # Eventuale notifica al client del cambio stato
         client = User.query.get(appointment.client_id)
         if client and client.phone and new_status:
             msg = f"Ciao {client.username}, lo stato del tuo appuntamento è ora: {new_status}"
-            send_whatsapp_notification(client.phone, msg)
+            enqueue_whatsapp(client.phone, msg)
+
+        db.session.commit()
+        availability_index.update_appointment(appointment)
 
         return jsonify({'message': 'Appuntamento aggiornato con successo'})
+    except BookingConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'conflict_id': e.conflict_id}), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/appointments/<int:appointment_id>', methods=['DELETE'])
 @cross_origin()
+@admin_required
 def delete_appointment(appointment_id):
     """
     Elimina un appuntamento.
@@ -240,8 +252,7 @@ def delete_appointment(appointment_id):
       "admin_id": 1
     }
     """
-    data = request.get_json()
-    admin_id = data.get('admin_id')
+    admin_id = g.admin_id
 
     appointment = Appointment.query.get_or_404(appointment_id)
     operator = User.query.get(appointment.operator_id)
@@ -252,6 +263,7 @@ def delete_appointment(appointment_id):
     try:
         db.session.delete(appointment)
         db.session.commit()
+        availability_index.remove_appointment(appointment.operator_id, appointment_id)
         return jsonify({'message': 'Appuntamento eliminato con successo'})
     except Exception as e:
         db.session.rollback()
@@ -263,20 +275,24 @@ def delete_appointment(appointment_id):
 
 @admin_bp.route('/operators/<int:admin_id>', methods=['GET'])
 @cross_origin()
+@admin_required
 def get_operators(admin_id):
     """
     Ritorna tutti gli operatori di un determinato admin.
     """
     try:
-        operators = User.query.filter_by(admin_id=admin_id, role='operator').all()
+        operators = cached_directory(admin_id, 'operators', lambda: [
+            op.to_dict() for op in User.query.filter_by(admin_id=admin_id, role='operator').all()
+        ])
         return jsonify({
-            'operators': [op.to_dict() for op in operators]
+            'operators': operators
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/operators/add', methods=['POST'])
 @cross_origin()
+@admin_required
 def add_operator():
     """
     Aggiunge un nuovo operatore all'admin.
@@ -293,10 +309,7 @@ def add_operator():
     try:
         data = request.get_json()
 
-        admin_id = data['admin_id']
-        admin_user = User.query.filter_by(id=admin_id, role='admin').first()
-        if not admin_user:
-            return jsonify({'error': 'Admin non valido'}), 403
+        admin_id = g.admin_id
 
         # Verifica username / email duplicati
         if User.query.filter_by(username=data['username']).first():
@@ -304,6 +317,11 @@ def add_operator():
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'error': 'Email già esistente'}), 400
 
+        try:
+            password_hash = get_hasher().hash(data['password'])
+        except HasherBusy:
+            return jsonify({'error': 'Servizio momentaneamente sovraccarico, riprova tra poco'}), 503
+
         new_operator = User(
             username=data['username'],
             email=data['email'],
@@ -311,11 +329,12 @@ def add_operator():
             role='operator',
             admin_id=admin_id,
             specialization=data['specialization'],
-            password_hash=generate_password_hash(data['password'])
+            password_hash=password_hash
         )
 
         db.session.add(new_operator)
         db.session.commit()
+        invalidate_directory(admin_id, 'operators')
 
         return jsonify({
             'message': 'Operatore aggiunto con successo',
@@ -327,6 +346,7 @@ def add_operator():
 
 @admin_bp.route('/operators/<int:operator_id>', methods=['PUT'])
 @cross_origin()
+@admin_required
 def edit_operator(operator_id):
     """
     Aggiorna i dati di un operatore.
@@ -344,7 +364,7 @@ def edit_operator(operator_id):
         operator = User.query.get_or_404(operator_id)
 
         # Controllo che l'operatore appartenga all'admin
-        if operator.admin_id != data['admin_id']:
+        if operator.admin_id != g.admin_id:
             return jsonify({'error': 'Non autorizzato'}), 403
 
         # Verifica duplicati
@@ -368,6 +388,7 @@ def edit_operator(operator_id):
         operator.specialization = data['specialization']
 
         db.session.commit()
+        invalidate_directory(operator.admin_id, 'operators')
 
         return jsonify({
             'message': 'Operatore aggiornato con successo',
@@ -379,6 +400,7 @@ def edit_operator(operator_id):
 
 @admin_bp.route('/operators/<int:operator_id>', methods=['DELETE'])
 @cross_origin()
+@admin_required
 def delete_operator(operator_id):
     """
     Elimina un operatore e tutti i suoi slot/appuntamenti.
@@ -388,10 +410,9 @@ def delete_operator(operator_id):
     }
     """
     try:
-        data = request.get_json()
         operator = User.query.get_or_404(operator_id)
 
-        if operator.admin_id != data['admin_id']:
+        if operator.admin_id != g.admin_id:
             return jsonify({'error': 'Non autorizzato'}), 403
         
         # Elimina tutti gli slot associati
@@ -402,6 +423,8 @@ def delete_operator(operator_id):
         
         db.session.delete(operator)
         db.session.commit()
+        availability_index.drop_operator(operator_id)
+        invalidate_directory(g.admin_id, 'operators')
         
         return jsonify({'message': 'Operatore eliminato con successo'})
     except Exception as e:
@@ -414,6 +437,7 @@ def delete_operator(operator_id):
 
 @admin_bp.route('/slots/add', methods=['POST'])
 @cross_origin()
+@admin_required
 def add_slot():
     """
     Aggiunge uno slot (fascia oraria) per un operatore.
@@ -428,10 +452,7 @@ def add_slot():
     try:
         data = request.get_json()
 
-        admin_id = data['admin_id']
-        admin_user = User.query.filter_by(id=admin_id, role='admin').first()
-        if not admin_user:
-            return jsonify({'error': 'Admin non valido'}), 403
+        admin_id = g.admin_id
 
         operator = User.query.get(data['operator_id'])
         if not operator or operator.admin_id != admin_id:
@@ -440,18 +461,20 @@ def add_slot():
         start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
         end_time = datetime.fromisoformat(data['end_time'].replace('Z', '+00:00'))
 
-        # Controllo sovrapposizione slot
-        existing_slot = Slot.query.filter(
-            Slot.operator_id == data['operator_id'],
-            Slot.start_time <= end_time.time(),
-            Slot.end_time >= start_time.time()
-        ).first()
+        # Controllo sovrapposizione slot (stesso giorno della settimana): prima
+        # sull'indice in memoria, poi sul DB sotto lock dell'operatore (fino al commit)
+        slot_range = (operator.id, start_time.weekday(), start_time.time(), end_time.time())
+        existing_slot = availability_index.slot_overlaps(*slot_range)
+        if existing_slot is None:
+            lock_operator(operator.id)
+            existing_slot = slot_overlaps_in_db(*slot_range)
 
-        if existing_slot:
+        if existing_slot is not None:
+            db.session.rollback()
             return jsonify({'error': 'Esiste già uno slot sovrapposto in questo orario'}), 400
 
         new_slot = Slot(
-            operator_id=data['operator_id'],
+            operator_id=operator.id,
             start_time=start_time.time(),
             end_time=end_time.time(),
             day_of_week=start_time.weekday()
@@ -459,6 +482,7 @@ def add_slot():
 
         db.session.add(new_slot)
         db.session.commit()
+        availability_index.add_slot(new_slot)
 
         return jsonify({
             'message': 'Slot aggiunto con successo',
@@ -470,6 +494,7 @@ def add_slot():
 
 @admin_bp.route('/slots/<int:slot_id>', methods=['DELETE'])
 @cross_origin()
+@admin_required
 def delete_slot(slot_id):
     """
     Elimina uno slot.
@@ -479,8 +504,7 @@ def delete_slot(slot_id):
     }
     """
     try:
-        data = request.get_json()
-        admin_id = data.get('admin_id')
+        admin_id = g.admin_id
         slot = Slot.query.get_or_404(slot_id)
         operator = User.query.get(slot.operator_id)
 
@@ -489,6 +513,7 @@ def delete_slot(slot_id):
 
         db.session.delete(slot)
         db.session.commit()
+        availability_index.remove_slot(slot.operator_id, slot_id)
         return jsonify({'message': 'Slot eliminato con successo'})
     except Exception as e:
         db.session.rollback()
@@ -500,6 +525,7 @@ def delete_slot(slot_id):
 
 @admin_bp.route('/stats/<int:admin_id>', methods=['GET'])
 @cross_origin()
+@admin_required
 def get_stats(admin_id):
     """
     Restituisce le statistiche generali sugli appuntamenti
@@ -512,31 +538,33 @@ def get_stats(admin_id):
         { "name": "Confirmed", "value": 5 },
         { "name": "Completed", "value": 2 },
         { "name": "Cancelled", "value": 2 }
+      ],
+      "operatorStats": [
+        { "operatorId": 10, "operatorName": "operatore1", "value": 7 }
       ]
     }
     """
     try:
-        operator_ids = [op.id for op in User.query.filter_by(admin_id=admin_id, role='operator').all()]
-        
-        # Conteggio totale
-        total_appointments = Appointment.query.filter(
-            Appointment.operator_id.in_(operator_ids)
-        ).count()
-        
-        status_stats = []
-        for status in ['pending', 'confirmed', 'completed', 'cancelled']:
-            count = Appointment.query.filter(
-                Appointment.operator_id.in_(operator_ids),
-                Appointment.status == status
-            ).count()
-            status_stats.append({
-                'name': status.capitalize(),
-                'value': count
-            })
+        # Una sola query aggregata (per operatore e stato)
+        stats = appointment_stats(admin_id)
+
+        status_stats = [
+            {'name': status.capitalize(), 'value': stats['by_status'].get(status, 0)}
+            for status in STATUSES
+        ]
+        operator_stats = [
+            {
+                'operatorId': op['operator_id'],
+                'operatorName': op['operator_name'],
+                'value': op['appointments_count']
+            }
+            for op in stats['operators']
+        ]
 
         return jsonify({
-            'totalAppointments': total_appointments,
-            'appointmentStats': status_stats
+            'totalAppointments': stats['total_appointments'],
+            'appointmentStats': status_stats,
+            'operatorStats': operator_stats
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
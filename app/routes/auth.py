@@ -1,12 +1,24 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from app.models.user import User  # Assicurati che il percorso sia corretto
 from app.extensions import db  # Assicurati che il percorso sia corretto
 from flask_cors import cross_origin
+from app.services.directory import invalidate_directory
+from app.services.passwords import HasherBusy, get_hasher
+from app.services.tokens import (TokenError, bearer_token, debug_required, decode_token, issue_token,
+                                 revoke_token)
+from api.rate_limit import LoginThrottle, client_ip
 import re  # Per la validazione dell'email
 
 auth_bp = Blueprint('auth', __name__)
 
+# Limite ai tentativi di login (stesso modulo e stesse variabili d'ambiente dell'API)
+login_throttle = LoginThrottle.from_env()
+
+def _busy_response():
+    response = jsonify({'error': 'Servizio momentaneamente sovraccarico, riprova tra poco'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # Funzione per validare l'email
 def is_valid_email(email):
     regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
@@ -35,8 +47,11 @@ def register():
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'error': 'Email già esistente'}), 400
 
-    # Genera hash della password
-    hashed_password = generate_password_hash(data['password'], method='scrypt')
+    # Genera hash della password (nel pool di processi)
+    try:
+        hashed_password = get_hasher().hash(data['password'])
+    except HasherBusy:
+        return _busy_response()
 
     # Crea nuovo utente
     try:
@@ -45,10 +60,13 @@ def register():
             password_hash=hashed_password,
             email=data['email'],
             phone=data.get('phone', ''),  # Campo opzionale
-            role=data.get('role', 'client')  # Default a 'client' se non specificato
+            role=data.get('role', 'client'),  # Default a 'client' se non specificato
+            admin_id=data.get('admin_id')  # Studio di appartenenza, come nell'API
         )
         db.session.add(new_user)
         db.session.commit()
+        # Le liste operatori/clienti dell'admin (anche quelle dell'API) vanno ricaricate
+        invalidate_directory(new_user.admin_id)
 
         return jsonify({
             'message': 'Registrazione completata',
@@ -77,15 +95,33 @@ def login():
         if field not in data or not data[field]:
             return jsonify({'error': f'Campo obbligatorio mancante: {field}'}), 400
 
+    # Prima di qualsiasi query o hash
+    retry_after = login_throttle.check(data['username'], client_ip(request))
+    if retry_after:
+        response = jsonify({'error': 'Troppi tentativi di login, riprova più tardi'})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+
     # Trova l'utente
     user = User.query.filter_by(username=data['username']).first()
     if not user:
         return jsonify({'error': 'Credenziali non valide'}), 401
 
-    # Verifica la password
-    if check_password_hash(user.password_hash, data['password']):
+    # Verifica la password (nel pool di processi); se i parametri dell'hash
+    # sono vecchi, viene salvato l'hash ricalcolato
+    try:
+        valid, new_hash = get_hasher().verify_and_update(user.password_hash, data['password'])
+    except HasherBusy:
+        return _busy_response()
+
+    if valid:
+        login_throttle.reset_user(user.username)
+        if new_hash:
+            user.password_hash = new_hash
+            db.session.commit()
         return jsonify({
             'message': 'Login effettuato con successo',
+            'token': issue_token(user),
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -96,4 +132,23 @@ def login():
             }
         }), 200
 
-    return jsonify({'error': 'Credenziali non valide'}), 401
\ No newline at end of file
+    return jsonify({'error': 'Credenziali non valide'}), 401
+
+@auth_bp.route('/api/auth/logout', methods=['POST'])
+@cross_origin()
+def logout():
+    """Revoca il token della richiesta (Authorization: Bearer ...)."""
+    token = bearer_token()
+    if not token:
+        return jsonify({'error': 'Token mancante'}), 401
+    try:
+        revoke_token(decode_token(token))
+    except TokenError as e:
+        return jsonify({'error': str(e)}), 401
+    return jsonify({'message': 'Logout effettuato'}), 200
+
+@auth_bp.route('/api/debug/password-hasher', methods=['GET'])
+@debug_required
+def password_hasher_metrics():
+    """Contatori e latenze del pool di hashing password."""
+    return jsonify(get_hasher().metrics()), 200
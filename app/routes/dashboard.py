@@ -3,6 +3,9 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
 from app.models.appointment import Appointment, Notification
 from app.extensions import db
+from app.services.stats import appointment_stats
+from app.services.serializers import (appointment_query, client_appointment_dict,
+                                      operator_appointment_dict, stream_json, wants_stream)
 from datetime import datetime, timedelta
 
 dashboard = Blueprint('dashboard', __name__)
@@ -14,24 +17,17 @@ def admin_stats():
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
 
-    # Statistiche di base
-    total_operators = len(current_user.operators)
-    total_appointments = Appointment.query.join(Appointment.operator)\
-        .filter(User.admin_id == current_user.id).count()
-    
-    # Appuntamenti per operatore
-    operator_stats = []
-    for operator in current_user.operators:
-        appointments = Appointment.query.filter_by(operator_id=operator.id).count()
-        operator_stats.append({
-            'operator_name': operator.username,
-            'appointments_count': appointments
-        })
+    # Una sola query aggregata per totali, stati e operatori
+    stats = appointment_stats(current_user.id)
 
     return jsonify({
-        'total_operators': total_operators,
-        'total_appointments': total_appointments,
-        'operator_stats': operator_stats
+        'total_operators': len(stats['operators']),
+        'total_appointments': stats['total_appointments'],
+        'status_stats': stats['by_status'],
+        'operator_stats': [{
+            'operator_name': op['operator_name'],
+            'appointments_count': op['appointments_count']
+        } for op in stats['operators']]
     })
 
 # Operator Dashboard
@@ -45,19 +41,16 @@ def operator_appointments():
     end_date = request.args.get('end_date', 
                                (datetime.now() + timedelta(days=30)).date().isoformat())
 
-    appointments = Appointment.query\
-        .filter_by(operator_id=current_user.id)\
-        .filter(Appointment.datetime.between(start_date, end_date))\
-        .all()
+    query, _, _ = appointment_query()
+    query = query.filter(
+        Appointment.operator_id == current_user.id,
+        Appointment.start_time.between(start_date, end_date)
+    ).order_by(Appointment.start_time)
 
+    if wants_stream():
+        return stream_json('appointments', query, operator_appointment_dict)
     return jsonify({
-        'appointments': [{
-            'id': app.id,
-            'datetime': app.datetime.isoformat(),
-            'client_name': app.client.username,
-            'duration': app.duration,
-            'status': app.status
-        } for app in appointments]
+        'appointments': [operator_appointment_dict(row) for row in query.all()]
     })
 
 # Client Dashboard
@@ -67,17 +60,12 @@ def client_appointments():
     if current_user.role != 'client':
         return jsonify({'error': 'Unauthorized'}), 403
 
-    appointments = Appointment.query\
-        .filter_by(client_id=current_user.id)\
-        .order_by(Appointment.datetime.desc())\
-        .all()
+    query, _, _ = appointment_query()
+    query = query.filter(Appointment.client_id == current_user.id) \
+        .order_by(Appointment.start_time.desc())
 
+    if wants_stream():
+        return stream_json('appointments', query, client_appointment_dict)
     return jsonify({
-        'appointments': [{
-            'id': app.id,
-            'datetime': app.datetime.isoformat(),
-            'operator_name': app.operator.username,
-            'duration': app.duration,
-            'status': app.status
-        } for app in appointments]
-    })
\ No newline at end of file
+        'appointments': [client_appointment_dict(row) for row in query.all()]
+    })
@@ -0,0 +1,402 @@
+# app/services/availability.py
+"""
+Indice in memoria della disponibilità degli operatori.
+
+Per ogni operatore vengono tenuti due alberi di intervalli:
+  - slot settimanali, su un asse "minuti della settimana" (lunedì 00:00 = 0),
+    così il controllo di sovrapposizione tiene conto anche di day_of_week
+  - appuntamenti non annullati, su un asse di minuti assoluti
+
+Entrambi rispondono a "esiste un intervallo che si sovrappone a [s, e)?"
+in O(log n). L'indice di un operatore viene caricato dal DB al primo uso
+(e ricaricato dopo 'ttl' secondi, per assorbire scritture fatte da altri
+processi) e poi aggiornato in modo incrementale dalle rotte che scrivono
+slot e appuntamenti.
+
+Degli appuntamenti si carica solo una finestra limitata (da oggi a
+AVAILABILITY_WINDOW_DAYS giorni), non tutto lo storico: per un intervallo
+fuori dalla finestra l'indice non risponde (None) e decide il controllo
+sul DB. Il caricamento avviene sotto un lock dell'operatore, senza lock
+globali: operatori diversi si caricano e si interrogano in parallelo.
+Il DB resta comunque la fonte di verità (vedi app/services/booking.py).
+"""
+import random
+import threading
+import time as _time
+from datetime import datetime, timedelta
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+# ----------------------------------------------------------------------------
+#                     Albero di intervalli (treap aumentato)
+# ----------------------------------------------------------------------------
+
+class _Node:
+    __slots__ = ('start', 'end', 'key', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, start, end, key):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.priority = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+    def order(self):
+        return (self.start, self.key)
+
+
+def _update(node):
+    node.max_end = node.end
+    if node.left is not None and node.left.max_end > node.max_end:
+        node.max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > node.max_end:
+        node.max_end = node.right.max_end
+
+
+def _split(node, order):
+    """Divide in (< order, >= order)."""
+    if node is None:
+        return None, None
+    if node.order() < order:
+        left, right = _split(node.right, order)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, order)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class IntervalTree:
+    """
+    Insieme di intervalli semiaperti [start, end) identificati da una chiave.
+    Inserimento, rimozione e ricerca di sovrapposizioni in O(log n) atteso.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._items = {}  # key -> (start, end)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def add(self, key, start, end):
+        if key in self._items:
+            self.remove(key)
+        node = _Node(start, end, key)
+        left, right = _split(self._root, node.order())
+        self._root = _merge(_merge(left, node), right)
+        self._items[key] = (start, end)
+
+    def remove(self, key):
+        if key not in self._items:
+            return False
+        start, _ = self._items.pop(key)
+        self._root = _delete(self._root, (start, key))
+        return True
+
+    def find_overlap(self, start, end, exclude=None):
+        """Chiave di un intervallo che si sovrappone a [start, end), o None."""
+        if exclude is not None:
+            return self._find_overlap_excluding(start, end, exclude)
+        node = self._root
+        while node is not None:
+            if node.start < end and node.end > start:
+                return node.key
+            # Se a sinistra c'è un intervallo che finisce dopo 'start' ma non
+            # si sovrappone, inizia dopo 'end': a destra non c'è nulla
+            if node.left is not None and node.left.max_end > start:
+                node = node.left
+            else:
+                node = node.right
+        return None
+
+    def _find_overlap_excluding(self, start, end, exclude):
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            if node.start < end and node.end > start and node.key != exclude:
+                return node.key
+            stack.append(node.left)
+            if node.start < end:
+                stack.append(node.right)
+        return None
+
+
+def _delete(node, order):
+    if node is None:
+        return None
+    node_order = node.order()
+    if node_order == order:
+        return _merge(node.left, node.right)
+    if order < node_order:
+        node.left = _delete(node.left, order)
+    else:
+        node.right = _delete(node.right, order)
+    _update(node)
+    return node
+
+
+# ----------------------------------------------------------------------------
+#                     Conversioni orari -> assi dell'indice
+# ----------------------------------------------------------------------------
+
+def _minutes(value):
+    if isinstance(value, timedelta):  # colonne TIME lette da pymysql
+        return int(value.total_seconds()) // 60 % MINUTES_PER_DAY
+    return value.hour * 60 + value.minute
+
+
+def weekly_ranges(day_of_week, start_time, end_time):
+    """
+    Intervalli sull'asse settimanale per uno slot ricorrente. Uno slot che
+    scavalca la mezzanotte della domenica viene spezzato in due.
+    """
+    start = int(day_of_week) * MINUTES_PER_DAY + _minutes(start_time)
+    end = int(day_of_week) * MINUTES_PER_DAY + _minutes(end_time)
+    if end <= start:
+        end += MINUTES_PER_DAY
+    if end <= MINUTES_PER_WEEK:
+        return [(start, end)]
+    return [(start, MINUTES_PER_WEEK), (0, end - MINUTES_PER_WEEK)]
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def absolute_range(start_dt, end_dt):
+    """Intervallo in minuti assoluti per un appuntamento."""
+    start_dt = start_dt.replace(tzinfo=None)
+    end_dt = end_dt.replace(tzinfo=None)
+    return ((start_dt - _EPOCH).total_seconds() / 60,
+            (end_dt - _EPOCH).total_seconds() / 60)
+
+
+# ----------------------------------------------------------------------------
+#                              Indice per operatore
+# ----------------------------------------------------------------------------
+
+class _OperatorIndex:
+    def __init__(self, window_start, window_end):
+        self.slots = IntervalTree()
+        self.appointments = IntervalTree()
+        self.window = absolute_range(window_start, window_end)
+        self.loaded_at = _time.monotonic()
+        self.lock = threading.Lock()
+
+    def covers(self, start, end):
+        return self.window[0] <= start and end <= self.window[1]
+
+
+class AvailabilityIndex:
+    """Indice di slot e appuntamenti per operatore, caricato on demand."""
+
+    def __init__(self, ttl=60, window_days=60):
+        self.ttl = ttl
+        self.window_days = window_days
+        self._operators = {}
+        self._loading = {}    # operator_id -> Lock del caricamento in corso
+        self._versions = {}   # operator_id -> numero di aggiornamenti incrementali
+        self._lock = threading.Lock()
+
+    # --- interrogazioni ---------------------------------------------------
+    def slot_overlaps(self, operator_id, day_of_week, start_time, end_time):
+        """Id di uno slot dell'operatore sovrapposto (stesso giorno e orario), o None."""
+        index = self._operator(operator_id)
+        with index.lock:
+            return _slot_hit(index.slots, weekly_ranges(day_of_week, start_time, end_time))
+
+    def appointment_overlaps(self, operator_id, start_dt, end_dt, exclude=None):
+        """
+        Id di un appuntamento dell'operatore sovrapposto, o None (anche
+        quando l'intervallo è fuori dalla finestra caricata).
+        """
+        start, end = absolute_range(start_dt, end_dt)
+        index = self._operator(operator_id)
+        with index.lock:
+            if not index.covers(start, end):
+                return None
+            return index.appointments.find_overlap(start, end, exclude=exclude)
+
+    # --- aggiornamenti incrementali -------------------------------------------
+    def add_slot(self, slot):
+        index = self._loaded(slot.operator_id)
+        if index is None:
+            return  # verrà caricato dal DB al primo uso
+        with index.lock:
+            self._remove_slot(index, slot.id)
+            ranges = weekly_ranges(slot.day_of_week, slot.start_time, slot.end_time)
+            for part, (start, end) in enumerate(ranges):
+                index.slots.add((slot.id, part), start, end)
+
+    def remove_slot(self, operator_id, slot_id):
+        index = self._loaded(operator_id)
+        if index is not None:
+            with index.lock:
+                self._remove_slot(index, slot_id)
+
+    def add_appointment(self, appointment):
+        index = self._loaded(appointment.operator_id)
+        if index is None:
+            return
+        with index.lock:
+            if appointment.status == 'cancelled':
+                index.appointments.remove(appointment.id)
+            else:
+                index.appointments.add(
+                    appointment.id,
+                    *absolute_range(appointment.start_time, appointment.end_time))
+
+    update_appointment = add_appointment
+
+    def remove_appointment(self, operator_id, appointment_id):
+        index = self._loaded(operator_id)
+        if index is not None:
+            with index.lock:
+                index.appointments.remove(appointment_id)
+
+    def drop_operator(self, operator_id):
+        with self._lock:
+            self._operators.pop(operator_id, None)
+            self._versions[operator_id] = self._versions.get(operator_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._operators.clear()
+
+    # --- interni ---------------------------------------------------------------
+    @staticmethod
+    def _remove_slot(index, slot_id):
+        index.slots.remove((slot_id, 0))
+        index.slots.remove((slot_id, 1))
+
+    def _loaded(self, operator_id):
+        """
+        Indice già caricato (None altrimenti), per un aggiornamento
+        incrementale. Un caricamento in corso potrebbe aver letto il DB
+        prima della scrittura: il contatore lo fa scartare (vedi _operator).
+        """
+        with self._lock:
+            self._versions[operator_id] = self._versions.get(operator_id, 0) + 1
+            return self._operators.get(operator_id)
+
+    def _fresh(self, operator_id):
+        index = self._operators.get(operator_id)
+        if index is not None and _time.monotonic() - index.loaded_at <= self.ttl:
+            return index
+        return None
+
+    def _operator(self, operator_id):
+        with self._lock:
+            index = self._fresh(operator_id)
+            if index is not None:
+                return index
+            loading = self._loading.setdefault(operator_id, threading.Lock())
+
+        # Una sola richiesta carica l'operatore; la query avviene senza il lock globale
+        with loading:
+            with self._lock:
+                index = self._fresh(operator_id)
+                if index is not None:
+                    return index
+                version = self._versions.get(operator_id, 0)
+            try:
+                index = self._load(operator_id)
+            finally:
+                with self._lock:
+                    self._loading.pop(operator_id, None)
+            with self._lock:
+                if self._versions.get(operator_id, 0) != version:
+                    # Scrittura durante il caricamento: indice usato solo da questa richiesta
+                    index.loaded_at = float('-inf')
+                self._operators[operator_id] = index
+        return index
+
+    def _load(self, operator_id):
+        # Import locale: il modulo resta usabile (e testabile) senza app Flask
+        from flask import current_app
+        from app.models.appointment import Appointment
+        from app.extensions import db
+
+        window_days = current_app.config.get('AVAILABILITY_WINDOW_DAYS', self.window_days)
+        max_duration = timedelta(hours=current_app.config.get('BOOKING_MAX_DURATION_HOURS', 12))
+        window_start = datetime.combine(datetime.now().date(), datetime.min.time())
+        window_end = window_start + timedelta(days=window_days)
+
+        index = _OperatorIndex(window_start, window_end)
+        for slot_id, day_of_week, start_time, end_time in _operator_slots(operator_id):
+            for part, (start, end) in enumerate(
+                    weekly_ranges(day_of_week, start_time, end_time)):
+                index.slots.add((slot_id, part), start, end)
+
+        # Solo gli appuntamenti che toccano la finestra (indice operator_id, start_time)
+        appointments = db.session.query(
+            Appointment.id, Appointment.start_time, Appointment.end_time
+        ).filter(
+            Appointment.operator_id == operator_id,
+            Appointment.start_time < window_end,
+            Appointment.start_time > window_start - max_duration,
+            Appointment.end_time > window_start,
+            Appointment.status != 'cancelled'
+        ).all()
+        for appointment_id, start_dt, end_dt in appointments:
+            index.appointments.add(appointment_id, *absolute_range(start_dt, end_dt))
+        return index
+
+
+def _slot_hit(tree, ranges):
+    for start, end in ranges:
+        hit = tree.find_overlap(start, end)
+        if hit is not None:
+            return hit[0]
+    return None
+
+
+def _operator_slots(operator_id):
+    from app.models.slot import Slot
+    from app.extensions import db
+
+    return [row for row in db.session.query(
+        Slot.id, Slot.day_of_week, Slot.start_time, Slot.end_time
+    ).filter(Slot.operator_id == operator_id).all() if row[1] is not None]
+
+
+def slot_overlaps_in_db(operator_id, day_of_week, start_time, end_time):
+    """
+    Come AvailabilityIndex.slot_overlaps ma sugli slot letti ora dal DB:
+    da usare nella transazione che inserisce lo slot, dopo il lock
+    dell'operatore (app/services/booking.py: lock_operator).
+    """
+    tree = IntervalTree()
+    for slot_id, dow, start, end in _operator_slots(operator_id):
+        for part, (lo, hi) in enumerate(weekly_ranges(dow, start, end)):
+            tree.add((slot_id, part), lo, hi)
+    return _slot_hit(tree, weekly_ranges(day_of_week, start_time, end_time))
+
+
+# Istanza condivisa dalle rotte
+availability_index = AvailabilityIndex()
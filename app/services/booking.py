@@ -0,0 +1,81 @@
+# app/services/booking.py
+"""
+Controllo atomico delle sovrapposizioni per le rotte dell'app.
+
+reserve() va chiamata nella transazione che poi inserisce o sposta
+l'appuntamento. Usa lo stesso BookingEngine dell'API serverless
+(api/booking.py) sulla connessione della sessione SQLAlchemy: blocca la
+riga dell'operatore (SELECT ... FOR UPDATE) e cerca nel DB un
+appuntamento non annullato o una prenotazione temporanea attiva
+(slot_holds, vedi api/holds.py) che si sovrappone. Il lock resta fino al
+commit della sessione, quindi due prenotazioni concorrenti per lo stesso
+operatore non possono passare entrambe; operatori diversi non si
+attendono.
+
+L'indice in memoria (app/services/availability.py) resta un controllo
+rapido per rifiutare subito i conflitti evidenti, ma non è la garanzia:
+è per processo e può essere indietro rispetto al DB.
+"""
+from datetime import timedelta
+
+from flask import current_app
+
+from api.booking import BookingConflict, BookingEngine, BookingError, parse_interval  # noqa: F401
+from app.extensions import db
+
+
+def init_booking(app):
+    engine = BookingEngine(max_duration=timedelta(hours=app.config.get('BOOKING_MAX_DURATION_HOURS', 12)))
+    app.extensions['booking'] = engine
+    return engine
+
+
+def booking_engine():
+    engine = current_app.extensions.get('booking')
+    return engine if engine is not None else init_booking(current_app)
+
+
+def validate_interval(start, end):
+    """ValueError se l'intervallo non è valido o supera la durata massima."""
+    try:
+        return parse_interval(start, end, booking_engine().max_duration)
+    except BookingError as e:
+        raise ValueError(str(e))
+
+
+def lock_operator(operator_id):
+    """
+    Blocca la riga dell'operatore fino al commit della sessione (None se
+    non è un operatore): serializza le scritture sui suoi slot e
+    appuntamenti fatte da tutte le istanze.
+    """
+    with db.session.no_autoflush:
+        cursor = db.session.connection().connection.cursor()
+        try:
+            return booking_engine().lock_operator(cursor, operator_id)
+        finally:
+            cursor.close()
+
+
+def reserve(operator_id, start, end, exclude=None, check_duration=True):
+    """
+    Blocca l'operatore fino al commit e verifica che [start, end) sia
+    libero nel DB. Solleva BookingConflict in caso di sovrapposizione.
+    check_duration=False per un intervallo già salvato che non cambia
+    (es. riattivazione): come BookingEngine.check_reschedule, la durata
+    massima vale solo per orari nuovi.
+    """
+    if check_duration:
+        start, end = validate_interval(start, end)
+    engine = booking_engine()
+    # Il lock sull'operatore deve essere il primo della transazione (niente autoflush)
+    lock_operator(operator_id)
+    with db.session.no_autoflush:
+        cursor = db.session.connection().connection.cursor()
+        try:
+            conflict = engine.find_conflict(cursor, operator_id, start, end, exclude_id=exclude)
+        finally:
+            cursor.close()
+    if conflict is not None:
+        engine.conflicts += 1
+        raise BookingConflict(conflict[1], kind=conflict[0])
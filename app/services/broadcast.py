@@ -0,0 +1,211 @@
+# app/services/broadcast.py
+"""
+Broadcast WhatsApp verso tutti i clienti di un admin.
+
+La richiesta HTTP crea solo un BroadcastJob e risponde subito. Un
+BroadcastRunner in background legge i destinatari a blocchi (in ordine di
+id, a partire da last_recipient_id) e per ogni blocco, in un'unica
+transazione, inserisce i messaggi nell'outbox e fa avanzare il
+checkpoint. Se il processo muore a metà, il job viene ripreso dal
+checkpoint; in più ogni messaggio ha una dedup_key univoca
+("broadcast:<job>:<utente>"), quindi anche un blocco ripetuto non genera
+doppi invii. L'invio vero, con concorrenza e limite al secondo, resta
+compito del worker dell'outbox.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, or_, and_
+
+from app.extensions import db
+from app.models.broadcast import BroadcastJob
+from app.models.outbox import OutboxMessage
+from app.models.user import User
+from app.services.outbox import get_worker
+
+logger = logging.getLogger(__name__)
+
+
+def _recipients_query(admin_id):
+    return db.session.query(User.id, User.phone).filter(
+        User.admin_id == admin_id,
+        User.role == 'client',
+        User.phone.isnot(None),
+        User.phone != ''
+    )
+
+
+def create_broadcast(admin_id, message):
+    """Crea il job (con il numero di destinatari) e sveglia il runner."""
+    total = _recipients_query(admin_id).with_entities(func.count(User.id)).scalar()
+    job = BroadcastJob(admin_id=admin_id, message=message, status='pending',
+                       total_recipients=total or 0)
+    db.session.add(job)
+    db.session.commit()
+    if _runner is not None:
+        _runner.wake()
+    return job
+
+
+def broadcast_progress(job):
+    """Stato del job con i conteggi dei messaggi per stato (una query)."""
+    counts = dict(db.session.query(OutboxMessage.status, func.count(OutboxMessage.id))
+                  .filter(OutboxMessage.broadcast_id == job.id)
+                  .group_by(OutboxMessage.status).all())
+    return {
+        'id': job.id,
+        'status': job.status,
+        'total_recipients': job.total_recipients,
+        'enqueued': job.enqueued_count,
+        'queued': counts.get('queued', 0) + counts.get('sending', 0),
+        'sent': counts.get('sent', 0),
+        'failed': counts.get('failed', 0),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def enqueue_next_chunk(job_id, chunk_size):
+    """
+    Accoda il blocco successivo di destinatari del job. Restituisce False
+    quando non ci sono più destinatari (il job viene chiuso).
+    """
+    job = db.session.get(BroadcastJob, job_id)
+    rows = _recipients_query(job.admin_id).filter(
+        User.id > job.last_recipient_id
+    ).order_by(User.id).limit(chunk_size).all()
+
+    now = datetime.utcnow()
+    if not rows:
+        job.status = 'completed'
+        job.finished_at = now
+        job.locked_at = None
+        db.session.commit()
+        return False
+
+    stmt = insert(OutboxMessage.__table__) \
+        .prefix_with('IGNORE', dialect='mysql') \
+        .prefix_with('OR IGNORE', dialect='sqlite')
+    db.session.execute(stmt, [{
+        'channel': 'whatsapp',
+        'to_number': phone,
+        'message': job.message,
+        'status': 'queued',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'broadcast_id': job.id,
+        'dedup_key': f'broadcast:{job.id}:{user_id}'
+    } for user_id, phone in rows])
+
+    # Checkpoint nella stessa transazione dei messaggi
+    job.last_recipient_id = rows[-1][0]
+    job.enqueued_count += len(rows)
+    job.locked_at = now
+    db.session.commit()
+    return True
+
+
+class BroadcastRunner:
+    """Thread in background che porta avanti i job pending/interrotti."""
+
+    def __init__(self, app, chunk_size=500, poll_interval=5.0, lease_timeout=120.0):
+        self.app = app
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='broadcast-runner',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def run_pending(self):
+        """Esegue fino in fondo i job disponibili. Restituisce quanti ne ha presi."""
+        processed = 0
+        while not self._stop.is_set():
+            job_id = self._claim()
+            if job_id is None:
+                break
+            processed += 1
+            self._run_job(job_id)
+        return processed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_pending()
+            except Exception as e:
+                logger.error(f"Errore runner broadcast: {e}")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lease_timeout)
+        with self.app.app_context():
+            claimable = or_(
+                BroadcastJob.status == 'pending',
+                # Job rimasto a metà: il processo che lo eseguiva non c'è più
+                and_(BroadcastJob.status == 'running',
+                     or_(BroadcastJob.locked_at.is_(None), BroadcastJob.locked_at < stale))
+            )
+            job_ids = [row[0] for row in db.session.query(BroadcastJob.id)
+                       .filter(claimable).order_by(BroadcastJob.id).limit(5).all()]
+            for job_id in job_ids:
+                updated = db.session.query(BroadcastJob).filter(
+                    BroadcastJob.id == job_id, claimable
+                ).update({'status': 'running', 'locked_at': now},
+                         synchronize_session=False)
+                db.session.commit()
+                if updated:
+                    return job_id
+        return None
+
+    def _run_job(self, job_id):
+        with self.app.app_context():
+            try:
+                while not self._stop.is_set():
+                    more = enqueue_next_chunk(job_id, self.chunk_size)
+                    worker = get_worker()
+                    if worker is not None:
+                        worker.wake()
+                    if not more:
+                        break
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Errore broadcast {job_id}: {e}")
+                db.session.query(BroadcastJob).filter_by(id=job_id).update(
+                    {'status': 'failed', 'last_error': str(e)[:1000], 'locked_at': None},
+                    synchronize_session=False)
+                db.session.commit()
+
+
+_runner = None
+
+
+def init_broadcasts(app):
+    """Crea (e, se OUTBOX_WORKER_ENABLED, avvia) il runner dei broadcast."""
+    global _runner
+    _runner = BroadcastRunner(app, chunk_size=app.config.get('BROADCAST_CHUNK_SIZE', 500))
+    app.extensions['broadcasts'] = _runner
+    if app.config.get('OUTBOX_WORKER_ENABLED', True):
+        _runner.start()
+    return _runner
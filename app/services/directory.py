@@ -0,0 +1,32 @@
+# app/services/directory.py
+"""
+Cache delle liste operatori/clienti per admin, condivisa con l'API
+serverless (api/directory_cache.py). Con DIRECTORY_CACHE_BACKEND=redis
+le due app usano lo stesso backend e ognuna invalida anche le voci
+dell'altra (DIRECTORY_CACHE_SHARED=1, quando sono in servizio entrambe,
+lo rende obbligatorio); /api/debug/directory-cache mostra l'hit rate (con
+DEBUG_ENDPOINTS).
+"""
+from flask import current_app, jsonify
+
+from api.directory_cache import DirectoryCache, make_backend
+from app.services.tokens import debug_required
+
+
+def init_directory_cache(app):
+    backend = make_backend(app.config.get('DIRECTORY_CACHE_BACKEND', 'memory'),
+                           app.config.get('REDIS_URL'),
+                           shared=app.config.get('DIRECTORY_CACHE_SHARED', False))
+    cache = DirectoryCache(backend, view='app', ttl=app.config.get('DIRECTORY_CACHE_TTL', 60))
+    app.add_url_rule('/api/debug/directory-cache', 'directory_cache',
+                     debug_required(lambda: (jsonify(cache.stats()), 200)))
+    app.extensions['directory_cache'] = cache
+    return cache
+
+
+def cached_directory(admin_id, kind, loader):
+    return current_app.extensions['directory_cache'].get_or_load(admin_id, kind, loader)
+
+
+def invalidate_directory(admin_id, *kinds):
+    current_app.extensions['directory_cache'].invalidate(admin_id, *kinds)
@@ -0,0 +1,25 @@
+# app/services/metrics.py
+"""
+Metriche per richiesta dell'app: stesso registro e stesso formato
+dell'API serverless (api/request_metrics.py). Le query vengono contate
+con gli eventi degli Engine SQLAlchemy; /metrics espone gli istogrammi
+in formato Prometheus e /api/debug/requests il riepilogo per rotta
+(entrambe solo con DEBUG_ENDPOINTS e il token di un admin).
+"""
+from flask import Response, jsonify
+
+from api.request_metrics import RequestMetrics, instrument_sqlalchemy
+from app.services.tokens import debug_required
+
+
+def init_metrics(app):
+    metrics = RequestMetrics(query_warning=app.config.get('REQUEST_QUERY_WARNING', 30))
+    metrics.init_app(app)
+    instrument_sqlalchemy()
+
+    app.add_url_rule('/metrics', 'metrics', debug_required(
+        lambda: Response(metrics.render(), mimetype='text/plain; version=0.0.4')))
+    app.add_url_rule('/api/debug/requests', 'request_metrics', debug_required(
+        lambda: (jsonify(metrics.summary()), 200)))
+    app.extensions['request_metrics'] = metrics
+    return metrics
@@ -0,0 +1,313 @@
+# app/services/outbox.py
+"""
+Outbox persistente per le notifiche WhatsApp.
+
+Le rotte chiamano enqueue_whatsapp(), che aggiunge una riga a
+notification_outbox nella stessa transazione dell'operazione che la
+genera: se l'appuntamento non viene salvato, neanche il messaggio parte.
+Un OutboxWorker in background preleva i messaggi scaduti, li "prenota"
+con un UPDATE condizionato (così più processi possono girare insieme
+senza doppi invii) e li spedisce con un pool di thread a concorrenza
+limitata e, se configurato, un limite di messaggi al secondo verso il
+provider (OUTBOX_RATE_LIMIT). In caso di errore il messaggio viene ripianificato con backoff
+esponenziale, fino a max_attempts tentativi.
+
+Il provider è configurabile (WHATSAPP_PROVIDER = 'twilio' | 'fake'):
+FakeWhatsAppProvider non fa chiamate di rete e permette di simulare
+errori e latenza, per lavorare offline.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_, and_
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models.outbox import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------
+#                                 Provider
+# ----------------------------------------------------------------------------
+
+class TwilioWhatsAppProvider:
+    """Invio tramite Twilio. Il client viene creato una sola volta e riusato."""
+
+    def __init__(self, account_sid, auth_token, from_number='+14155238886'):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                # Import locale: twilio serve solo a chi invia davvero
+                from twilio.rest import Client
+                self._client = Client(self.account_sid, self.auth_token)
+            return self._client
+
+    def send(self, to_number, message):
+        message_obj = self._get_client().messages.create(
+            body=message,
+            from_=f'whatsapp:{self.from_number}',
+            to=f'whatsapp:{to_number}'
+        )
+        return message_obj.sid
+
+
+class FakeWhatsAppProvider:
+    """
+    Provider finto: registra i messaggi in memoria. 'fail_first' fa fallire
+    i primi N invii, 'latency' simula la lentezza del provider.
+    """
+
+    def __init__(self, fail_first=0, latency=0.0):
+        self.fail_first = fail_first
+        self.latency = latency
+        self.sent = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send(self, to_number, message):
+        if self.latency:
+            threading.Event().wait(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.fail_first:
+                raise RuntimeError('Errore simulato del provider')
+            self.sent.append((to_number, message))
+            return f'fake-{len(self.sent)}'
+
+
+def provider_from_config(config):
+    name = config.get('WHATSAPP_PROVIDER', 'twilio')
+    if name == 'fake':
+        return FakeWhatsAppProvider()
+    return TwilioWhatsAppProvider(
+        os.getenv('TWILIO_ACCOUNT_SID', 'YOUR_TWILIO_ACCOUNT_SID'),
+        os.getenv('TWILIO_AUTH_TOKEN', 'YOUR_TWILIO_AUTH_TOKEN'),
+        os.getenv('TWILIO_PHONE_NUMBER', '+14155238886')
+    )
+
+
+class RateLimiter:
+    """
+    Token bucket condiviso dai thread di invio: al massimo 'rate' messaggi
+    al secondo verso il provider, con raffiche fino a 'burst'.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ----------------------------------------------------------------------------
+#                                 Accodamento
+# ----------------------------------------------------------------------------
+
+def enqueue_whatsapp(to_number, message):
+    """
+    Accoda un messaggio WhatsApp. La riga viene aggiunta alla sessione
+    corrente: sarà il commit del chiamante a renderla visibile al worker.
+    """
+    outbox_message = OutboxMessage(
+        channel='whatsapp',
+        to_number=to_number,
+        message=message,
+        status='queued',
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(outbox_message)
+    db.session.info['outbox_wake'] = True
+    return outbox_message
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_worker_after_commit(session):
+    if session.info.pop('outbox_wake', False) and _worker is not None:
+        _worker.wake()
+
+
+# ----------------------------------------------------------------------------
+#                                   Worker
+# ----------------------------------------------------------------------------
+
+class OutboxWorker:
+    """Dispatcher in background + pool di thread per gli invii."""
+
+    def __init__(self, app, provider, max_workers=4, batch_size=50,
+                 poll_interval=2.0, max_attempts=5, backoff_base=5.0,
+                 backoff_max=600.0, lease_timeout=120.0, rate_limit=None):
+        self.app = app
+        self.provider = provider
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_timeout = lease_timeout
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='outbox')
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._executor.shutdown(wait=True)
+
+    def wake(self):
+        self._wake.set()
+
+    def process_due(self):
+        """
+        Preleva e invia un lotto di messaggi scaduti, attendendo la fine
+        degli invii. Restituisce il numero di messaggi elaborati.
+        """
+        claimed = self._claim()
+        futures = [self._executor.submit(self._deliver, *item) for item in claimed]
+        for future in futures:
+            future.result()
+        return len(claimed)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_due()
+            except Exception as e:
+                logger.error(f"Errore worker outbox: {e}")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lease_timeout)
+        with self.app.app_context():
+            due = db.session.query(OutboxMessage.id, OutboxMessage.status).filter(or_(
+                and_(OutboxMessage.status == 'queued', OutboxMessage.next_attempt_at <= now),
+                # Invii rimasti a metà (processo morto durante l'invio): vengono
+                # ritentati, quindi la consegna è "almeno una volta"
+                and_(OutboxMessage.status == 'sending', OutboxMessage.locked_at < stale)
+            )).order_by(OutboxMessage.next_attempt_at).limit(self.batch_size).all()
+
+            claimed = []
+            for message_id, status in due:
+                query = db.session.query(OutboxMessage).filter(
+                    OutboxMessage.id == message_id,
+                    OutboxMessage.status == status
+                )
+                if status == 'sending':
+                    query = query.filter(OutboxMessage.locked_at < stale)
+                updated = query.update({
+                    'status': 'sending',
+                    'locked_at': now,
+                    'attempts': OutboxMessage.attempts + 1
+                }, synchronize_session=False)
+                if updated:
+                    claimed.append(message_id)
+            db.session.commit()
+
+            if not claimed:
+                return []
+            rows = db.session.query(
+                OutboxMessage.id, OutboxMessage.to_number,
+                OutboxMessage.message, OutboxMessage.attempts
+            ).filter(OutboxMessage.id.in_(claimed)).all()
+            return [tuple(row) for row in rows]
+
+    def _deliver(self, message_id, to_number, message, attempts):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            provider_id = self.provider.send(to_number, message)
+            values = {
+                'status': 'sent',
+                'provider_id': provider_id,
+                'sent_at': datetime.utcnow(),
+                'locked_at': None,
+                'last_error': None
+            }
+        except Exception as e:
+            logger.warning(f"Invio WhatsApp {message_id} fallito (tentativo {attempts}): {e}")
+            values = {'last_error': str(e)[:1000], 'locked_at': None}
+            if attempts >= self.max_attempts:
+                values['status'] = 'failed'
+            else:
+                values['status'] = 'queued'
+                values['next_attempt_at'] = datetime.utcnow() + self._backoff(attempts)
+
+        with self.app.app_context():
+            db.session.query(OutboxMessage).filter(
+                OutboxMessage.id == message_id,
+                OutboxMessage.status == 'sending'
+            ).update(values, synchronize_session=False)
+            db.session.commit()
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+_worker = None
+
+
+def get_worker():
+    return _worker
+
+
+def init_outbox(app):
+    """
+    Crea il worker dell'outbox per l'app e, se OUTBOX_WORKER_ENABLED è
+    attivo, lo avvia in background.
+    """
+    global _worker
+    _worker = OutboxWorker(
+        app,
+        provider_from_config(app.config),
+        max_workers=app.config.get('OUTBOX_MAX_WORKERS', 4),
+        max_attempts=app.config.get('OUTBOX_MAX_ATTEMPTS', 5),
+        rate_limit=app.config.get('OUTBOX_RATE_LIMIT')
+    )
+    app.extensions['outbox'] = _worker
+    if app.config.get('OUTBOX_WORKER_ENABLED', True):
+        _worker.start()
+    return _worker
@@ -0,0 +1,22 @@
+# app/services/passwords.py
+"""
+Hashing delle password fuori dal thread della richiesta.
+
+PasswordHasher (pool di processi, coda limitata, rehash pigro, metriche)
+è quello di api/passwords.py, condiviso con l'API serverless e con
+l'import massivo: qui c'è solo il collegamento alla configurazione
+dell'app (PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE,
+PASSWORD_HASH_METHOD). L'hasher è uno per processo, così l'app non apre
+un secondo pool accanto a quello dell'API.
+"""
+from api.passwords import HasherBusy, PasswordHasher, get_hasher, set_hasher  # noqa: F401
+
+
+def init_passwords(app):
+    hasher = set_hasher(PasswordHasher(
+        max_workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_queue=app.config.get('PASSWORD_HASH_QUEUE', 32),
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    ))
+    app.extensions['passwords'] = hasher
+    return hasher
@@ -0,0 +1,110 @@
+# app/services/serializers.py
+"""
+Serializzazione condivisa degli appuntamenti.
+
+appointment_query() legge solo le colonne necessarie, con nome di
+operatore e cliente presi in JOIN: una sola query qualunque sia il numero
+di righe (niente User.query.get per riga, niente lazy load di
+app.client / app.operator).
+
+stream_json() produce la risposta un pezzo alla volta, leggendo le righe
+a blocchi con yield_per: anche con decine di migliaia di appuntamenti la
+memoria resta limitata e le query restano quelle iniziali.
+"""
+import json
+
+from flask import Response, request, stream_with_context
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models.appointment import Appointment
+from app.models.user import User
+
+STREAM_BATCH_SIZE = 1000
+
+
+def appointment_query():
+    """Query a colonne con i nomi di operatore e cliente (LEFT JOIN su users)."""
+    operator = aliased(User, name='operator')
+    client = aliased(User, name='client')
+    query = db.session.query(
+        Appointment.id,
+        Appointment.start_time,
+        Appointment.end_time,
+        Appointment.status,
+        Appointment.service_type,
+        Appointment.operator_id,
+        operator.username.label('operator_name'),
+        Appointment.client_id,
+        client.username.label('client_name')
+    ).outerjoin(operator, operator.id == Appointment.operator_id) \
+     .outerjoin(client, client.id == Appointment.client_id)
+    return query, operator, client
+
+
+def duration_minutes(row):
+    return int((row.end_time - row.start_time).total_seconds() // 60)
+
+
+def admin_appointment_dict(row):
+    """Formato della lista appuntamenti dell'admin."""
+    return {
+        'id': row.id,
+        'start_time': row.start_time.isoformat(),
+        'end_time': row.end_time.isoformat(),
+        'operatorId': row.operator_id,
+        'operatorName': row.operator_name or "N/A",
+        'clientName': row.client_name or "N/A",
+        'status': row.status,
+        'service_type': row.service_type
+    }
+
+
+def operator_appointment_dict(row):
+    """Formato della dashboard operatore."""
+    return {
+        'id': row.id,
+        'datetime': row.start_time.isoformat(),
+        'client_name': row.client_name,
+        'duration': duration_minutes(row),
+        'status': row.status
+    }
+
+
+def client_appointment_dict(row):
+    """Formato della dashboard cliente."""
+    return {
+        'id': row.id,
+        'datetime': row.start_time.isoformat(),
+        'operator_name': row.operator_name,
+        'duration': duration_minutes(row),
+        'status': row.status
+    }
+
+
+def wants_stream():
+    """True se la richiesta chiede la risposta in streaming (?stream=1)."""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_json(key, query, serializer, batch_size=STREAM_BATCH_SIZE):
+    """
+    Risposta JSON {"<key>": [...]} generata a blocchi. La query viene letta
+    con yield_per (cursore lato server dove il driver lo supporta).
+    """
+    def generate():
+        yield '{"%s": [' % key
+        first = True
+        buffer = []
+        rows = query.execution_options(stream_results=True).yield_per(batch_size)
+        for row in rows:
+            buffer.append(json.dumps(serializer(row)))
+            if len(buffer) >= batch_size:
+                yield ('' if first else ',') + ','.join(buffer)
+                first = False
+                buffer = []
+        if buffer:
+            yield ('' if first else ',') + ','.join(buffer)
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
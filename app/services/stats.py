@@ -0,0 +1,73 @@
+# app/services/stats.py
+"""
+Statistiche sugli appuntamenti degli operatori di un admin.
+
+appointment_stats(admin_id) esegue una sola query aggregata (GROUP BY
+operatore, stato) e ne ricava totale, conteggi per stato e per operatore.
+
+Se la configurazione ha MATERIALIZED_STATS=True la stessa query legge
+invece la tabella appointment_stats, tenuta aggiornata dai trigger di
+migrations/011 a ogni insert/update/delete su appointments (anche quelli
+fatti con pymysql da api/): la dashboard non deve più contare le righe
+di appointments. Il riallineamento completo della tabella è nella
+migrazione stessa (e in bench/seed.py dopo il caricamento dei dati).
+"""
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models.appointment import Appointment
+from app.models.stats import AppointmentStat
+from app.models.user import User
+
+STATUSES = ['pending', 'confirmed', 'completed', 'cancelled']
+
+
+def materialized_enabled():
+    return bool(current_app.config.get('MATERIALIZED_STATS'))
+
+
+def appointment_stats(admin_id):
+    """
+    Conteggi per stato e per operatore degli appuntamenti dell'admin.
+    Gli operatori senza appuntamenti compaiono con conteggi a zero.
+    """
+    if materialized_enabled():
+        count_col = func.coalesce(func.sum(AppointmentStat.count), 0)
+        query = db.session.query(
+            User.id, User.username, AppointmentStat.status, count_col
+        ).outerjoin(AppointmentStat, AppointmentStat.operator_id == User.id)
+        group_status = AppointmentStat.status
+    else:
+        query = db.session.query(
+            User.id, User.username, Appointment.status, func.count(Appointment.id)
+        ).outerjoin(Appointment, Appointment.operator_id == User.id)
+        group_status = Appointment.status
+
+    rows = query.filter(
+        User.admin_id == admin_id,
+        User.role == 'operator'
+    ).group_by(User.id, User.username, group_status).all()
+
+    by_status = {status: 0 for status in STATUSES}
+    operators = {}
+    for operator_id, username, status, count in rows:
+        operator = operators.setdefault(operator_id, {
+            'operator_id': operator_id,
+            'operator_name': username,
+            'appointments_count': 0,
+            'by_status': {}
+        })
+        if status is None or not count:
+            continue
+        count = int(count)
+        operator['appointments_count'] += count
+        operator['by_status'][status] = operator['by_status'].get(status, 0) + count
+        by_status[status] = by_status.get(status, 0) + count
+
+    return {
+        'total_appointments': sum(by_status.values()),
+        'by_status': by_status,
+        'operators': list(operators.values())
+    }
+
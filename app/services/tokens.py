@@ -0,0 +1,109 @@
+# app/services/tokens.py
+"""
+Token di accesso per le rotte dell'app.
+
+Firma, verifica, cache delle revoche e admin_required sono quelli di
+api/auth_tokens.py, condivisi con l'API serverless: qui ci sono solo il
+collegamento alla configurazione dell'app (SECRET_KEY, ACCESS_TOKEN_TTL,
+TOKEN_REVOCATION_CACHE_TTL) e la lettura/scrittura di revoked_tokens con
+SQLAlchemy. Il TokenService viene creato da init_tokens() (o al primo
+uso) e salvato in app.extensions['tokens'].
+
+Senza header Authorization, se AUTH_LEGACY_ADMIN_ID è attivo, resta il
+vecchio controllo sull'admin_id della richiesta.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify
+
+from api.auth_tokens import TokenAuth, TokenError, TokenService, bearer_token  # noqa: F401
+from app.extensions import db
+from app.models.token import RevokedToken
+from app.models.user import User
+
+
+def _is_revoked(jti):
+    return db.session.get(RevokedToken, jti) is not None
+
+
+def _legacy_admin_check(admin_id):
+    return User.query.filter_by(id=admin_id, role='admin').first() is not None
+
+
+def init_tokens(app):
+    service = TokenService(app.config['SECRET_KEY'],
+                           ttl=app.config.get('ACCESS_TOKEN_TTL', 12 * 3600),
+                           is_revoked=_is_revoked,
+                           cache_ttl=app.config.get('TOKEN_REVOCATION_CACHE_TTL', 60))
+    app.extensions['tokens'] = service
+    return service
+
+
+def init_login(app):
+    """flask_login (blueprint dashboard): l'utente corrente è quello del token della richiesta."""
+    from flask_login import LoginManager
+
+    manager = LoginManager()
+    manager.init_app(app)
+
+    @manager.request_loader
+    def _user_from_token(request):
+        try:
+            claims = token_auth.current_claims()
+        except TokenError:
+            return None
+        return db.session.get(User, claims['sub']) if claims is not None else None
+
+    @manager.unauthorized_handler
+    def _unauthorized():
+        return jsonify({'error': 'Token mancante o non valido'}), 401
+
+    return manager
+
+
+def _service():
+    service = current_app.extensions.get('tokens')
+    return service if service is not None else init_tokens(current_app)
+
+
+class _AppTokenAuth(TokenAuth):
+    """TokenAuth che usa il TokenService e la configurazione dell'app corrente."""
+
+    def __init__(self):
+        pass
+
+    @property
+    def service(self):
+        return _service()
+
+    @property
+    def legacy_admin_check(self):
+        return _legacy_admin_check if current_app.config.get('AUTH_LEGACY_ADMIN_ID') else None
+
+
+token_auth = _AppTokenAuth()
+admin_required = token_auth.admin_required
+# /metrics e /api/debug/*: solo con DEBUG_ENDPOINTS attivo e il token di un admin
+debug_required = token_auth.debug_required(lambda: current_app.config.get('DEBUG_ENDPOINTS'))
+
+
+def issue_token(user):
+    tenant_id = user.id if user.role == 'admin' else user.admin_id
+    return _service().issue(user.id, user.role, tenant_id)
+
+
+def decode_token(token):
+    return _service().decode(token)
+
+
+def verify_token(token):
+    return _service().verify(token)
+
+
+def revoke_token(claims):
+    service = _service()
+    if db.session.get(RevokedToken, claims['jti']) is None:
+        db.session.add(RevokedToken(jti=claims['jti'], user_id=claims['sub'],
+                                    expires_at=datetime.utcnow() + timedelta(seconds=service.ttl)))
+        db.session.commit()
+    service.mark_revoked(claims['jti'])
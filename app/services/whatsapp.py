@@ -9,11 +9,18 @@ class WhatsAppService:
         self.api_key = api_key
         self.base_url = "https://graph.facebook.com/v17.0/YOUR_PHONE_NUMBER_ID"
 
-    def send_appointment_reminder(self, appointment):
+    def send_appointment_reminder(self, appointment, lead_minutes=1440):
+        # Un solo promemoria per (appuntamento, anticipo), come in api/reminders.py
+        reminder_type = f"reminder_{lead_minutes}m"
+        existing = Notification.query.filter_by(appointment_id=appointment.id,
+                                                type=reminder_type).first()
+        if existing is not None:
+            return existing
+
         notification = Notification(
-            type='whatsapp',
+            type=reminder_type,
             appointment_id=appointment.id,
-            message=f"Promemoria: hai un appuntamento il {appointment.datetime}"
+            message=f"Promemoria: hai un appuntamento il {appointment.start_time.strftime('%d/%m/%Y %H:%M')}"
         )
 
         try:
@@ -35,7 +42,7 @@ class WhatsAppService:
                                 "parameters": [
                                     {
                                         "type": "text",
-                                        "text": appointment.datetime.strftime("%d/%m/%Y %H:%M")
+                                        "text": appointment.start_time.strftime("%d/%m/%Y %H:%M")
                                     }
                                 ]
                             }
@@ -55,4 +62,5 @@ class WhatsAppService:
             print(f"Error sending WhatsApp notification: {str(e)}")
 
         db.session.add(notification)
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+        return notification
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Stress test di concorrenza delle prenotazioni (api/booking.py) su MySQL.
+
+Usa il database di benchmark (variabili DB_*, dataset di bench/seed.py)
+e un giorno lontano nel futuro, ripulito a ogni esecuzione:
+
+  1. stesso orario: --threads thread provano a prenotare lo stesso
+     intervallo per ognuno degli operatori scelti; deve riuscire
+     esattamente una prenotazione per operatore
+  2. raffica: --requests prenotazioni di 30 minuti su orari casuali
+     allineati ai 15 minuti (quindi spesso sovrapposti) sugli stessi
+     operatori; misura throughput, latenza, conflitti e transazioni
+     ritentate
+
+Alla fine verifica con una self-join che non esistano due appuntamenti
+non annullati sovrapposti per lo stesso operatore. Esce con codice 1 se
+una delle verifiche fallisce.
+
+    DB_HOST=127.0.0.1 DB_NAME=appointment_bench python bench/booking_stress.py --threads 32
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+
+import seed  # noqa: E402
+from booking import BookingConflict, BookingEngine  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+SERVICE = "Stress"
+
+
+def setup(pool, operators):
+    """Sceglie operatori e un cliente dello stesso admin; ripulisce il giorno del test."""
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT o.id, MIN(c.id)
+            FROM users o JOIN users c ON c.admin_id = o.admin_id AND c.role = 'client'
+            WHERE o.role = 'operator' AND o.username LIKE 'bench\\_%%'
+            GROUP BY o.id ORDER BY o.id LIMIT %s
+        """, (operators,))
+        pairs = cursor.fetchall()
+        cursor.execute("DELETE FROM appointments WHERE service_type = %s", (SERVICE,))
+        conn.commit()
+    if not pairs:
+        raise SystemExit("Nessun operatore bench_: esegui prima bench/seed.py")
+    return pairs
+
+
+def attempt(pool, engine, operator_id, client_id, start, minutes=30):
+    started = time.perf_counter()
+    try:
+        with pool.connection() as conn:
+            engine.book(conn, operator_id, client_id, start, start + timedelta(minutes=minutes), SERVICE)
+        outcome = "booked"
+    except BookingConflict:
+        outcome = "conflict"
+    return outcome, time.perf_counter() - started
+
+
+def same_slot(pool, engine, pairs, day, threads):
+    start = datetime.combine(day, dtime(8, 0))
+    jobs = [pair for pair in pairs for _ in range(threads)]
+    random.shuffle(jobs)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda pair: attempt(pool, engine, pair[0], pair[1], start), jobs))
+    booked = sum(1 for outcome, _ in results if outcome == "booked")
+    ok = booked == len(pairs)
+    print(f"[stesso orario] {len(jobs)} tentativi su {len(pairs)} operatori: "
+          f"{booked} prenotati (attesi {len(pairs)}) {'OK' if ok else 'ERRORE'}")
+    return ok
+
+
+def burst(pool, engine, pairs, day, threads, requests, random_seed):
+    rng = random.Random(random_seed)
+    jobs = []
+    for _ in range(requests):
+        operator_id, client_id = rng.choice(pairs)
+        # 09:00-18:00 a passi di 15 minuti: intervalli di 30 minuti che si accavallano spesso
+        start = datetime.combine(day, dtime(9)) + timedelta(minutes=15 * rng.randrange(36))
+        jobs.append((operator_id, client_id, start))
+
+    lock = threading.Lock()
+    outcomes, latencies = {"booked": 0, "conflict": 0}, []
+
+    def run(job):
+        outcome, elapsed = attempt(pool, engine, *job)
+        with lock:
+            outcomes[outcome] += 1
+            latencies.append(elapsed * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(run, jobs))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    print(f"[raffica] {requests} richieste, {threads} thread: {requests / wall:.1f} req/s, "
+          f"p50 {statistics.median(latencies):.2f} ms, p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f} ms, "
+          f"{outcomes['booked']} prenotati, {outcomes['conflict']} conflitti, "
+          f"{engine.retried} ritentate")
+
+
+def count_overlaps(pool):
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM appointments a
+            JOIN appointments b ON b.operator_id = a.operator_id AND b.id > a.id
+                               AND b.start_time < a.end_time AND b.end_time > a.start_time
+            WHERE a.service_type = %s AND b.service_type = %s
+              AND a.status <> 'cancelled' AND b.status <> 'cancelled'
+        """, (SERVICE, SERVICE))
+        return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--operators", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+
+    pool = ConnectionPool(seed.db_config(), max_size=args.threads)
+    engine = BookingEngine()
+    pairs = setup(pool, args.operators)
+    day = date.today() + timedelta(days=400)
+
+    ok = same_slot(pool, engine, pairs, day, args.threads)
+    burst(pool, engine, pairs, day, args.threads, args.requests, args.random_seed)
+    overlaps = count_overlaps(pool)
+    print(f"[verifica] appuntamenti sovrapposti: {overlaps} {'OK' if overlaps == 0 else 'ERRORE'}")
+    pool.close_all()
+    sys.exit(0 if ok and overlaps == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
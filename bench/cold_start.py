@@ -0,0 +1,118 @@
+"""
+Latenza cold vs warm dell'API serverless (api/index.py).
+
+Ogni esecuzione avvia un interprete nuovo, come un container Vercel
+appena creato: importa index, serve la prima richiesta (cold) e poi
+altre --warm richieste nello stesso processo (warm), con il test client
+di Flask, quindi senza rete né server HTTP. Alla fine stampa mediana e
+p95 di import, prima richiesta e richieste calde, più le fasi medie del
+profilo di avvio (/api/debug/startup).
+
+    python bench/cold_start.py                       # /api, nessun DB
+    python bench/cold_start.py --path /api/calendar/1 --runs 10
+    python bench/cold_start.py --imports             # anche i moduli più lenti
+
+Le rotte che usano il DB vanno provate contro un MySQL locale, indicato
+con le variabili DB_HOST / DB_PORT / DB_USER / DB_PASSWORD / DB_NAME
+(le query sono in dialetto MySQL, quindi SQLite non basta). Con DB la
+prima richiesta include anche la prima connessione.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Eseguito nel processo figlio, con cwd = api/
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+client = index.app.test_client()
+path, warm = sys.argv[1], int(sys.argv[2])
+t = time.perf_counter()
+status = client.get(path).status_code
+first = time.perf_counter() - t
+warm_times = []
+for _ in range(warm):
+    t = time.perf_counter()
+    client.get(path)
+    warm_times.append(time.perf_counter() - t)
+print(json.dumps({
+    "import": imported - started,
+    "first": first,
+    "warm": warm_times,
+    "status": status,
+    "profile": index.startup.report(top=10),
+}))
+"""
+
+
+def run_once(path, warm, track_imports):
+    env = dict(os.environ)
+    if track_imports:
+        env["STARTUP_PROFILE_IMPORTS"] = "1"
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, path, str(warm)],
+        cwd=os.path.join(ROOT, "api"), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def line(label, seconds):
+    ms = [s * 1000 for s in seconds]
+    return (f"  {label:<22} p50 {statistics.median(ms):8.2f} ms   "
+            f"p95 {percentile(ms, 95):8.2f} ms   n={len(ms)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--path", default="/api", help="rotta da richiedere (GET)")
+    parser.add_argument("--runs", type=int, default=5, help="processi (cold start) da avviare")
+    parser.add_argument("--warm", type=int, default=50, help="richieste calde per processo")
+    parser.add_argument("--imports", action="store_true", help="profilo degli import per modulo")
+    parser.add_argument("--json", action="store_true", help="stampa i risultati grezzi in JSON")
+    args = parser.parse_args()
+
+    runs = [run_once(args.path, args.warm, args.imports) for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+
+    print(f"{args.path} (status {runs[0]['status']}), {args.runs} processi x {args.warm} richieste calde")
+    print(line("import index", [r["import"] for r in runs]))
+    print(line("prima richiesta", [r["first"] for r in runs]))
+    print(line("cold (import + prima)", [r["import"] + r["first"] for r in runs]))
+    print(line("warm", [w for r in runs for w in r["warm"]]))
+
+    print("fasi di avvio (media):")
+    phases = {}
+    for r in runs:
+        for phase in r["profile"]["phases"]:
+            phases.setdefault(phase["name"], []).append(phase["duration_ms"])
+    for name, values in phases.items():
+        print(f"  {name:<22} {statistics.mean(values):8.2f} ms")
+    connects = [r["profile"]["first_db_connect"]["duration_ms"]
+                for r in runs if r["profile"]["first_db_connect"]]
+    if connects:
+        print(f"  {'prima connessione DB':<22} {statistics.mean(connects):8.2f} ms")
+
+    if args.imports:
+        print("moduli più lenti (ultimo processo, cumulativo / proprio):")
+        for module in runs[-1]["profile"]["modules"]:
+            print(f"  {module['cumulative_ms']:8.2f} / {module['self_ms']:8.2f} ms  {module['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Benchmark dei flussi principali su un database di tenant sintetici.
+
+Flussi (--flows, default tutti):
+  calendar   GET  /api/calendar/<user_id>, settimana corrente     (api/index.py)
+  stats      GET  /api/admin/stats/<admin_id>                     (app, blueprint admin)
+  booking    POST /api/admin/appointments, orari futuri casuali   (api/index.py)
+  login      POST /api/auth/login                                 (api/index.py)
+  reminders  POST /api/admin/send-reminders con scheduler vuoto,
+             cioè un giro completo come dopo un cold start        (api/index.py)
+
+Le richieste passano dal test client di Flask (nessun server HTTP),
+--concurrency thread per flusso; reminders è sempre seriale. Per ogni
+flusso: throughput, latenza p50/p95/p99, status HTTP e, dalle metriche
+per rotta (api/request_metrics.py), query e tempo DB medi per richiesta.
+
+I risultati vengono salvati in bench/results/<data>-<commit>.json e
+confrontati con il risultato precedente (o con --baseline).
+
+    DB_HOST=127.0.0.1 DB_NAME=appointment_bench python bench/run.py --seed
+    python bench/run.py --flows calendar,login --requests 500 --concurrency 16
+    python bench/run.py --compare-only bench/results/a.json bench/results/b.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+sys.path.insert(0, ROOT)
+
+import seed  # noqa: E402
+
+FLOWS = ("calendar", "stats", "booking", "login", "reminders")
+
+
+# =============================
+#  A P P   S O T T O   T E S T
+# =============================
+def configure_env(concurrency):
+    """Variabili lette da api/index.py e config.py: DB di benchmark, limiti alti, niente worker."""
+    config = seed.db_config()
+    os.environ.setdefault("DB_POOL_SIZE", str(concurrency))
+    os.environ.update({
+        "DB_HOST": config["host"], "DB_PORT": str(config["port"]), "DB_USER": config["user"],
+        "DB_PASSWORD": config["password"], "DB_NAME": config["db"],
+        "OUTBOX_WORKER_ENABLED": "0",
+        "LOGIN_RATE_IP_LIMIT": "1000000000", "LOGIN_RATE_USER_LIMIT": "1000000000",
+    })
+    os.environ.setdefault("DATABASE_URL", seed.database_url(config))
+
+
+class Targets:
+    """Carica api/index.py e l'app solo se un flusso li usa."""
+
+    def __init__(self):
+        self._api = None
+        self._app = None
+        self._local = threading.local()
+
+    @property
+    def api(self):
+        if self._api is None:
+            sys.path.insert(0, os.path.join(ROOT, "api"))
+            import index
+            self._api = index
+        return self._api
+
+    @property
+    def app(self):
+        if self._app is None:
+            from app import create_app
+            self._app = create_app(blueprints=["admin"])
+        return self._app
+
+    def client(self, name):
+        """Test client per thread ('api' o 'app')."""
+        clients = self._local.__dict__.setdefault("clients", {})
+        if name not in clients:
+            clients[name] = (self.api.app if name == "api" else self.app).test_client()
+        return clients[name]
+
+    def metrics(self):
+        rows = []
+        if self._api is not None:
+            rows += self._api.request_metrics.summary()
+        if self._app is not None:
+            rows += self._app.extensions["request_metrics"].summary()
+        return rows
+
+
+def load_dataset():
+    import pymysql
+    conn = pymysql.connect(**seed.db_config())
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("SELECT id, username, role, admin_id FROM users WHERE username LIKE 'bench\\_%%'")
+            users = cursor.fetchall()
+    finally:
+        conn.close()
+    if not users:
+        raise SystemExit("Nessun utente bench_ nel database: esegui prima bench/seed.py (o --seed)")
+    by_role = {"admin": [], "operator": [], "client": []}
+    for user in users:
+        by_role[user["role"]].append(user)
+    return {"users": users, **by_role}
+
+
+# =============================
+#  F L U S S I
+# =============================
+def flow_calendar(targets, data, rng):
+    user = rng.choice(data["users"])
+    monday = date.today() - timedelta(days=date.today().weekday())
+    start = datetime.combine(monday, dtime())
+    return targets.client("api").get(
+        f"/api/calendar/{user['id']}",
+        query_string={"from": start.isoformat(), "to": (start + timedelta(days=7)).isoformat()})
+
+
+def flow_stats(targets, data, rng):
+    admin = rng.choice(data["admin"])
+    return targets.client("app").get(f"/api/admin/stats/{admin['id']}")
+
+
+def flow_booking(targets, data, rng):
+    operator = rng.choice(data["operator"])
+    client = rng.choice([c for c in data["client"] if c["admin_id"] == operator["admin_id"]] or data["client"])
+    day = date.today() + timedelta(days=rng.randint(1, 60))
+    start = datetime.combine(day, dtime(rng.randint(8, 19), rng.choice((0, 15, 30, 45))))
+    return targets.client("api").post("/api/admin/appointments", json={
+        "admin_id": operator["admin_id"],
+        "operator_id": operator["id"],
+        "client_id": client["id"],
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(minutes=30)).isoformat(),
+        "service_type": "Benchmark",
+    })
+
+
+def flow_login(targets, data, rng):
+    user = rng.choice(data["users"])
+    return targets.client("api").post(
+        "/api/auth/login", json={"username": user["username"], "password": seed.PASSWORD})
+
+
+def flow_reminders(targets, data, rng):
+    api = targets.api
+    # L'ultimo giro è salvato nel DB: lo si riporta indietro di 15 minuti, così
+    # si misura la lettura della finestra + invio, non il giro "a vuoto"
+    with api.get_db() as conn, conn.cursor() as cursor:
+        cursor.execute("UPDATE reminder_runs SET last_run = NOW() - INTERVAL 15 MINUTE WHERE name = 'reminders'")
+        conn.commit()
+    return targets.client("api").post("/api/admin/send-reminders")
+
+
+SERIAL_FLOWS = {"reminders"}
+
+
+def run_flow(name, targets, data, requests, concurrency, warmup, random_seed):
+    flow = globals()[f"flow_{name}"]
+    warm_rng = random.Random(random_seed - 1)
+    for _ in range(warmup):
+        flow(targets, data, warm_rng)
+    metrics_before = {(r["route"], r["method"]): r for r in targets.metrics()}
+
+    workers = 1 if name in SERIAL_FLOWS else concurrency
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    per_worker = [requests // workers + (1 if i < requests % workers else 0) for i in range(workers)]
+
+    def worker(index):
+        rng = random.Random(random_seed * 1000 + index)
+        for _ in range(per_worker[index]):
+            started = time.perf_counter()
+            response = flow(targets, data, rng)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(worker, range(workers)))
+    wall = time.perf_counter() - started
+
+    ms = sorted(latency * 1000 for latency in latencies)
+    result = {
+        "requests": len(ms),
+        "concurrency": workers,
+        "throughput_rps": round(len(ms) / wall, 2),
+        "mean_ms": round(statistics.mean(ms), 2),
+        "p50_ms": round(_percentile(ms, 50), 2),
+        "p95_ms": round(_percentile(ms, 95), 2),
+        "p99_ms": round(_percentile(ms, 99), 2),
+        "statuses": statuses,
+        "errors": sum(count for status, count in statuses.items() if status.startswith("5")),
+    }
+    result.update(_route_delta(metrics_before, targets.metrics()))
+    return result
+
+
+def _route_delta(before, after):
+    """Query e ms di DB medi per richiesta del flusso (differenza sulle metriche per rotta)."""
+    for row in after:
+        old = before.get((row["route"], row["method"]), {"requests": 0, "avg_queries": 0, "avg_db_ms": 0})
+        count = row["requests"] - old["requests"]
+        if count > 0:
+            queries = row["avg_queries"] * row["requests"] - old["avg_queries"] * old["requests"]
+            db_ms = row["avg_db_ms"] * row["requests"] - old["avg_db_ms"] * old["requests"]
+            return {"route": row["route"], "avg_queries": round(queries / count, 2),
+                    "avg_db_ms": round(db_ms / count, 2)}
+    return {}
+
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+# =============================
+#  R I S U L T A T I
+# =============================
+def git_revision():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return (sha or "unknown") + ("-dirty" if dirty else "")
+    except OSError:
+        return "unknown"
+
+
+def save(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['meta']['revision']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def previous_result(exclude):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(baseline, current):
+    """Stampa, per i flussi in comune, il confronto di throughput e latenze."""
+    print(f"confronto con {baseline['meta']['revision']} ({baseline['meta']['started']}):")
+    if baseline["meta"].get("dataset") != current["meta"].get("dataset"):
+        print("  attenzione: dataset diverso, i numeri non sono direttamente confrontabili")
+    for name, flow in current["flows"].items():
+        old = baseline["flows"].get(name)
+        if old is None:
+            continue
+        parts = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "avg_queries"):
+            if key in flow and key in old and old[key]:
+                parts.append(f"{key} {old[key]} -> {flow[key]} ({(flow[key] - old[key]) / old[key] * 100:+.1f}%)")
+        print(f"  {name:<10} " + "   ".join(parts))
+
+
+def print_result(result):
+    for name, flow in result["flows"].items():
+        print(f"  {name:<10} {flow['throughput_rps']:9.1f} req/s   p50 {flow['p50_ms']:8.2f}   "
+              f"p95 {flow['p95_ms']:8.2f}   p99 {flow['p99_ms']:8.2f} ms   "
+              f"query {flow.get('avg_queries', '-')}   status {flow['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    parser.add_argument("--requests", type=int, default=200, help="richieste per flusso")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", action="store_true", help="rigenera il dataset prima di misurare")
+    parser.add_argument("--force", action="store_true", help="consente un DB_NAME senza 'bench' con --seed")
+    parser.add_argument("--baseline", help="risultato da usare per il confronto (default: il precedente)")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare-only", nargs=2, metavar=("BASELINE", "CURRENT"))
+    seed.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare_only:
+        baseline, current = (json.load(open(path)) for path in args.compare_only)
+        compare(baseline, current)
+        return
+
+    flows = [name.strip() for name in args.flows.split(",") if name.strip()]
+    unknown = [name for name in flows if name not in FLOWS]
+    if unknown:
+        parser.error(f"flussi sconosciuti: {', '.join(unknown)}")
+
+    seeded = None
+    if args.seed:
+        try:
+            seed.check_target(args.force)
+        except ValueError as e:
+            parser.error(str(e))
+        seeded = seed.seed(args)
+        print(f"dataset caricato in {seeded['seconds']}s: {seeded['counts']}")
+
+    configure_env(args.concurrency)
+    data = load_dataset()
+    targets = Targets()
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": seeded["params"] if seeded else None,
+            "dataset": {role: len(data[role]) for role in ("admin", "operator", "client")},
+        },
+        "flows": {},
+    }
+    for name in flows:
+        result["flows"][name] = run_flow(name, targets, data, args.requests,
+                                         args.concurrency, args.warmup, args.random_seed)
+        print_result({"flows": {name: result["flows"][name]}})
+
+    if not args.no_save:
+        path = save(result)
+        print(f"risultati salvati in {os.path.relpath(path, ROOT)}")
+        baseline_path = args.baseline or previous_result(exclude=path)
+        if baseline_path:
+            with open(baseline_path) as f:
+                compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Generatore di tenant sintetici per i benchmark.
+
+Svuota il database indicato dalle variabili DB_HOST / DB_PORT / DB_USER /
+DB_PASSWORD / DB_NAME e lo riempie con:
+  - --admins admin (tenant), ognuno con --operators operatori e --clients clienti
+  - --slots slot settimanali approvati per operatore (lun-ven, 9-18)
+  - --per-day appuntamenti al giorno per operatore, da --history giorni fa
+    a --future giorni avanti (passati: completed/cancelled, futuri:
+    pending/confirmed), senza sovrapposizioni per operatore
+
+Tutti gli utenti hanno password PASSWORD; gli username hanno il prefisso
+"bench_". La generazione è deterministica (--random-seed). Lo schema viene
+creato con i modelli dell'app (db.create_all) più le migrazioni in
+migrations/, ignorando gli oggetti già presenti.
+
+Per sicurezza il nome del database deve contenere "bench" (altrimenti
+serve --force): lo script esegue TRUNCATE su tutte le tabelle.
+
+    DB_HOST=127.0.0.1 DB_NAME=appointment_bench python bench/seed.py --admins 5
+    python bench/seed.py --dry-run            # solo conteggi, nessun DB
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "bench-password"
+SERVICES = ("Visita", "Controllo", "Consulenza", "Trattamento")
+CHUNK_SIZE = 1000
+
+# Errori MySQL tollerati applicando le migrazioni su uno schema già creato
+_ALREADY_EXISTS = {1050, 1060, 1061, 1062, 1359, 1826}
+
+TABLES = ("change_events", "slot_holds", "notification_outbox", "notifications", "revoked_tokens", "appointment_stats",
+          "appointment_spans", "slot_exceptions", "broadcast_jobs", "appointments", "slots", "users")
+
+
+def db_config():
+    return {
+        "host": os.getenv("DB_HOST", "127.0.0.1"),
+        "port": int(os.getenv("DB_PORT", "3306")),
+        "user": os.getenv("DB_USER", "root"),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "db": os.getenv("DB_NAME", "appointment_bench"),
+    }
+
+
+def database_url(config=None):
+    config = config or db_config()
+    return "mysql+pymysql://{user}:{password}@{host}:{port}/{db}".format(**config)
+
+
+# =============================
+#  G E N E R A Z I O N E
+# =============================
+def generate(admins, operators, clients, slots, per_day, history, future, random_seed=1, today=None):
+    """
+    Restituisce le righe da inserire: {'users': [...], 'slots': [...],
+    'appointments': [...]}, come tuple nell'ordine delle colonne di insert().
+    Gli id degli utenti sono assegnati qui (tabella vuota).
+    """
+    rng = random.Random(random_seed)
+    today = today or date.today()
+    password_hash = _password_hash()
+    users, slot_rows, appointment_rows = [], [], []
+    next_id = 1
+
+    def add_user(username, role, admin_id, phone=None, specialization=None):
+        nonlocal next_id
+        users.append((next_id, username, password_hash, f"{username}@bench.local", phone,
+                      role, admin_id, specialization))
+        next_id += 1
+        return next_id - 1
+
+    hours = list(range(9, 18))
+    for a in range(admins):
+        admin_id = add_user(f"bench_admin_{a}", "admin", None)
+        operator_ids = [add_user(f"bench_op_{a}_{i}", "operator", admin_id,
+                                 specialization=rng.choice(SERVICES)) for i in range(operators)]
+        client_ids = [add_user(f"bench_client_{a}_{i}", "client", admin_id,
+                               phone=f"+39333{a:03d}{i:04d}") for i in range(clients)]
+
+        for operator_id in operator_ids:
+            weekly = [(day, hour) for day in range(5) for hour in hours]
+            for day, hour in sorted(rng.sample(weekly, min(slots, len(weekly)))):
+                slot_rows.append((operator_id, None, day, dtime(hour), dtime(hour + 1), "approved"))
+
+            for offset in range(-history, future + 1):
+                day = today + timedelta(days=offset)
+                if day.weekday() >= 5:
+                    continue
+                for hour in rng.sample(hours, min(per_day, len(hours))):
+                    start = datetime.combine(day, dtime(hour, rng.choice((0, 30))))
+                    if offset < 0:
+                        status = "cancelled" if rng.random() < 0.1 else "completed"
+                    else:
+                        status = rng.choice(("pending", "confirmed"))
+                    appointment_rows.append((operator_id, rng.choice(client_ids), start,
+                                             start + timedelta(minutes=30), rng.choice(SERVICES), status))
+
+    return {"users": users, "slots": slot_rows, "appointments": appointment_rows}
+
+
+def _password_hash():
+    from werkzeug.security import generate_password_hash
+    return generate_password_hash(PASSWORD)
+
+
+# =============================
+#  D A T A B A S E
+# =============================
+def ensure_schema():
+    """Tabelle dei modelli dell'app + migrazioni (gli oggetti esistenti vengono saltati)."""
+    import pymysql
+    from app import create_app
+    from app.extensions import db
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url()
+        OUTBOX_WORKER_ENABLED = False
+
+    app = create_app(BenchConfig, blueprints=[])
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    conn = pymysql.connect(**db_config())
+    try:
+        with conn.cursor() as cursor:
+            for path in sorted(glob.glob(os.path.join(ROOT, "migrations", "*.sql"))):
+                with open(path) as f:
+                    sql = "\n".join(line for line in f if not line.lstrip().startswith("--"))
+                for statement in filter(None, (s.strip() for s in sql.split(";"))):
+                    try:
+                        cursor.execute(statement)
+                    except pymysql.err.MySQLError as e:
+                        if e.args[0] not in _ALREADY_EXISTS:
+                            raise
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def insert(rows):
+    import pymysql
+    conn = pymysql.connect(**db_config())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in TABLES:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            _executemany(cursor, """
+                INSERT INTO users (id, username, password_hash, email, phone, role, admin_id,
+                                   specialization, is_active, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1, NOW())
+            """, rows["users"])
+            _executemany(cursor, """
+                INSERT INTO slots (operator_id, client_id, day_of_week, start_time, end_time,
+                                   status, is_active, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, 1, NOW())
+            """, rows["slots"])
+            _executemany(cursor, """
+                INSERT INTO appointments (operator_id, client_id, start_time, end_time,
+                                          service_type, status, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, NOW())
+            """, rows["appointments"])
+            # Statistiche materializzate (migrations/003) allineate ai dati generati:
+            # con i trigger di migrations/011 sono già aggiornate, la ricostruzione è innocua
+            cursor.execute("DELETE FROM appointment_stats")
+            cursor.execute("""
+                INSERT INTO appointment_stats (operator_id, status, count)
+                SELECT operator_id, status, COUNT(*) FROM appointments GROUP BY operator_id, status
+            """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _executemany(cursor, sql, rows):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        cursor.executemany(sql, rows[i:i + CHUNK_SIZE])
+
+
+def add_arguments(parser):
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--operators", type=int, default=10, help="operatori per admin")
+    parser.add_argument("--clients", type=int, default=300, help="clienti per admin")
+    parser.add_argument("--slots", type=int, default=20, help="slot settimanali per operatore")
+    parser.add_argument("--per-day", type=int, default=5, help="appuntamenti al giorno per operatore")
+    parser.add_argument("--history", type=int, default=180, help="giorni di storico")
+    parser.add_argument("--future", type=int, default=30, help="giorni futuri")
+    parser.add_argument("--random-seed", type=int, default=1)
+
+
+def check_target(force=False):
+    """Rifiuta di svuotare un database che non sembra di benchmark."""
+    name = db_config()["db"]
+    if "bench" not in name and not force:
+        raise ValueError(f"il database '{name}' verrebbe svuotato: usa un DB_NAME con 'bench' o --force")
+
+
+def seed(args, dry_run=False):
+    """Genera e (se non dry_run) carica i dati; restituisce i parametri e i conteggi."""
+    started = time.perf_counter()
+    rows = generate(args.admins, args.operators, args.clients, args.slots, args.per_day,
+                    args.history, args.future, args.random_seed)
+    counts = {table: len(values) for table, values in rows.items()}
+    if not dry_run:
+        ensure_schema()
+        insert(rows)
+    params = {name: getattr(args, name) for name in
+              ("admins", "operators", "clients", "slots", "per_day", "history", "future", "random_seed")}
+    return {"params": params, "counts": counts, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_arguments(parser)
+    parser.add_argument("--dry-run", action="store_true", help="genera i dati senza toccare il DB")
+    parser.add_argument("--force", action="store_true", help="consente un DB_NAME senza 'bench'")
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        try:
+            check_target(args.force)
+        except ValueError as e:
+            parser.error(str(e))
+    result = seed(args, dry_run=args.dry_run)
+    print(f"{'generati' if args.dry_run else 'caricati'} in {result['seconds']}s: "
+          + ", ".join(f"{count} {table}" for table, count in result["counts"].items()))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, ROOT)
+    main()
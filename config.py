@@ -6,5 +6,75 @@ load_dotenv(os.path.join(basedir, '.env'))
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-12345'
-    SQLALCHEMY_DATABASE_URI = 'mysql+mysqlconnector://root:@localhost/appointment_db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    # DATABASE_URL completo, oppure composto dalle stesse variabili DB_* usate su Vercel
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'mysql+pymysql://{}:{}@{}/{}'.format(
+        os.environ.get('DB_USER', 'root'),
+        os.environ.get('DB_PASSWORD', ''),
+        os.environ.get('DB_HOST', 'localhost'),
+        os.environ.get('DB_NAME', 'appointment_db')
+    )
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connessioni riusate ma verificate: MySQL chiude quelle inattive (wait_timeout)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '280')),
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('DB_POOL_OVERFLOW', '5')),
+    }
+    CORS_ORIGINS = [origin.strip() for origin in
+                    os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')]
+    CORS_METHODS = ["GET", "POST", "PUT", "DELETE"]
+    CORS_ALLOW_HEADERS = ["Content-Type", "Authorization"]
+    CORS_SUPPORTS_CREDENTIALS = False
+    # False solo per l'API serverless (vedi ServerlessConfig e app/__init__.py)
+    SQLALCHEMY_ENABLED = True
+    # Blueprint da registrare (nomi separati da virgola, vuoto = tutti; vedi app/__init__.py)
+    APP_BLUEPRINTS = os.environ.get('APP_BLUEPRINTS', '')
+    # Statistiche lette dalla tabella appointment_stats (migrations/003)
+    MATERIALIZED_STATS = os.environ.get('MATERIALIZED_STATS', '').lower() in ('1', 'true', 'yes')
+    # Outbox WhatsApp (app/services/outbox.py): 'twilio' oppure 'fake' per lavorare offline
+    WHATSAPP_PROVIDER = os.environ.get('WHATSAPP_PROVIDER', 'twilio')
+    OUTBOX_WORKER_ENABLED = os.environ.get('OUTBOX_WORKER_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    OUTBOX_MAX_WORKERS = int(os.environ.get('OUTBOX_MAX_WORKERS', '4'))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '5'))
+    OUTBOX_RATE_LIMIT = float(os.environ.get('OUTBOX_RATE_LIMIT', '20'))  # messaggi al secondo, 0 = nessun limite
+    BROADCAST_CHUNK_SIZE = int(os.environ.get('BROADCAST_CHUNK_SIZE', '500'))
+    # Hashing password in un pool di processi (app/services/passwords.py)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '32'))
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    # Token di accesso (app/services/tokens.py, api/auth_tokens.py)
+    ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', str(12 * 3600)))
+    TOKEN_REVOCATION_CACHE_TTL = int(os.environ.get('TOKEN_REVOCATION_CACHE_TTL', '60'))
+    # Vecchio controllo sull'admin_id senza token: disattivato salvo AUTH_LEGACY_ADMIN_ID=1
+    AUTH_LEGACY_ADMIN_ID = os.environ.get('AUTH_LEGACY_ADMIN_ID', '').lower() in ('1', 'true', 'yes')
+    # /metrics e /api/debug/*: disattivati salvo DEBUG_ENDPOINTS=1 (e solo con il token di un admin)
+    DEBUG_ENDPOINTS = os.environ.get('DEBUG_ENDPOINTS', '').lower() in ('1', 'true', 'yes')
+    # Metriche per richiesta (app/services/metrics.py): soglia di query per il warning nel log
+    REQUEST_QUERY_WARNING = int(os.environ.get('REQUEST_QUERY_WARNING', '30'))
+    # Prenotazioni (app/services/booking.py): durata massima, limita la query di sovrapposizione
+    BOOKING_MAX_DURATION_HOURS = int(os.environ.get('BOOKING_MAX_DURATION_HOURS', '12'))
+    # Indice in memoria della disponibilità (app/services/availability.py): giorni di appuntamenti caricati
+    AVAILABILITY_WINDOW_DAYS = int(os.environ.get('AVAILABILITY_WINDOW_DAYS', '60'))
+    # Cache delle liste operatori/clienti (app/services/directory.py): memory | redis | none
+    DIRECTORY_CACHE_BACKEND = os.environ.get('DIRECTORY_CACHE_BACKEND', 'memory')
+    DIRECTORY_CACHE_TTL = int(os.environ.get('DIRECTORY_CACHE_TTL', '60'))
+    # Entrambe le app in servizio: la cache deve essere condivisa (redis), altrimenti errore all'avvio
+    DIRECTORY_CACHE_SHARED = os.environ.get('DIRECTORY_CACHE_SHARED', '0') == '1'
+    REDIS_URL = os.environ.get('REDIS_URL')
+
+
+class ServerlessConfig(Config):
+    """
+    API serverless (api/index.py): la stessa factory crea l'app, ma senza
+    Flask-SQLAlchemy, blueprint e worker; rotte e servizi su pymysql sono
+    registrati da api/index.py.
+    """
+    SQLALCHEMY_ENABLED = False
+    OUTBOX_WORKER_ENABLED = False
+    # Domini del frontend, senza slash finale (es. altri alias Vercel in CORS_ORIGINS)
+    CORS_ORIGINS = [origin.strip() for origin in os.environ.get(
+        'CORS_ORIGINS', 'http://localhost:3000,https://clientappo.vercel.app').split(',')]
+    CORS_METHODS = ["GET", "HEAD", "POST", "OPTIONS", "PUT", "PATCH", "DELETE"]
+    CORS_ALLOW_HEADERS = "*"
+    CORS_SUPPORTS_CREDENTIALS = True
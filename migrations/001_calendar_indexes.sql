@@ -0,0 +1,8 @@
+-- Indici compositi per il calendario a finestre (/api/calendar/<user_id>).
+-- Le query filtrano per operatore o cliente e ordinano per (start_time, id):
+-- con questi indici MySQL legge solo la finestra richiesta.
+
+CREATE INDEX ix_appointments_operator_start ON appointments (operator_id, start_time);
+CREATE INDEX ix_appointments_client_start ON appointments (client_id, start_time);
+CREATE INDEX ix_appointments_start ON appointments (start_time);
+CREATE INDEX ix_slots_operator_day ON slots (operator_id, day_of_week, start_time);
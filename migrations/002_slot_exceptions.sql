@@ -0,0 +1,19 @@
+-- Eccezioni alle ricorrenze settimanali degli slot (vedi api/slot_expansion.py):
+--   slot_id valorizzato          => singola occorrenza annullata
+--   solo operator_id valorizzato => giorno di chiusura dell'operatore
+--   solo admin_id valorizzato    => festività dello studio
+--   nessuno dei tre              => festività per tutti
+
+CREATE TABLE slot_exceptions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    admin_id INT NULL,
+    operator_id INT NULL,
+    slot_id INT NULL,
+    exception_date DATE NOT NULL,
+    reason VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_slot_exceptions_date (exception_date),
+    CONSTRAINT fk_slot_exceptions_admin FOREIGN KEY (admin_id) REFERENCES users (id) ON DELETE CASCADE,
+    CONSTRAINT fk_slot_exceptions_operator FOREIGN KEY (operator_id) REFERENCES users (id) ON DELETE CASCADE,
+    CONSTRAINT fk_slot_exceptions_slot FOREIGN KEY (slot_id) REFERENCES slots (id) ON DELETE CASCADE
+);
@@ -0,0 +1,18 @@
+-- Statistiche materializzate degli appuntamenti per (operatore, stato).
+-- Opzionale: usata solo con MATERIALIZED_STATS=True (vedi app/services/stats.py).
+
+CREATE TABLE appointment_stats (
+    operator_id INT NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (operator_id, status),
+    CONSTRAINT fk_appointment_stats_operator FOREIGN KEY (operator_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+-- Popolamento iniziale
+INSERT INTO appointment_stats (operator_id, status, count)
+SELECT operator_id, status, COUNT(*)
+FROM appointments
+GROUP BY operator_id, status;
+
+CREATE INDEX ix_users_admin_role ON users (admin_id, role);
@@ -0,0 +1,17 @@
+-- Outbox dei messaggi WhatsApp (vedi app/services/outbox.py).
+
+CREATE TABLE notification_outbox (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    channel VARCHAR(20) NOT NULL DEFAULT 'whatsapp',
+    to_number VARCHAR(20) NOT NULL,
+    message TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at DATETIME NULL,
+    last_error TEXT NULL,
+    provider_id VARCHAR(64) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    INDEX ix_outbox_status_next (status, next_attempt_at)
+);
@@ -0,0 +1,24 @@
+-- Broadcast WhatsApp a blocchi, riprendibili dopo un crash (vedi app/services/broadcast.py).
+
+CREATE TABLE broadcast_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    admin_id INT NOT NULL,
+    message TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    total_recipients INT NOT NULL DEFAULT 0,
+    enqueued_count INT NOT NULL DEFAULT 0,
+    last_recipient_id INT NOT NULL DEFAULT 0,
+    locked_at DATETIME NULL,
+    last_error TEXT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME NULL,
+    INDEX ix_broadcast_jobs_status (status),
+    CONSTRAINT fk_broadcast_jobs_admin FOREIGN KEY (admin_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+ALTER TABLE notification_outbox
+    ADD COLUMN broadcast_id INT NULL,
+    ADD COLUMN dedup_key VARCHAR(64) NULL,
+    ADD CONSTRAINT uq_outbox_dedup_key UNIQUE (dedup_key),
+    ADD INDEX ix_outbox_broadcast_status (broadcast_id, status),
+    ADD CONSTRAINT fk_outbox_broadcast FOREIGN KEY (broadcast_id) REFERENCES broadcast_jobs (id) ON DELETE SET NULL;
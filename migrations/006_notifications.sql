@@ -0,0 +1,14 @@
+-- Registro delle notifiche per appuntamento, usato per non inviare due volte
+-- lo stesso promemoria (vedi api/reminders.py).
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    appointment_id INT NOT NULL,
+    type VARCHAR(32) NOT NULL,
+    message TEXT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    CONSTRAINT uq_notifications_appointment_type UNIQUE (appointment_id, type),
+    CONSTRAINT fk_notifications_appointment FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE CASCADE
+);
@@ -0,0 +1,10 @@
+-- Token di accesso revocati (logout). Le righe possono essere cancellate
+-- dopo expires_at: a quel punto il token è comunque scaduto.
+
+CREATE TABLE revoked_tokens (
+    jti VARCHAR(32) PRIMARY KEY,
+    user_id INT NOT NULL,
+    expires_at DATETIME NOT NULL,
+    revoked_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_revoked_tokens_expires (expires_at)
+);
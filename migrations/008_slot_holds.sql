@@ -0,0 +1,17 @@
+-- Prenotazioni temporanee di un orario (vedi api/holds.py). Una hold è
+-- attiva finché expires_at > NOW(); le righe scadute vengono cancellate
+-- alla hold successiva dello stesso operatore.
+
+CREATE TABLE slot_holds (
+    id CHAR(32) PRIMARY KEY,
+    operator_id INT NOT NULL,
+    client_id INT NOT NULL,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_slot_holds_operator_start (operator_id, start_time),
+    INDEX ix_slot_holds_client_expires (client_id, expires_at),
+    CONSTRAINT fk_slot_holds_operator FOREIGN KEY (operator_id) REFERENCES users (id) ON DELETE CASCADE,
+    CONSTRAINT fk_slot_holds_client FOREIGN KEY (client_id) REFERENCES users (id) ON DELETE CASCADE
+);
@@ -0,0 +1,85 @@
+-- Versione dei dati di ogni tenant (admin), per ETag / Last-Modified e
+-- risposte 304 (vedi api/conditional.py). I trigger la incrementano a
+-- ogni scrittura su appointments, slots, slot_exceptions e users, nella
+-- stessa transazione della scrittura: vale per tutte le app e gli script
+-- che scrivono sul DB, senza codice in ogni rotta. TRUNCATE e le
+-- cancellazioni in cascata non attivano i trigger (la cancellazione
+-- dell'utente che le provoca sì).
+--
+-- Tenant: admin_id dell'operatore (o dell'utente); per gli admin e gli
+-- utenti senza admin il proprio id. Con il binary log attivo la creazione
+-- dei trigger può richiedere log_bin_trust_function_creators = 1.
+
+CREATE TABLE tenant_versions (
+    admin_id INT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME(6) NOT NULL
+);
+
+INSERT INTO tenant_versions (admin_id, version, updated_at)
+SELECT DISTINCT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users;
+
+-- Appuntamenti: tenant dell'operatore (prima e dopo, se cambia operatore)
+CREATE TRIGGER trg_appointments_version_insert AFTER INSERT ON appointments FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users WHERE id = NEW.operator_id
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_appointments_version_update AFTER UPDATE ON appointments FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users WHERE id IN (OLD.operator_id, NEW.operator_id)
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_appointments_version_delete AFTER DELETE ON appointments FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users WHERE id = OLD.operator_id
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+-- Slot: tenant dell'operatore
+CREATE TRIGGER trg_slots_version_insert AFTER INSERT ON slots FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users WHERE id = NEW.operator_id
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_slots_version_update AFTER UPDATE ON slots FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users WHERE id IN (OLD.operator_id, NEW.operator_id)
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_slots_version_delete AFTER DELETE ON slots FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT COALESCE(admin_id, id), 1, UTC_TIMESTAMP(6) FROM users WHERE id = OLD.operator_id
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+-- Eccezioni degli slot (cambiano le occorrenze nel calendario): admin della riga, se c'è
+CREATE TRIGGER trg_slot_exceptions_version_insert AFTER INSERT ON slot_exceptions FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT NEW.admin_id, 1, UTC_TIMESTAMP(6) FROM DUAL WHERE NEW.admin_id IS NOT NULL
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_slot_exceptions_version_update AFTER UPDATE ON slot_exceptions FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT id, 1, UTC_TIMESTAMP(6) FROM users WHERE id IN (OLD.admin_id, NEW.admin_id)
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_slot_exceptions_version_delete AFTER DELETE ON slot_exceptions FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    SELECT OLD.admin_id, 1, UTC_TIMESTAMP(6) FROM DUAL WHERE OLD.admin_id IS NOT NULL
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+-- Utenti (liste operatori/clienti, nomi nel calendario)
+CREATE TRIGGER trg_users_version_insert AFTER INSERT ON users FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    VALUES (COALESCE(NEW.admin_id, NEW.id), 1, UTC_TIMESTAMP(6))
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_users_version_update AFTER UPDATE ON users FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    VALUES (COALESCE(OLD.admin_id, OLD.id), 1, UTC_TIMESTAMP(6)),
+           (COALESCE(NEW.admin_id, NEW.id), 1, UTC_TIMESTAMP(6))
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
+
+CREATE TRIGGER trg_users_version_delete AFTER DELETE ON users FOR EACH ROW
+    INSERT INTO tenant_versions (admin_id, version, updated_at)
+    VALUES (COALESCE(OLD.admin_id, OLD.id), 1, UTC_TIMESTAMP(6))
+    ON DUPLICATE KEY UPDATE version = tenant_versions.version + 1, updated_at = UTC_TIMESTAMP(6);
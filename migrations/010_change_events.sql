@@ -0,0 +1,13 @@
+-- Eventi di modifica di appuntamenti e slot, per il push verso i client
+-- (SSE / long-poll, vedi api/change_events.py). Ogni riga viene scritta
+-- nella transazione della modifica; le righe più vecchie di
+-- CHANGE_EVENTS_RETENTION secondi vengono cancellate dal lettore.
+
+CREATE TABLE change_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    type VARCHAR(40) NOT NULL,
+    channels VARCHAR(255) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_change_events_created (created_at)
+);
@@ -0,0 +1,35 @@
+-- appointment_stats (migrations/003) aggiornata da trigger su appointments,
+-- nella stessa transazione della scrittura: vale per l'ORM dell'app e per
+-- le scritture pymysql di api/ (prenotazioni, conferma delle hold, modifica
+-- e cancellazione degli appuntamenti, import massivo), come i trigger di
+-- migrations/009. I DELETE massivi attivano i trigger riga per riga; le
+-- cancellazioni in cascata no, ma la cancellazione dell'operatore elimina
+-- anche le sue righe di appointment_stats (FOREIGN KEY ... ON DELETE CASCADE).
+
+-- Riallineamento: i conteggi tenuti dall'applicazione possono essere incompleti
+DELETE FROM appointment_stats;
+
+INSERT INTO appointment_stats (operator_id, status, count)
+SELECT operator_id, status, COUNT(*)
+FROM appointments
+GROUP BY operator_id, status;
+
+CREATE TRIGGER trg_appointments_stats_insert AFTER INSERT ON appointments FOR EACH ROW
+    INSERT INTO appointment_stats (operator_id, status, count)
+    VALUES (NEW.operator_id, NEW.status, 1)
+    ON DUPLICATE KEY UPDATE count = appointment_stats.count + 1;
+
+-- Cambio di stato o di operatore: -1 sulla coppia vecchia, +1 sulla nuova
+CREATE TRIGGER trg_appointments_stats_update AFTER UPDATE ON appointments FOR EACH ROW
+    INSERT INTO appointment_stats (operator_id, status, count)
+    SELECT operator_id, status, delta FROM (
+        SELECT OLD.operator_id AS operator_id, OLD.status AS status, -1 AS delta
+        UNION ALL
+        SELECT NEW.operator_id, NEW.status, 1
+    ) AS changes
+    WHERE NOT (OLD.operator_id <=> NEW.operator_id AND OLD.status <=> NEW.status)
+    ON DUPLICATE KEY UPDATE count = appointment_stats.count + VALUES(count);
+
+CREATE TRIGGER trg_appointments_stats_delete AFTER DELETE ON appointments FOR EACH ROW
+    UPDATE appointment_stats SET count = count - 1
+    WHERE operator_id = OLD.operator_id AND status = OLD.status;
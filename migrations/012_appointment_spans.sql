@@ -0,0 +1,37 @@
+-- Durata massima degli appuntamenti per operatore (vedi api/booking.py).
+-- BookingEngine.find_conflict cerca le sovrapposizioni solo tra gli
+-- appuntamenti iniziati da al massimo questa durata (e almeno
+-- BOOKING_MAX_DURATION_HOURS) prima del nuovo intervallo: così anche gli
+-- appuntamenti più lunghi del limite (righe storiche, riattivazioni)
+-- vengono trovati, senza rinunciare alla ricerca limitata sull'indice
+-- (operator_id, start_time). Il valore viene solo aumentato dai trigger
+-- (una cancellazione lo lascia com'è): è un limite superiore, mai troppo corto.
+
+CREATE TABLE appointment_spans (
+    operator_id INT NOT NULL PRIMARY KEY,
+    max_minutes INT NOT NULL DEFAULT 0,
+    CONSTRAINT fk_appointment_spans_operator FOREIGN KEY (operator_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+-- Popolamento iniziale
+INSERT INTO appointment_spans (operator_id, max_minutes)
+SELECT operator_id, MAX(CEIL(TIMESTAMPDIFF(SECOND, start_time, end_time) / 60))
+FROM appointments
+WHERE operator_id IS NOT NULL
+GROUP BY operator_id;
+
+CREATE TRIGGER trg_appointments_span_insert AFTER INSERT ON appointments FOR EACH ROW
+    INSERT INTO appointment_spans (operator_id, max_minutes)
+    SELECT NEW.operator_id, CEIL(TIMESTAMPDIFF(SECOND, NEW.start_time, NEW.end_time) / 60)
+    FROM DUAL
+    WHERE NEW.operator_id IS NOT NULL
+    ON DUPLICATE KEY UPDATE max_minutes = GREATEST(appointment_spans.max_minutes, VALUES(max_minutes));
+
+CREATE TRIGGER trg_appointments_span_update AFTER UPDATE ON appointments FOR EACH ROW
+    INSERT INTO appointment_spans (operator_id, max_minutes)
+    SELECT NEW.operator_id, CEIL(TIMESTAMPDIFF(SECOND, NEW.start_time, NEW.end_time) / 60)
+    FROM DUAL
+    WHERE NEW.operator_id IS NOT NULL
+      AND NOT (OLD.operator_id <=> NEW.operator_id AND OLD.start_time <=> NEW.start_time
+               AND OLD.end_time <=> NEW.end_time)
+    ON DUPLICATE KEY UPDATE max_minutes = GREATEST(appointment_spans.max_minutes, VALUES(max_minutes));
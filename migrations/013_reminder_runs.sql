@@ -0,0 +1,11 @@
+-- Ultimo giro dello scheduler dei promemoria (vedi api/reminders.py). Ogni
+-- giro blocca la riga (SELECT ... FOR UPDATE), invia i promemoria dovuti
+-- da last_run e la aggiorna nella stessa transazione: lo stato non vive
+-- nelle istanze serverless, che possono essere riciclate in ogni momento.
+
+CREATE TABLE reminder_runs (
+    name VARCHAR(32) NOT NULL PRIMARY KEY,
+    last_run DATETIME NOT NULL
+);
+
+INSERT INTO reminder_runs (name, last_run) VALUES ('reminders', NOW());
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Come api/index.py: i moduli di api/ si importano tra loro per nome (es. calendar_queries)
+for path in (ROOT, os.path.join(ROOT, "api")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
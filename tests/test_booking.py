@@ -0,0 +1,81 @@
+"""
+BookingEngine: la durata massima vale solo per gli orari nuovi, non per
+i cambi di stato di appuntamenti già salvati; gli appuntamenti più
+lunghi del limite restano visibili alla ricerca delle sovrapposizioni.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from booking import BookingEngine, BookingError
+
+START = datetime(2025, 3, 3, 8)
+LONG = {"id": 1, "operator_id": 10, "start_time": START, "end_time": START + timedelta(hours=30),
+        "status": "cancelled"}
+
+
+class BookingCursor:
+    """
+    Cursore finto per lock_operator / find_conflict: applica ai dati in
+    memoria gli stessi filtri della query (operatore, intervallo, limite
+    inferiore su start_time, stato, esclusione).
+    """
+
+    def __init__(self, appointments=(), spans=None):
+        self.appointments = list(appointments)
+        self.spans = spans or {}
+        self.queries = []
+        self._row = None
+
+    def execute(self, sql, params=()):
+        self.queries.append(sql)
+        if "FOR UPDATE" in sql:
+            self._row = {"id": params[0], "admin_id": 1}
+        elif "FROM appointment_spans" in sql:
+            minutes = [self.spans[i] for i in params if i in self.spans]
+            self._row = {"max_minutes": max(minutes) if minutes else None}
+        elif "UNION ALL" in sql:
+            operator_id, end, lower, start = params[:4]
+            exclude = params[4] if "id <>" in sql else None
+            self._row = next(({"kind": "appointment", "id": a["id"]} for a in self.appointments
+                              if a["operator_id"] == operator_id and lower < a["start_time"] < end
+                              and a["end_time"] > start and a["status"] != "cancelled"
+                              and a["id"] != exclude), None)
+        else:
+            raise AssertionError(f"Query inattesa: {sql}")
+
+    def fetchone(self):
+        return self._row
+
+
+def test_status_change_keeps_long_appointment():
+    engine = BookingEngine(max_duration=timedelta(hours=12))
+    cursor = BookingCursor()
+    start, end = engine.check_reschedule(cursor, {**LONG, "status": "pending"}, status="confirmed")
+    assert (start, end) == (LONG["start_time"], LONG["end_time"])
+    assert cursor.queries == []
+
+
+def test_reactivation_checks_conflicts_without_duration_limit():
+    engine = BookingEngine(max_duration=timedelta(hours=12))
+    cursor = BookingCursor()
+    assert engine.check_reschedule(cursor, LONG, status="pending") == (LONG["start_time"], LONG["end_time"])
+    assert len(cursor.queries) == 3
+
+
+def test_moving_still_enforces_max_duration():
+    engine = BookingEngine(max_duration=timedelta(hours=12))
+    with pytest.raises(BookingError):
+        engine.check_reschedule(BookingCursor(), LONG, end=(START + timedelta(hours=31)).isoformat())
+
+
+def test_booking_overlapping_the_tail_of_a_long_appointment_conflicts():
+    engine = BookingEngine(max_duration=timedelta(hours=12))
+    # Appuntamento di 30 ore (riattivato o storico): la durata è in appointment_spans
+    cursor = BookingCursor([{**LONG, "status": "pending"}], spans={10: 30 * 60})
+    tail = (START + timedelta(hours=26), START + timedelta(hours=27))
+
+    assert engine.find_conflict(cursor, 10, *tail) == ("appointment", 1)
+    assert engine.find_conflict(cursor, 10, START + timedelta(hours=30), START + timedelta(hours=31)) is None
+    # Senza la durata registrata la ricerca limitata a max_duration non lo vedrebbe
+    assert engine.find_conflict(BookingCursor([{**LONG, "status": "pending"}]), 10, *tail) is None
@@ -0,0 +1,138 @@
+"""
+Import massivo: gli appuntamenti si inseriscono sotto il lock
+dell'operatore e scartano ciò che nel frattempo è stato prenotato o
+trattenuto; le password usano l'hasher condiviso.
+"""
+from datetime import datetime
+
+import pytest
+
+import bulk_import
+from booking import BookingEngine
+from passwords import PasswordHasher
+
+DAY = datetime(2025, 3, 3)
+
+
+class FakeCursor:
+    """Cursore finto: 'busy' = {(operator_id, start_time): ('appointment' | 'hold', id)}."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.conn.log.append(sql.split()[0] + (" FOR UPDATE" if "FOR UPDATE" in sql else ""))
+        if "FOR UPDATE" in sql:
+            self._row = {"id": params[0], "admin_id": 1} if params[0] in self.conn.operators else None
+        elif "FROM appointment_spans" in sql:
+            self._row = None
+        elif "UNION ALL" in sql:
+            operator_id, start = params[0], params[3]
+            kind_id = self.conn.busy.get((operator_id, start))
+            self._row = {"kind": kind_id[0], "id": kind_id[1]} if kind_id else None
+        else:
+            raise AssertionError(f"Query inattesa: {sql}")
+
+    def executemany(self, sql, params):
+        self.conn.log.append("INSERT")
+        self.conn.pending.extend(params)
+
+    def fetchone(self):
+        return self._row
+
+
+class FakeConnection:
+    def __init__(self, operators, busy=None):
+        self.operators = operators
+        self.busy = busy or {}
+        self.log = []
+        self.pending = []
+        self.inserted = []
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.inserted.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+def appointment(operator_id, hour, status="pending"):
+    return {"operator_id": operator_id, "client_id": 100,
+            "start_time": DAY.replace(hour=hour), "end_time": DAY.replace(hour=hour + 1),
+            "service_type": "", "status": status}
+
+
+def test_appointments_are_inserted_under_the_operator_lock():
+    conn = FakeConnection(operators={10, 11}, busy={
+        (10, DAY.replace(hour=9)): ("appointment", 7),
+        (11, DAY.replace(hour=14)): ("hold", None),
+    })
+    engine = BookingEngine()
+    items = [(2, appointment(10, 9)), (3, appointment(10, 11)),
+             (4, appointment(11, 14)), (5, appointment(11, 14, status="cancelled"))]
+
+    failed = bulk_import._insert_appointments(conn, engine, items, chunk_size=500)
+
+    assert set(failed) == {2, 4}
+    assert "appuntamento" in failed[2] and "temporaneamente" in failed[4]
+    assert [row[2] for row in conn.inserted] == [DAY.replace(hour=11), DAY.replace(hour=14)]
+    assert engine.conflicts == 2
+    # Per ogni operatore il lock precede controlli e INSERT
+    assert conn.log == ["SELECT FOR UPDATE", "SELECT", "(SELECT", "SELECT", "(SELECT", "INSERT",
+                        "SELECT FOR UPDATE", "SELECT", "(SELECT", "INSERT"]
+
+
+def test_unknown_operator_rows_fail():
+    conn = FakeConnection(operators=set())
+    failed = bulk_import._insert_appointments(conn, BookingEngine(), [(2, appointment(10, 9))], 500)
+    assert failed == {2: "Operatore non valido"}
+    assert conn.inserted == []
+
+
+@pytest.fixture
+def inline_hasher(monkeypatch):
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000")
+    hasher._inline = True
+    monkeypatch.setattr(bulk_import, "get_hasher", lambda: hasher)
+    return hasher
+
+
+def test_hash_passwords_uses_the_shared_hasher(inline_hasher):
+    hashes = bulk_import.hash_passwords(["a", "b", "c"])
+    assert len(hashes) == 3
+    assert all(inline_hasher.verify(h, p) for h, p in zip(hashes, "abc"))
+    assert inline_hasher.metrics()["hash"] == 3
+
+
+class LookupCursor:
+    """Cursore per validate_appointments: un operatore e un cliente dell'admin, nessun appuntamento."""
+
+    def execute(self, sql, params=()):
+        self._rows = ([{"id": 10, "username": "op", "role": "operator"},
+                       {"id": 100, "username": "cli", "role": "client"}]
+                      if "FROM users" in sql else [])
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_validation_enforces_max_duration():
+    rows = [(2, {"operator_id": "10", "client_id": "100",
+                 "start_time": "2025-03-03 08:00", "end_time": "2025-03-04 09:00"}),
+            (3, {"operator": "op", "client": "cli",
+                 "start_time": "2025-03-05 08:00", "end_time": "2025-03-05 09:00"})]
+    validated = bulk_import.validate_appointments(LookupCursor(), rows, 1, BookingEngine().max_duration)
+    errors = {line: errors for line, _, errors in validated}
+    assert errors[3] == []
+    assert errors[2] == ["Durata massima di un appuntamento: 12:00:00"]
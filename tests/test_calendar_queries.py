@@ -0,0 +1,84 @@
+"""
+Numero di query di build_calendar_events: costante per ogni ruolo,
+qualunque sia il numero di slot e appuntamenti (niente N+1).
+"""
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from calendar_queries import build_calendar_events, encode_cursor
+from slot_expansion import slot_expander
+
+WINDOW = (datetime(2025, 1, 6), datetime(2025, 2, 3))
+
+
+class CountingCursor:
+    """DictCursor finto: risponde in base alla tabella letta e conta le execute()."""
+
+    def __init__(self, role, rows):
+        self.role = role
+        self.rows = rows
+        self.queries = []
+        self._result = []
+
+    def execute(self, sql, params=()):
+        self.queries.append(sql)
+        if "FROM users WHERE id" in sql:
+            self._result = [{"role": self.role}] if self.role else []
+        elif "FROM slots" in sql:
+            self._result = [{
+                "id": i, "operator_id": 10 + i % 5, "day_of_week": i % 7,
+                "start_time": timedelta(hours=9), "end_time": timedelta(hours=10),
+                "status": "approved", "operator_name": f"op{i % 5}", "admin_id": 1,
+            } for i in range(1, self.rows + 1)]
+        elif "FROM slot_exceptions" in sql:
+            self._result = []
+        elif "FROM appointments" in sql:
+            self._result = [{
+                "id": i, "client_id": 100 + i % 7, "operator_id": 10 + i % 5,
+                "start_time": datetime.combine(WINDOW[0].date() + timedelta(days=i % 28), time(11)),
+                "end_time": datetime.combine(WINDOW[0].date() + timedelta(days=i % 28), time(12)),
+                "service_type": "", "status": "pending",
+                "client_name": f"c{i % 7}", "operator_name": f"op{i % 5}",
+            } for i in range(1, self.rows + 1)]
+        else:
+            raise AssertionError(f"Query inattesa: {sql}")
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return list(self._result)
+
+
+def count_queries(role, rows, **kwargs):
+    slot_expander.clear()
+    cursor = CountingCursor(role, rows)
+    events, _ = build_calendar_events(cursor, 1, **kwargs)
+    assert len(events) >= rows
+    return len(cursor.queries)
+
+
+@pytest.mark.parametrize("role", ["admin", "operator", "client"])
+@pytest.mark.parametrize("window", [WINDOW, (None, None)], ids=["window", "no-window"])
+def test_query_count_does_not_grow_with_rows(role, window):
+    start, end = window
+    counts = {rows: count_queries(role, rows, start=start, end=end) for rows in (1, 20, 500)}
+    # ruolo + slot + eccezioni + appuntamenti
+    assert set(counts.values()) == {4}, counts
+
+
+@pytest.mark.parametrize("role", ["admin", "operator", "client"])
+def test_next_pages_skip_slots(role):
+    page = encode_cursor({"start_time": WINDOW[0], "id": 1})
+    for rows in (1, 500):
+        cursor = CountingCursor(role, rows)
+        build_calendar_events(cursor, 1, start=WINDOW[0], end=WINDOW[1], page_cursor=page, limit=rows)
+        # ruolo + appuntamenti
+        assert len(cursor.queries) == 2
+
+
+def test_unknown_user_is_one_query():
+    cursor = CountingCursor(None, 10)
+    assert build_calendar_events(cursor, 999) is None
+    assert len(cursor.queries) == 1
@@ -0,0 +1,39 @@
+"""
+Cache anagrafiche: un'invalidazione arrivata durante il caricamento non
+viene sovrascritta dal valore vecchio, e le due app vedono le
+invalidazioni l'una dell'altra sullo stesso backend.
+"""
+import pytest
+
+from directory_cache import DirectoryCache, MemoryBackend, make_backend
+
+
+def test_invalidate_during_load_is_not_overwritten():
+    cache = DirectoryCache(MemoryBackend())
+
+    def stale_loader():
+        # Una scrittura (e la sua invalidazione) arriva mentre si legge dal DB
+        cache.invalidate(1, "operators")
+        return ["vecchio"]
+
+    assert cache.get_or_load(1, "operators", stale_loader) == ["vecchio"]
+    assert cache.get_or_load(1, "operators", lambda: ["nuovo"]) == ["nuovo"]
+    assert cache.get_or_load(1, "operators", lambda: ["altro"]) == ["nuovo"]
+
+
+def test_invalidate_reaches_the_other_view():
+    backend = MemoryBackend()
+    api, app = DirectoryCache(backend, view="api"), DirectoryCache(backend, view="app")
+    api.get_or_load(1, "clients", lambda: ["a"])
+    app.get_or_load(1, "clients", lambda: ["a"])
+
+    app.invalidate(1, "clients")
+
+    assert api.get_or_load(1, "clients", lambda: ["b"]) == ["b"]
+    assert api.get_or_load(2, "clients", lambda: ["x"]) == ["x"]
+
+
+def test_shared_deployment_requires_redis():
+    with pytest.raises(RuntimeError):
+        make_backend("memory", shared=True)
+    assert make_backend("none", shared=True).get("k") is None
@@ -0,0 +1,44 @@
+"""
+/api/admin/export/<kind>: solo con il token di un admin e solo per il
+suo tenant (niente export anonimi o di altri studi).
+"""
+import pytest
+
+import exports
+import index
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Nessun DB: le revoche non vengono lette
+    monkeypatch.setattr(index.token_service, "is_revoked", None)
+    return index.app.test_client()
+
+
+def auth(user_id, role, tenant_id):
+    return {"Authorization": f"Bearer {index.token_service.issue(user_id, role, tenant_id)}"}
+
+
+def test_anonymous_export_is_rejected(client):
+    assert client.get("/api/admin/export/appointments").status_code == 401
+    assert client.get("/api/admin/export/slots?admin_id=1").status_code == 401
+
+
+def test_cross_tenant_export_is_rejected(client):
+    response = client.get("/api/admin/export/appointments?admin_id=2", headers=auth(1, "admin", 1))
+    assert response.status_code == 403
+    response = client.get("/api/admin/export/appointments", headers=auth(5, "operator", 1))
+    assert response.status_code == 403
+
+
+def test_export_uses_the_token_tenant(client, monkeypatch):
+    seen = {}
+
+    def fake_query(kind, **filters):
+        seen.update(filters)
+        raise ValueError("stop")
+
+    monkeypatch.setattr(exports, "build_export_query", fake_query)
+    response = client.get("/api/admin/export/slots", headers=auth(1, "admin", 1))
+    assert response.status_code == 400
+    assert seen["admin_id"] == 1
@@ -0,0 +1,70 @@
+"""
+find_openings: gli appuntamenti iniziati prima della finestra occupano
+l'operatore fin dove arriva la durata massima delle prenotazioni (o
+l'appuntamento più lungo registrato), non un limite fisso.
+"""
+from datetime import datetime, timedelta
+
+from booking import BookingEngine
+from free_time import find_openings
+from slot_expansion import slot_expander
+
+MONDAY = datetime(2025, 3, 3)
+
+
+class OpeningsCursor:
+    """Cursore finto: uno slot il lunedì 9-17 e gli appuntamenti indicati, filtrati come nella query."""
+
+    def __init__(self, appointments, spans=None):
+        self.appointments = appointments
+        self.spans = spans or {}
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        if "FROM slots" in sql:
+            self._rows = [{"id": 1, "operator_id": 10, "day_of_week": 0,
+                           "start_time": timedelta(hours=9), "end_time": timedelta(hours=17),
+                           "status": "approved", "operator_name": "op", "admin_id": 1,
+                           "tenant_version": 1}]
+        elif "FROM slot_exceptions" in sql:
+            self._rows = []
+        elif "FROM appointment_spans" in sql:
+            minutes = [self.spans[i] for i in params if i in self.spans]
+            self._rows = [{"max_minutes": max(minutes) if minutes else None}]
+        elif "FROM appointments" in sql:
+            lower, end, start = params[1:4]
+            self._rows = [{"operator_id": 10, "start_time": s, "end_time": e}
+                          for s, e in self.appointments if lower <= s < end and e > start]
+        else:
+            raise AssertionError(f"Query inattesa: {sql}")
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+def first_opening(cursor, engine):
+    slot_expander.clear()
+    openings = find_openings(cursor, MONDAY.replace(hour=9), MONDAY.replace(hour=17),
+                             timedelta(hours=1), limit=1, booking_engine=engine)
+    return openings[0]["start_time"]
+
+
+def test_long_appointment_before_the_window_is_busy():
+    # Dalla domenica alle 20 al lunedì alle 12: 16 ore, oltre il limite di 12
+    long_appointment = (MONDAY - timedelta(hours=4), MONDAY.replace(hour=12))
+    engine = BookingEngine(max_duration=timedelta(hours=12))
+
+    cursor = OpeningsCursor([long_appointment], spans={10: 16 * 60})
+    assert first_opening(cursor, engine) == MONDAY.replace(hour=12).isoformat()
+
+
+def test_lookback_follows_the_booking_limit():
+    long_appointment = (MONDAY - timedelta(hours=4), MONDAY.replace(hour=12))
+    # Nessuna durata registrata: vale BOOKING_MAX_DURATION_HOURS del motore
+    assert first_opening(OpeningsCursor([long_appointment]),
+                         BookingEngine(max_duration=timedelta(hours=24))) == MONDAY.replace(hour=12).isoformat()
+    assert first_opening(OpeningsCursor([long_appointment]),
+                         BookingEngine(max_duration=timedelta(hours=12))) == MONDAY.replace(hour=9).isoformat()
@@ -0,0 +1,79 @@
+"""
+Budget del tempo di import (cold start).
+
+Importa l'entry point in un interprete nuovo con `python -X importtime`,
+più volte, e confronta la mediana del tempo totale di import con il
+budget: il test fallisce se il budget è superato, con l'elenco dei
+moduli di primo livello più pesanti.
+
+    python -m pytest tests/test_import_budget.py
+    IMPORT_BUDGET_RUNS=7 python -m pytest tests/test_import_budget.py -k api
+
+Target:
+  api  l'entry point serverless (api/index.py), come lo carica Vercel
+  app  create_app() dell'app Flask-SQLAlchemy, senza worker in background
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(os.environ.get("IMPORT_BUDGET_RUNS", "5"))
+SHOW = 8
+
+TARGETS = {
+    "api": {
+        "cwd": os.path.join(ROOT, "api"),
+        "code": "import index",
+        "budget_ms": 300,
+    },
+    "app": {
+        "cwd": ROOT,
+        "code": "from app import create_app; create_app()",
+        "budget_ms": 900,
+    },
+}
+
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(target):
+    """Una misura: (totale in ms, {modulo di primo livello: ms cumulativi})."""
+    env = dict(os.environ, OUTBOX_WORKER_ENABLED="0", PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", target["code"]],
+        cwd=target["cwd"], env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        # Un solo spazio di rientro = import di primo livello (esclusi quelli di site)
+        if match and len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2)) / 1000
+    top_level.pop("site", None)
+    return sum(top_level.values()), top_level
+
+
+@pytest.mark.parametrize("name", sorted(TARGETS))
+def test_import_budget(name):
+    target = TARGETS[name]
+    budget_ms = float(os.environ.get(f"IMPORT_BUDGET_{name.upper()}_MS", target["budget_ms"]))
+    totals = []
+    modules = {}
+    for _ in range(RUNS):
+        total, top_level = measure(target)
+        totals.append(total)
+        for module, ms in top_level.items():
+            modules.setdefault(module, []).append(ms)
+    median = statistics.median(totals)
+    heaviest = sorted(((statistics.median(v), m) for m, v in modules.items()), reverse=True)
+    report = "\n".join(f"    {ms:8.1f} ms  {module}" for ms, module in heaviest[:SHOW])
+    assert median <= budget_ms, (
+        f"[{name}] import mediano {median:.1f} ms (min {min(totals):.1f}, max {max(totals):.1f}) "
+        f"su {RUNS} esecuzioni, budget {budget_ms:.0f} ms superato:\n{report}")
@@ -0,0 +1,33 @@
+"""
+LoginThrottle: un tentativo rifiutato (per IP o per username) non consuma
+la quota dell'altro limite.
+"""
+import pytest
+
+from rate_limit import LocalSharedBackend, LoginThrottle, MemoryBackend
+
+
+@pytest.fixture(params=[MemoryBackend, LocalSharedBackend])
+def throttle(request):
+    return LoginThrottle(request.param(), ip_limit=5, ip_window=60, user_limit=2, user_window=300)
+
+
+def test_username_rejections_do_not_use_ip_quota(throttle):
+    assert throttle.check("mario", "1.2.3.4") == 0
+    assert throttle.check("mario", "1.2.3.4") == 0
+    # Username bloccato: questi tentativi non devono contare per l'IP
+    for _ in range(10):
+        assert throttle.check("mario", "1.2.3.4") > 0
+    # L'IP ha ancora 3 tentativi su 5 per gli altri username
+    assert [throttle.check(name, "1.2.3.4") for name in ("a", "b", "c", "d")][:3] == [0, 0, 0]
+    assert throttle.stats()["rejected"] == 11
+
+
+def test_ip_rejections_do_not_use_username_quota(throttle):
+    for name in "abcde":
+        assert throttle.check(name, "1.2.3.4") == 0
+    assert throttle.check("mario", "1.2.3.4") > 0
+    # Da un altro IP lo username ha ancora tutta la sua quota
+    assert throttle.check("mario", "5.6.7.8") == 0
+    assert throttle.check("mario", "5.6.7.8") == 0
+    assert throttle.check("mario", "5.6.7.8") > 0
@@ -0,0 +1,142 @@
+"""
+Scheduler dei promemoria senza stato in memoria: l'ultimo giro è nel DB,
+quindi un'istanza nuova riprende da dove si era fermata un'altra, un
+invio fallito viene ritentato al giro dopo e non ci sono doppi invii.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from reminders import ReminderScheduler
+
+DAY = datetime(2025, 3, 3)
+
+
+class FakeDatabase:
+    """Tabelle minime (appuntamenti, notifications, outbox, reminder_runs) con commit e rollback."""
+
+    def __init__(self, last_run):
+        self.appointments = {}
+        self.notifications = set()
+        self.outbox = {}
+        self.last_run = last_run
+        self.fail_outbox = False
+
+    def add_appointment(self, appointment_id, start_time, phone="+39000", status="pending"):
+        self.appointments[appointment_id] = {"id": appointment_id, "start_time": start_time,
+                                             "phone": phone, "status": status}
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.staged = []
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def commit(self):
+        for apply in self.staged:
+            apply()
+        self.staged = []
+
+    def rollback(self):
+        self.staged = []
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.db = conn.db
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        if "FROM reminder_runs" in sql:
+            self._rows = [{"last_run": self.db.last_run}] if self.db.last_run else []
+        elif "FROM appointments a" in sql:
+            *bounds, now = params
+            ranges = list(zip(bounds[::2], bounds[1::2]))
+            self._rows = [{"id": a["id"], "start_time": a["start_time"], "phone": a["phone"]}
+                          for a in self.db.appointments.values()
+                          if any(low <= a["start_time"] < high for low, high in ranges)
+                          and a["start_time"] > now and a["status"] != "cancelled" and a["phone"]]
+        elif "FROM notifications" in sql:
+            self._rows = [{"appointment_id": a, "type": t} for a, t in self.db.notifications if a in params]
+        elif "INSERT INTO reminder_runs" in sql:
+            self.conn.staged.append(lambda: setattr(self.db, "last_run", max(self.db.last_run, params[1])))
+        else:
+            raise AssertionError(f"Query inattesa: {sql}")
+
+    def executemany(self, sql, rows):
+        if "notification_outbox" in sql:
+            if self.db.fail_outbox:
+                raise RuntimeError("outbox non disponibile")
+            self.conn.staged.append(lambda: self.db.outbox.update({row[4]: row[1] for row in rows}))
+        else:
+            self.conn.staged.append(lambda: self.db.notifications.update((row[0], row[1]) for row in rows))
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+def test_fresh_instance_resumes_from_the_last_run_in_the_db():
+    db = FakeDatabase(last_run=DAY.replace(hour=8))
+    db.add_appointment(1, DAY.replace(hour=12))   # promemoria 2h alle 10:00
+    db.add_appointment(2, DAY.replace(hour=9, minute=30) + timedelta(days=1))  # 24h alle 9:30
+
+    first, second = ReminderScheduler(), ReminderScheduler()
+    assert first.tick(db.connect(), now=DAY.replace(hour=9)) == 0
+    # Cron ogni due ore, su un'altra istanza appena avviata: nessun promemoria perso
+    assert second.tick(db.connect(), now=DAY.replace(hour=11)) == 2
+    assert first.tick(db.connect(), now=DAY.replace(hour=11, minute=5)) == 0
+
+    assert set(db.outbox) == {"reminder_120m:1", "reminder_1440m:2"}
+    assert db.last_run == DAY.replace(hour=11, minute=5)
+
+
+def test_failed_send_is_retried_on_the_next_tick():
+    db = FakeDatabase(last_run=DAY.replace(hour=9))
+    db.add_appointment(1, DAY.replace(hour=12))
+    scheduler = ReminderScheduler()
+
+    db.fail_outbox = True
+    with pytest.raises(RuntimeError):
+        scheduler.tick(db.connect(), now=DAY.replace(hour=10, minute=30))
+    assert db.last_run == DAY.replace(hour=9)
+    assert db.notifications == set() and db.outbox == {}
+
+    db.fail_outbox = False
+    assert scheduler.tick(db.connect(), now=DAY.replace(hour=10, minute=45)) == 1
+    assert set(db.outbox) == {"reminder_120m:1"}
+
+
+def test_appointment_is_read_at_send_time():
+    db = FakeDatabase(last_run=DAY.replace(hour=8))
+    db.add_appointment(1, DAY.replace(hour=12))
+    db.add_appointment(2, DAY.replace(hour=12), status="cancelled")
+    # Spostato dopo la creazione: il promemoria riporta l'orario nuovo
+    db.appointments[1]["start_time"] = DAY.replace(hour=11, minute=30)
+
+    assert ReminderScheduler().tick(db.connect(), now=DAY.replace(hour=10)) == 1
+    assert "11:30" in db.outbox["reminder_120m:1"]
+
+
+def test_late_booking_sends_the_nearest_reminder_immediately():
+    db = FakeDatabase(last_run=DAY.replace(hour=10))
+    scheduler = ReminderScheduler()
+    conn = db.connect()
+    assert scheduler.schedule(conn, 1, DAY.replace(hour=11), "+39000", now=DAY.replace(hour=10)) == 1
+    assert scheduler.schedule(conn, 2, DAY.replace(hour=18), "+39000", now=DAY.replace(hour=10)) == 0
+    assert set(db.outbox) == {"reminder_120m:1"}
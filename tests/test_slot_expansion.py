@@ -0,0 +1,42 @@
+"""Cache di SlotExpander: versione del tenant, scadenza e invalidazione."""
+from datetime import datetime, timedelta
+
+from slot_expansion import SlotExpander
+
+START, END = datetime(2025, 1, 6), datetime(2025, 1, 13)
+
+
+def slot(hour, version=1):
+    return {"id": 1, "operator_id": 10, "day_of_week": 0, "start_time": timedelta(hours=hour),
+            "end_time": timedelta(hours=hour + 1), "tenant_version": version}
+
+
+def first_start(expander, row):
+    return expander.occurrences([row], START, END)[0][1]
+
+
+def test_same_version_is_cached():
+    expander = SlotExpander()
+    assert first_start(expander, slot(9)) == datetime(2025, 1, 6, 9)
+    # Stessa versione: la voce in cache vale anche se la riga è cambiata (non dovrebbe)
+    assert first_start(expander, slot(15)) == datetime(2025, 1, 6, 9)
+    assert expander.stats()["hits"] == 1
+
+
+def test_new_tenant_version_recomputes():
+    expander = SlotExpander()
+    first_start(expander, slot(9, version=1))
+    assert first_start(expander, slot(15, version=2)) == datetime(2025, 1, 6, 15)
+
+
+def test_entries_expire():
+    expander = SlotExpander(ttl=0)
+    first_start(expander, slot(9))
+    assert first_start(expander, slot(15)) == datetime(2025, 1, 6, 15)
+
+
+def test_invalidate():
+    expander = SlotExpander()
+    first_start(expander, slot(9))
+    expander.invalidate(10)
+    assert first_start(expander, slot(15)) == datetime(2025, 1, 6, 15)